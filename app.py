@@ -1,20 +1,31 @@
+# Beginn dieses Skriptlaufs vor den schweren Imports, damit die Zeit bis zur ersten Anzeige
+# auch das Laden von Streamlit, pandas und numpy enthält (siehe benchmarks/cold_start.py)
+import time
+SCRIPT_STARTED = time.perf_counter()
+
 import streamlit as st
+from streamlit.logger import get_logger
 import pandas as pd
+import numpy as np
 import json
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
 import random
 from collections import defaultdict, Counter
 import sqlite3
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
 import io
+import codecs
+import gzip
+import zlib
+import base64
 import hashlib
 import uuid
-import holidays
+import bisect
+import queue
+import threading
+from concurrent.futures import Future
+
+logger = get_logger(__name__)
 
 # Seitenkonfiguration
 st.set_page_config(
@@ -24,21 +35,501 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Wochentage (Mo-Fr) und Kodierung der Wunsch-Ränge in der Kostenmatrix
+WEEKDAY_NAMES = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag']
+PRIORITY_KEYS = ['first', 'second', 'third', 'fourth', 'fifth', 'none']
+RANK_NONE = 5           # Wochentag ist nicht in den Präferenzen
+RANK_UNAVAILABLE = -1   # Maskierte Zelle: Urlaub oder Wochentag-Sperre
+
+UNAVAILABILITY_PAGE_SIZE = 50  # Einträge pro Seite in der Urlaubsliste
+
+# Datumsauswahl der Plan-Bearbeitung: sichtbares Fenster und maximale Treffer der Personensuche
+DATE_PICKER_WINDOW_WEEKS = 4
+DATE_PICKER_SEARCH_LIMIT = 25
+
+# Streaming-Import: Lesegröße, Zeilen pro Schreib-Batch, maximal angezeigte Fehlermeldungen
+IMPORT_CHUNK_SIZE = 64 * 1024
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_REPORTED_ERRORS = 100
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()  # Ordinal von datetime64[D] = 0
+
+# Muster für wiederkehrende Nichtverfügbarkeit (type='regel', JSON in unavailability.rule)
+UNAVAILABILITY_RULE_KINDS = {
+    'every_nth_week': "Jede n-te Woche an einem Wochentag",       # {"weekday", "interval", "anchor"}
+    'nth_weekday_of_month': "Bestimmter Wochentag im Monat",      # {"weekday", "nth"} (nth = -1: letzter)
+    'weekdays_in_range': "Wochentage in einem Zeitraum"           # {"weekdays", "start", "end"}
+}
+
+# Team-Snapshot: gzip-komprimiertes JSON-Lines (Kopfzeile + ein Spaltenblock je Zeile)
+TEAM_SNAPSHOT_FORMAT = 'schichtplaner-team'
+TEAM_SNAPSHOT_VERSION = 1
+SNAPSHOT_UNAVAILABILITY_COLUMNS = ['name', 'type', 'date', 'end_date', 'weekday', 'reason', 'rule']
+SNAPSHOT_LEDGER_COLUMNS = ['name', 'shifts', 'wish_first', 'wish_second', 'wish_third', 'wish_fourth', 'wish_fifth', 'wish_none']
+
+# Plan-Versionsverlauf: Delta je Speichern, vollständiger Plan als Checkpoint jede n-te Version
+SCHEDULE_CHECKPOINT_INTERVAL = 25
+SCHEDULE_HISTORY_LIST_LIMIT = 100
+
+# Online-Sicherungen der Datenbank (die ältesten werden über BACKUP_KEEP hinaus gelöscht)
+BACKUP_DIR = 'backups'
+BACKUP_KEEP = 10
+
+# Abstand (Sekunden) zwischen zwei Läufen des Session-Cleanups im Hintergrund
+SESSION_CLEANUP_INTERVAL = 3600
+
+# Kompakte Schichtplan-Darstellung
+class CompactSchedule:
+    """
+    Kompakter Schichtplan: Start-Ordinal plus int16-Array mit dem Mitarbeiter-Index
+    je Kalendertag (-1 = keine Schicht) und einer Namenstabelle.
+    
+    Bietet dict-kompatible Zugriffe im Format {'YYYY-MM-DD': 'Name'} für bestehenden Code,
+    intern werden Daten nur als Ordinalzahlen gehalten und nie geparst.
+    """
+    NO_SHIFT = -1
+    
+    def __init__(self, start_ordinal=0, assignments=None, names=None):
+        self.start_ordinal = int(start_ordinal)
+        self.assignments = np.asarray(assignments if assignments is not None else [], dtype=np.int16)
+        self.names = list(names) if names is not None else []
+        self._name_index = {name: i for i, name in enumerate(self.names)}
+    
+    @classmethod
+    def from_ordinals(cls, ordinals, employee_names):
+        """Erstellt einen Plan aus Tages-Ordinalen und den zugehörigen Namen"""
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        if len(ordinals) == 0:
+            return cls()
+        
+        names, codes = np.unique(np.asarray(employee_names, dtype=object), return_inverse=True)
+        start_ordinal = int(ordinals.min())
+        assignments = np.full(int(ordinals.max()) - start_ordinal + 1, cls.NO_SHIFT, dtype=np.int16)
+        assignments[ordinals - start_ordinal] = codes
+        return cls(start_ordinal, assignments, names.tolist())
+    
+    @classmethod
+    def from_rows(cls, rows):
+        """Erstellt einen Plan aus (date_str, employee_name)-Zeilen der Datenbank"""
+        if not rows:
+            return cls()
+        date_strs, employee_names = zip(*rows)
+        # Vektorisierte Umrechnung von ISO-Daten in Ordinale (kein strptime je Zeile)
+        ordinals = np.array(date_strs, dtype='datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+        return cls.from_ordinals(ordinals, employee_names)
+    
+    @classmethod
+    def from_blob(cls, start_ordinal, names_json, blob):
+        """Erstellt einen Plan aus der komprimierten Archiv-Darstellung (siehe to_blob)"""
+        assignments = np.frombuffer(zlib.decompress(blob), dtype='<i2').astype(np.int16)
+        return cls(start_ordinal, assignments, json.loads(names_json))
+    
+    @classmethod
+    def merge(cls, *schedules):
+        """Führt mehrere Pläne zusammen (bei gleichen Tagen gewinnt der spätere Plan)"""
+        schedules = [as_compact_schedule(schedule) for schedule in schedules if schedule]
+        if not schedules:
+            return cls()
+        ordinals = np.concatenate([schedule.ordinals() for schedule in schedules])
+        names = [name for schedule in schedules for name in schedule.values()]
+        # Letztes Vorkommen je Tag behalten
+        _, last_positions = np.unique(ordinals[::-1], return_index=True)
+        keep = len(ordinals) - 1 - last_positions
+        return cls.from_ordinals(ordinals[keep], [names[i] for i in keep])
+    
+    @classmethod
+    def from_dict(cls, schedule_data):
+        """Erstellt einen Plan aus einem Dictionary {'YYYY-MM-DD': 'Name'}"""
+        if isinstance(schedule_data, CompactSchedule):
+            return schedule_data.copy()
+        return cls.from_rows(list(schedule_data.items()))
+    
+    # Interne Hilfsfunktionen
+    def _to_ordinal(self, key):
+        if isinstance(key, str):
+            return date.fromisoformat(key).toordinal()
+        return key.toordinal()
+    
+    def _offset(self, key):
+        try:
+            return self._to_ordinal(key) - self.start_ordinal
+        except (ValueError, TypeError, AttributeError):
+            raise KeyError(key)
+    
+    def _name_code(self, employee):
+        if employee not in self._name_index:
+            self._name_index[employee] = len(self.names)
+            self.names.append(employee)
+        return self._name_index[employee]
+    
+    def _assigned_mask(self):
+        return self.assignments >= 0
+    
+    # Dict-kompatible Zugriffe
+    def __getitem__(self, key):
+        offset = self._offset(key)
+        if 0 <= offset < len(self.assignments) and self.assignments[offset] >= 0:
+            return self.names[self.assignments[offset]]
+        raise KeyError(key)
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def __contains__(self, key):
+        return self.get(key) is not None
+    
+    def __setitem__(self, key, employee):
+        ordinal = self._to_ordinal(key)
+        if len(self.assignments) == 0:
+            self.start_ordinal = ordinal
+            self.assignments = np.full(1, self.NO_SHIFT, dtype=np.int16)
+        elif ordinal < self.start_ordinal:
+            padding = np.full(self.start_ordinal - ordinal, self.NO_SHIFT, dtype=np.int16)
+            self.assignments = np.concatenate([padding, self.assignments])
+            self.start_ordinal = ordinal
+        elif ordinal >= self.start_ordinal + len(self.assignments):
+            padding = np.full(ordinal - self.start_ordinal - len(self.assignments) + 1, self.NO_SHIFT, dtype=np.int16)
+            self.assignments = np.concatenate([self.assignments, padding])
+        self.assignments[ordinal - self.start_ordinal] = self._name_code(employee)
+    
+    def __delitem__(self, key):
+        offset = self._offset(key)
+        if not (0 <= offset < len(self.assignments)) or self.assignments[offset] < 0:
+            raise KeyError(key)
+        self.assignments[offset] = self.NO_SHIFT
+    
+    def __len__(self):
+        return int(np.count_nonzero(self._assigned_mask()))
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __eq__(self, other):
+        if isinstance(other, (CompactSchedule, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+    
+    def __repr__(self):
+        return f"CompactSchedule({len(self)} Schichten, {len(self.names)} Mitarbeiter, {self.nbytes} Bytes)"
+    
+    def keys(self):
+        return ((self.ordinals() - EPOCH_ORDINAL).astype('datetime64[D]').astype(str)).tolist()
+    
+    def values(self):
+        return np.asarray(self.names, dtype=object)[self.codes()].tolist()
+    
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+    
+    def copy(self):
+        return CompactSchedule(self.start_ordinal, self.assignments.copy(), self.names)
+    
+    def to_dict(self):
+        return dict(self.items())
+    
+    # Schnelle Zugriffe ohne Datums-Parsing
+    def ordinals(self):
+        """Ordinale aller Tage mit Schicht (aufsteigend)"""
+        return np.flatnonzero(self._assigned_mask()) + self.start_ordinal
+    
+    def codes(self):
+        """Mitarbeiter-Indizes (Namenstabelle) aller Tage mit Schicht"""
+        return self.assignments[self._assigned_mask()]
+    
+    def dates(self):
+        """date-Objekte aller Tage mit Schicht"""
+        return [date.fromordinal(int(ordinal)) for ordinal in self.ordinals()]
+    
+    def iter_days(self):
+        """Liefert (date, Name)-Paare aller Tage mit Schicht in Datumsreihenfolge"""
+        names = self.names
+        for ordinal, code in zip(self.ordinals().tolist(), self.codes().tolist()):
+            yield date.fromordinal(ordinal), names[code]
+    
+    def weekdays(self):
+        """Wochentag (0 = Montag) je Kalendertag des Arrays"""
+        return (np.arange(len(self.assignments)) + self.start_ordinal - 1) % 7
+    
+    def months(self):
+        """Monat (1-12) je Kalendertag des Arrays"""
+        day_numbers = np.arange(len(self.assignments)) + self.start_ordinal - EPOCH_ORDINAL
+        return day_numbers.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) % 12 + 1
+    
+    def select(self, mask):
+        """Teilplan mit allen Kalendertagen, für die die bool-Maske True ist"""
+        return CompactSchedule(self.start_ordinal, np.where(mask, self.assignments, self.NO_SHIFT), self.names)
+    
+    def between(self, start, end):
+        """Teilplan für den Zeitraum [start, end] (date/datetime-Objekte)"""
+        ordinals = np.arange(len(self.assignments)) + self.start_ordinal
+        return self.select((ordinals >= start.toordinal()) & (ordinals <= end.toordinal()))
+    
+    def window(self, start_ordinal, end_ordinal):
+        """Namen je Kalendertag im Bereich [start_ordinal, end_ordinal) als object-Array (None = keine Schicht)"""
+        labels = np.full(end_ordinal - start_ordinal, None, dtype=object)
+        lo = max(start_ordinal, self.start_ordinal)
+        hi = min(end_ordinal, self.start_ordinal + len(self.assignments))
+        if lo < hi:
+            # Index -1 (keine Schicht) zeigt auf das angehängte None
+            names = np.array(self.names + [None], dtype=object)
+            labels[lo - start_ordinal:hi - start_ordinal] = names[self.assignments[lo - self.start_ordinal:hi - self.start_ordinal]]
+        return labels
+    
+    def to_numpy(self):
+        """Mitarbeiter-Index je Kalendertag ab start_ordinal (ohne Kopie)"""
+        return self.assignments
+    
+    def to_dataframe(self):
+        """DataFrame mit den Spalten 'date' (datetime64) und 'employee' (kategorisch)"""
+        mask = self._assigned_mask()
+        return pd.DataFrame({
+            'date': (np.flatnonzero(mask) + self.start_ordinal - EPOCH_ORDINAL).astype('datetime64[D]'),
+            'employee': pd.Categorical.from_codes(self.assignments[mask], categories=self.names),
+        })
+    
+    def to_blob(self):
+        """Komprimierte Darstellung für das Archiv: (start_ordinal, Namenstabelle als JSON, zlib-komprimiertes int16-Array)"""
+        return self.start_ordinal, json.dumps(self.names, ensure_ascii=False), zlib.compress(self.assignments.astype('<i2').tobytes(), 6)
+    
+    @property
+    def nbytes(self):
+        return self.assignments.nbytes + sum(len(name) for name in self.names)
+
+def as_compact_schedule(schedule_data):
+    """Liefert den Plan als CompactSchedule (ohne Kopie, falls er bereits kompakt ist)"""
+    if isinstance(schedule_data, CompactSchedule):
+        return schedule_data
+    return CompactSchedule.from_dict(schedule_data)
+
+def schedule_change_arrays(old_schedule, new_schedule):
+    """
+    Vergleicht zwei Pläne vektorisiert auf den Datums-Ordinalen.
+    
+    Returns:
+        Tuple (ordinals, old_names, new_names) nur für geänderte Tage; None = keine Schicht
+    """
+    old_plan = as_compact_schedule(old_schedule)
+    new_plan = as_compact_schedule(new_schedule)
+    plans = [plan for plan in (old_plan, new_plan) if len(plan.assignments)]
+    if not plans:
+        return np.zeros(0, dtype=np.int64), [], []
+    
+    start_ordinal = min(plan.start_ordinal for plan in plans)
+    end_ordinal = max(plan.start_ordinal + len(plan.assignments) for plan in plans)
+    old_labels = old_plan.window(start_ordinal, end_ordinal)
+    new_labels = new_plan.window(start_ordinal, end_ordinal)
+    
+    changed = np.flatnonzero(old_labels != new_labels)
+    return changed + start_ordinal, old_labels[changed].tolist(), new_labels[changed].tolist()
+
+def schedule_changes(old_schedule, new_schedule):
+    """Liefert die geänderten Tage als Liste von (date_str, alter Name, neuer Name); None = keine Schicht"""
+    ordinals, old_names, new_names = schedule_change_arrays(old_schedule, new_schedule)
+    date_strs = (ordinals - EPOCH_ORDINAL).astype('datetime64[D]').astype(str).tolist()
+    return list(zip(date_strs, old_names, new_names))
+
+def diff_schedules(old_schedule, new_schedule, preferences=None):
+    """
+    Vergleicht zwei Pläne und gruppiert die geänderten Tage je Person.
+    
+    Der Abgleich läuft vektorisiert auf den Datums-Ordinalen (schedule_change_arrays), die Gruppierung
+    und die Wunsch-Deltas über Index-Arrays je Person - auch mehrjährige Pläne sind sofort verglichen.
+    
+    Args:
+        preferences: Optionale Präferenzen {Name: [Tage]} für die Wunsch-Deltas (sonst 'kein Wunsch')
+    
+    Returns:
+        Dict {Name: {'added': [date], 'removed': [date], 'net': n, 'wishes': {'first': n, ..., 'none': n}}}
+        nur für Personen mit Änderungen, alphabetisch sortiert
+    """
+    ordinals, old_names, new_names = schedule_change_arrays(old_schedule, new_schedule)
+    if len(ordinals) == 0:
+        return {}
+    
+    employees = sorted((set(old_names) | set(new_names)) - {None})
+    employee_index = {emp: i for i, emp in enumerate(employees)}
+    old_codes = np.array([employee_index.get(name, -1) for name in old_names], dtype=np.int64)
+    new_codes = np.array([employee_index.get(name, -1) for name in new_names], dtype=np.int64)
+    
+    # Wunsch-Rang der Person am jeweiligen Wochentag (0 = 1. Wahl, RANK_NONE = kein Wunsch)
+    weekday_ranks = build_preference_ranks({emp: (preferences or {}).get(emp, []) for emp in employees})
+    weekdays = (ordinals - 1) % 7
+    bins = len(employees) * (RANK_NONE + 1)
+    
+    def histogram(codes):
+        assigned = codes >= 0
+        ranks = weekday_ranks[codes[assigned], weekdays[assigned]].astype(np.int64)
+        return np.bincount(codes[assigned] * (RANK_NONE + 1) + ranks, minlength=bins).reshape(len(employees), RANK_NONE + 1)
+    
+    wish_deltas = histogram(new_codes) - histogram(old_codes)
+    
+    def group(codes):
+        # Tage je Person: stabil nach Person sortieren und an den Gruppengrenzen teilen
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        bounds = np.searchsorted(sorted_codes, np.arange(len(employees) + 1))
+        return [ordinals[order[bounds[i]:bounds[i + 1]]] for i in range(len(employees))]
+    
+    added = group(new_codes)
+    removed = group(old_codes)
+    
+    return {
+        emp: {
+            'added': [date.fromordinal(int(ordinal)) for ordinal in added[i]],
+            'removed': [date.fromordinal(int(ordinal)) for ordinal in removed[i]],
+            'net': len(added[i]) - len(removed[i]),
+            'wishes': dict(zip(PRIORITY_KEYS, wish_deltas[i].tolist()))
+        }
+        for i, emp in enumerate(employees)
+    }
+
+# Serialisierte Schreibzugriffe
+class DatabaseWriter:
+    """
+    Einziger Schreiber für die SQLite-Datenbank (pro Prozess).
+    
+    Schreibjobs sind Funktionen job(cursor), die in eine begrenzte Warteschlange gestellt werden.
+    Ein Hintergrund-Thread fasst alle wartenden Jobs zu einem Group-Commit zusammen: jeder Job
+    läuft in einem eigenen SAVEPOINT (ein fehlschlagender Job wird allein zurückgerollt), die
+    Gruppe wird mit einem einzigen COMMIT geschrieben. Aufrufer erhalten ein Future, das erst
+    nach dem Commit erfüllt wird. Leser verwenden weiterhin eigene Verbindungen (WAL).
+    """
+    
+    def __init__(self, db_path='schichtplaner.db', max_queue=256, max_batch=64):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.jobs = queue.Queue(maxsize=max_queue)
+        self.stats_lock = threading.Lock()
+        self.counters = {
+            'jobs': 0,               # Erfolgreich geschriebene Jobs
+            'failed': 0,             # Zurückgerollte Jobs
+            'commits': 0,            # Group-Commits
+            'max_batch': 0,          # Größte Gruppe in einem Commit
+            'blocked_submits': 0,    # Aufrufer, die auf eine volle Warteschlange warten mussten
+            'blocked_seconds': 0.0,  # Summe der Wartezeit durch Backpressure
+            'commit_seconds': 0.0    # Summe der Zeit in Transaktionen
+        }
+        self.thread = threading.Thread(target=self.run, name="schichtplaner-db-writer", daemon=True)
+        self.thread.start()
+    
+    def submit(self, job):
+        """Stellt einen Schreibjob ein und gibt ein Future zurück (blockiert, solange die Warteschlange voll ist)"""
+        future = Future()
+        try:
+            self.jobs.put_nowait((job, future))
+        except queue.Full:
+            started = time.perf_counter()
+            self.jobs.put((job, future))
+            with self.stats_lock:
+                self.counters['blocked_submits'] += 1
+                self.counters['blocked_seconds'] += time.perf_counter() - started
+        return future
+    
+    def execute(self, job, timeout=None):
+        """Führt einen Schreibjob aus und wartet auf den Commit; Fehler des Jobs werden weitergereicht"""
+        return self.submit(job).result(timeout)
+    
+    def stats(self):
+        """Kennzahlen für Durchsatz und Backpressure"""
+        with self.stats_lock:
+            stats = dict(self.counters)
+        stats['queue_depth'] = self.jobs.qsize()
+        stats['avg_batch'] = stats['jobs'] / stats['commits'] if stats['commits'] else 0.0
+        return stats
+    
+    def run(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        cursor = conn.cursor()
+        
+        while True:
+            # Blockierend auf den ersten Job warten, dann alles Wartende zur Gruppe hinzunehmen
+            batch = [self.jobs.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+            
+            started = time.perf_counter()
+            outcomes = []
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                for job, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    cursor.execute('SAVEPOINT job')
+                    try:
+                        outcomes.append((future, job(cursor), None))
+                        cursor.execute('RELEASE job')
+                    except Exception as e:
+                        cursor.execute('ROLLBACK TO job')
+                        cursor.execute('RELEASE job')
+                        outcomes.append((future, None, e))
+                cursor.execute('COMMIT')
+            except Exception as e:
+                # Commit fehlgeschlagen: die komplette Gruppe ist verloren
+                if conn.in_transaction:
+                    conn.rollback()
+                for job, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                with self.stats_lock:
+                    self.counters['failed'] += len(batch)
+                continue
+            
+            failed = 0
+            for future, result, error in outcomes:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+                    failed += 1
+            
+            with self.stats_lock:
+                self.counters['jobs'] += len(outcomes) - failed
+                self.counters['failed'] += failed
+                self.counters['commits'] += 1
+                self.counters['max_batch'] = max(self.counters['max_batch'], len(outcomes))
+                self.counters['commit_seconds'] += time.perf_counter() - started
+
+@st.cache_resource
+def get_database_writer():
+    """Prozessweiter Schreiber (überlebt Streamlit-Reruns und wird von allen Sitzungen geteilt)"""
+    return DatabaseWriter()
+
 # Datenbankfunktionen
 def init_database():
     """Initialisiert die SQLite-Datenbank"""
     conn = sqlite3.connect('schichtplaner.db')
     cursor = conn.cursor()
     
+    # WAL: Leser blockieren den Schreiber nicht (und umgekehrt)
+    cursor.execute('PRAGMA journal_mode=WAL')
+    
     # Tabelle für Teams/Organisationen
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS teams (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT UNIQUE NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0,  -- Wird bei jeder Plan-/Präferenzänderung erhöht
+            schedule_position INTEGER NOT NULL DEFAULT 0,  -- Aktuelle Version im Plan-Verlauf (Undo/Redo)
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
     
+    # Migration: Versionsspalten für ältere Datenbanken nachrüsten
+    cursor.execute('PRAGMA table_info(teams)')
+    team_columns = [column[1] for column in cursor.fetchall()]
+    if 'version' not in team_columns:
+        cursor.execute('ALTER TABLE teams ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    if 'schedule_position' not in team_columns:
+        cursor.execute('ALTER TABLE teams ADD COLUMN schedule_position INTEGER NOT NULL DEFAULT 0')
+    
     # Füge MSH als Standard-Team hinzu wenn noch nicht vorhanden
     cursor.execute('INSERT OR IGNORE INTO teams (name) VALUES (?)', ('MSH',))
     
@@ -66,6 +557,9 @@ def init_database():
         )
     ''')
     
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_schedules_team_date ON schedules (team_id, date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_schedules_team_employee_date ON schedules (team_id, employee_name, date)')
+    
     # Tabelle für Login-Sessions (90 Tage Passwort-Speicherung)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS login_sessions (
@@ -82,15 +576,116 @@ def init_database():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             team_id INTEGER NOT NULL,
             name TEXT NOT NULL,
-            type TEXT NOT NULL,  -- 'urlaub' oder 'wochentag'
-            date TEXT,           -- Für Urlaub: YYYY-MM-DD Format
+            type TEXT NOT NULL,  -- 'urlaub', 'wochentag' oder 'regel'
+            date TEXT,           -- Für Urlaub: erster Tag (YYYY-MM-DD)
+            end_date TEXT,       -- Für Urlaub: letzter Tag (YYYY-MM-DD, inklusive)
             weekday TEXT,        -- Für Wochentag: z.B. 'Montag'
+            rule TEXT,           -- Für Regel: JSON-Muster (siehe UNAVAILABILITY_RULE_KINDS)
             reason TEXT,         -- Beschreibung/Grund
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (team_id) REFERENCES teams (id)
         )
     ''')
     
+    # Index für die seitenweise Liste (Keyset-Pagination nach Name, Datum, ID)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_unavailability_listing ON unavailability (team_id, name, COALESCE(date, ''), id)")
+    
+    # Migration: Urlaub als Zeitraum (end_date) statt einer Zeile pro Tag
+    cursor.execute('PRAGMA table_info(unavailability)')
+    if 'end_date' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE unavailability ADD COLUMN end_date TEXT')
+    cursor.execute('PRAGMA table_info(unavailability)')
+    if 'rule' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE unavailability ADD COLUMN rule TEXT')
+    
+    # Fasse bestehende Einzeltage (gleiche Person, gleicher Grund, nur durch Wochenenden getrennt) zu Zeiträumen zusammen
+    cursor.execute('''
+        SELECT id, team_id, name, COALESCE(reason, ''), date FROM unavailability
+        WHERE type = 'urlaub' AND end_date IS NULL AND date IS NOT NULL
+        ORDER BY team_id, name, COALESCE(reason, ''), date
+    ''')
+    vacation_runs = []
+    for entry_id, team_id, name, reason, date_str in cursor.fetchall():
+        ordinal = datetime.strptime(date_str, '%Y-%m-%d').toordinal()
+        run = vacation_runs[-1] if vacation_runs else None
+        if (run and run['key'] == (team_id, name, reason) and ordinal > run['end']
+                and all(date.fromordinal(gap).weekday() >= 5 for gap in range(run['end'] + 1, ordinal))):
+            run['end'] = ordinal
+            run['ids'].append(entry_id)
+        elif run and run['key'] == (team_id, name, reason) and ordinal <= run['end']:
+            run['ids'].append(entry_id)  # Doppelter Tag
+        else:
+            vacation_runs.append({'key': (team_id, name, reason), 'start': ordinal, 'end': ordinal, 'ids': [entry_id]})
+    
+    cursor.executemany('UPDATE unavailability SET date = ?, end_date = ? WHERE id = ?', [
+        (date.fromordinal(run['start']).isoformat(), date.fromordinal(run['end']).isoformat(), run['ids'][0])
+        for run in vacation_runs
+    ])
+    cursor.executemany('DELETE FROM unavailability WHERE id = ?', [
+        (entry_id,) for run in vacation_runs for entry_id in run['ids'][1:]
+    ])
+    
+    # Tabelle für das Fairness-Ledger (kumulierte Schichten und Wunscherfüllung je Person)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fairness_ledger (
+            team_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            shifts INTEGER NOT NULL DEFAULT 0,
+            wish_first INTEGER NOT NULL DEFAULT 0,
+            wish_second INTEGER NOT NULL DEFAULT 0,
+            wish_third INTEGER NOT NULL DEFAULT 0,
+            wish_fourth INTEGER NOT NULL DEFAULT 0,
+            wish_fifth INTEGER NOT NULL DEFAULT 0,
+            wish_none INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (team_id, name),
+            FOREIGN KEY (team_id) REFERENCES teams (id)
+        )
+    ''')
+    
+    # Archivierte Planjahre: ein komprimierter Block je Team und Jahr (siehe archive_schedule_years)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schedule_archive (
+            team_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            start_ordinal INTEGER NOT NULL,
+            names TEXT NOT NULL,         -- JSON-Namenstabelle
+            assignments BLOB NOT NULL,   -- zlib-komprimiertes int16-Array (Index je Kalendertag, -1 = keine Schicht)
+            shift_count INTEGER NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (team_id, year),
+            FOREIGN KEY (team_id) REFERENCES teams (id)
+        )
+    ''')
+    
+    # Plan-Versionsverlauf: geänderte (Datum, alt, neu)-Tripel je Speichern plus periodische Checkpoints
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schedule_versions (
+            team_id INTEGER NOT NULL,
+            version_no INTEGER NOT NULL,
+            label TEXT,
+            change_count INTEGER NOT NULL,
+            delta BLOB NOT NULL,         -- zlib-komprimiertes JSON [[Datum, alt, neu], ...]
+            checkpoint_start INTEGER,    -- Checkpoint: vollständiger Plan nach dieser Version (siehe CompactSchedule.to_blob)
+            checkpoint_names TEXT,
+            checkpoint BLOB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (team_id, version_no),
+            FOREIGN KEY (team_id) REFERENCES teams (id)
+        )
+    ''')
+    
+    # Änderungszähler je Team und Datenbereich (Cache-Invalidierung über Sitzungen hinweg)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_counters (
+            team_id INTEGER NOT NULL,
+            scope TEXT NOT NULL,  -- 'preferences', 'schedule' oder 'unavailability'
+            counter INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (team_id, scope),
+            FOREIGN KEY (team_id) REFERENCES teams (id)
+        )
+    ''')
+    
     # Migration: Bestehende Daten ohne team_id zu MSH zuordnen
     cursor.execute('SELECT id FROM teams WHERE name = ?', ('MSH',))
     msh_team_id = cursor.fetchone()[0]
@@ -110,6 +705,17 @@ def init_database():
     if cursor.fetchone()[0] > 0:
         cursor.execute('UPDATE unavailability SET team_id = ? WHERE team_id IS NULL OR team_id = 0', (msh_team_id,))
     
+    # Migriere Fairness-Ledger: einmalig aus den bereits gespeicherten Plänen aufbauen
+    cursor.execute('SELECT COUNT(*) FROM fairness_ledger')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('SELECT DISTINCT team_id FROM schedules')
+        for (team_id,) in cursor.fetchall():
+            cursor.execute('SELECT date, employee_name FROM schedules WHERE team_id = ?', (team_id,))
+            schedule = CompactSchedule.from_rows(cursor.fetchall())
+            cursor.execute('SELECT name, preferred_days FROM preferences WHERE team_id = ?', (team_id,))
+            preferences = {name: preferred_days_str.split(',') for name, preferred_days_str in cursor.fetchall()}
+            apply_fairness_ledger_deltas(cursor, team_id, fairness_ledger_deltas(CompactSchedule(), schedule, preferences))
+    
     conn.commit()
     conn.close()
 
@@ -137,35 +743,100 @@ def get_team_id_by_name(team_name):
 
 def create_team(team_name):
     """Erstellt ein neues Team"""
-    conn = sqlite3.connect('schichtplaner.db')
-    cursor = conn.cursor()
+    def job(cursor):
+        cursor.execute('INSERT INTO teams (name) VALUES (?)', (team_name,))
+        return cursor.lastrowid
     
     try:
-        cursor.execute('INSERT INTO teams (name) VALUES (?)', (team_name,))
-        team_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return team_id
+        return get_database_writer().execute(job)
     except sqlite3.IntegrityError:
-        conn.close()
         return None  # Team existiert bereits
 
-def save_preferences(name, preferred_days, team_id):
-    """Speichert Mitarbeiterpräferenzen in der Datenbank"""
+class VersionConflictError(Exception):
+    """Das Team wurde seit dem zuletzt gesehenen Stand in einer anderen Sitzung geändert"""
+    
+    def __init__(self, team_id, expected_version, current_version):
+        super().__init__(f"Team {team_id}: Version {expected_version} erwartet, aktuell {current_version}")
+        self.team_id = team_id
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+def get_team_version(team_id):
+    """Holt die aktuelle Version (Änderungszähler) eines Teams"""
     conn = sqlite3.connect('schichtplaner.db')
     cursor = conn.cursor()
     
-    preferred_days_str = ','.join(preferred_days)
+    cursor.execute('SELECT version FROM teams WHERE id = ?', (team_id,))
+    result = cursor.fetchone()
+    
+    conn.close()
+    return result[0] if result else 0
+
+def bump_team_version(cursor, team_id, expected_version=None):
+    """Erhöht die Team-Version innerhalb der laufenden Transaktion und gibt die neue Version zurück.
+    
+    Muss die erste Schreiboperation der Transaktion sein: das UPDATE sichert die Schreibsperre,
+    sodass Versionsprüfung und Schreiben atomar sind. Weicht die Version von expected_version ab,
+    wird ein VersionConflictError ausgelöst, ohne dass etwas geschrieben wurde.
+    """
+    if expected_version is None:
+        cursor.execute('UPDATE teams SET version = version + 1 WHERE id = ?', (team_id,))
+    else:
+        cursor.execute('UPDATE teams SET version = version + 1 WHERE id = ? AND version = ?', (team_id, expected_version))
+    updated = cursor.rowcount
+    
+    cursor.execute('SELECT version FROM teams WHERE id = ?', (team_id,))
+    result = cursor.fetchone()
+    current_version = result[0] if result else 0
+    
+    if updated == 0 and expected_version is not None:
+        raise VersionConflictError(team_id, expected_version, current_version)
+    return current_version
+
+def bump_change_counter(cursor, team_id, scope):
+    """Erhöht den Änderungszähler eines Datenbereichs innerhalb der laufenden Schreibtransaktion"""
     cursor.execute('''
-        INSERT OR REPLACE INTO preferences (team_id, name, preferred_days)
-        VALUES (?, ?, ?)
-    ''', (team_id, name, preferred_days_str))
+        INSERT INTO change_counters (team_id, scope, counter) VALUES (?, ?, 1)
+        ON CONFLICT (team_id, scope) DO UPDATE SET counter = counter + 1
+    ''', (team_id, scope))
+
+def get_change_counter(team_id, scope):
+    """Holt den aktuellen Änderungszähler (billige Primärschlüssel-Abfrage, bei jedem Laden geprüft)"""
+    conn = sqlite3.connect('schichtplaner.db')
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT counter FROM change_counters WHERE team_id = ? AND scope = ?', (team_id, scope))
+    result = cursor.fetchone()
     
-    conn.commit()
     conn.close()
+    return result[0] if result else 0
+
+def save_preferences(name, preferred_days, team_id, expected_version=None, previous_name=None):
+    """Speichert Mitarbeiterpräferenzen in der Datenbank (previous_name: bisheriger Name bei Umbenennung)"""
+    def job(cursor):
+        new_version = bump_team_version(cursor, team_id, expected_version)
+        
+        # Umbenennung in derselben Transaktion
+        if previous_name is not None and previous_name != name:
+            cursor.execute('DELETE FROM preferences WHERE name = ? AND team_id = ?', (previous_name, team_id))
+        
+        bump_change_counter(cursor, team_id, 'preferences')
+        preferred_days_str = ','.join(preferred_days)
+        cursor.execute('''
+            INSERT OR REPLACE INTO preferences (team_id, name, preferred_days)
+            VALUES (?, ?, ?)
+        ''', (team_id, name, preferred_days_str))
+        return new_version
+    
+    return get_database_writer().execute(job)
 
 def load_preferences(team_id):
     """Lädt alle Mitarbeiterpräferenzen aus der Datenbank für ein bestimmtes Team (alphabetisch sortiert)"""
+    return fetch_preferences(team_id, get_change_counter(team_id, 'preferences'))
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def fetch_preferences(team_id, change_counter):
+    """Liest die Präferenzen aus der Datenbank (change_counter dient nur als Cache-Schlüssel)"""
     conn = sqlite3.connect('schichtplaner.db')
     cursor = conn.cursor()
     
@@ -179,169 +850,769 @@ def load_preferences(team_id):
     conn.close()
     return preferences
 
-def delete_preference(name, team_id):
+def delete_preference(name, team_id, expected_version=None):
     """Löscht eine Mitarbeiterpräferenz aus der Datenbank"""
-    conn = sqlite3.connect('schichtplaner.db')
-    cursor = conn.cursor()
+    def job(cursor):
+        new_version = bump_team_version(cursor, team_id, expected_version)
+        cursor.execute('DELETE FROM preferences WHERE name = ? AND team_id = ?', (name, team_id))
+        bump_change_counter(cursor, team_id, 'preferences')
+        return new_version
     
-    cursor.execute('DELETE FROM preferences WHERE name = ? AND team_id = ?', (name, team_id))
-    
-    conn.commit()
-    conn.close()
+    return get_database_writer().execute(job)
 
-def get_preference_by_name(name, team_id):
-    """Holt eine spezifische Präferenz nach Name für ein bestimmtes Team"""
-    conn = sqlite3.connect('schichtplaner.db')
-    cursor = conn.cursor()
+def offboard_employee(name, schedule_data, team_id, expected_version=None):
+    """
+    Entfernt eine ausscheidende Person und speichert den umverteilten Plan (siehe plan_offboarding) in einer Transaktion.
     
-    cursor.execute('SELECT preferred_days FROM preferences WHERE name = ? AND team_id = ?', (name, team_id))
-    result = cursor.fetchone()
+    Die Ledger-Buchungen werden mit den Präferenzen vor dem Löschen berechnet, damit das
+    Fairness-Ledger die abgegebenen Schichten mit den bisherigen Wunsch-Rängen ausbucht.
+    Gibt die neue Team-Version zurück.
+    """
+    def finish(cursor, prepared):
+        if prepared['changes']:
+            record_schedule_version(cursor, team_id, prepared['changes'], prepared['schedule'], f"Offboarding: {name}")
+        cursor.execute('DELETE FROM preferences WHERE name = ? AND team_id = ?', (name, team_id))
+        bump_change_counter(cursor, team_id, 'preferences')
     
-    conn.close()
-    if result:
-        return result[0].split(',')
-    return None
+    return execute_schedule_write(team_id, expected_version, finish, schedule_data=schedule_data)
 
-def save_schedule(schedule_data, team_id):
-    """Speichert den generierten Schichtplan für ein bestimmtes Team"""
+def load_employee_shift_dates(team_id, name, start_date=None, end_date=None):
+    """Holt die Schichttage einer Person im Zeitraum [start_date, end_date] (Bereichsabfrage über idx_schedules_team_employee_date)"""
     conn = sqlite3.connect('schichtplaner.db')
     cursor = conn.cursor()
     
-    # Lösche alte Schichtpläne für dieses Team
-    cursor.execute('DELETE FROM schedules WHERE team_id = ?', (team_id,))
-    
-    # Speichere neuen Plan
-    for date_str, employee_name in schedule_data.items():
-        cursor.execute('''
-            INSERT INTO schedules (team_id, date, employee_name)
-            VALUES (?, ?, ?)
-        ''', (team_id, date_str, employee_name))
+    cursor.execute('''
+        SELECT date FROM schedules
+        WHERE team_id = ? AND employee_name = ? AND date BETWEEN ? AND ?
+        ORDER BY date
+    ''', (team_id, name, start_date.isoformat() if start_date else '', end_date.isoformat() if end_date else '9999-12-31'))
+    results = cursor.fetchall()
     
-    conn.commit()
     conn.close()
+    return [date.fromisoformat(date_str) for (date_str,) in results]
 
-def load_schedule(team_id):
-    """Lädt den gespeicherten Schichtplan für ein bestimmtes Team"""
-    conn = sqlite3.connect('schichtplaner.db')
-    cursor = conn.cursor()
+def find_unavailability_conflicts(name, unavail_type, team_id, date=None, weekday=None, end_date=None, rule=None, from_date=None):
+    """
+    Findet die geplanten Schichttage einer Person, die mit einer Nichtverfügbarkeit kollidieren.
     
-    cursor.execute('SELECT date, employee_name FROM schedules WHERE team_id = ? ORDER BY date', (team_id,))
-    results = cursor.fetchall()
+    Gelesen werden nur die Schichttage dieser Person über idx_schedules_team_employee_date (bei Urlaub
+    genau der Zeitraum), Wochentag-Sperren und Regeln werden darauf vektorisiert ausgewertet.
+    Berücksichtigt werden nur Tage ab from_date (Standard: heute).
     
-    schedule = {}
-    for date_str, employee_name in results:
-        schedule[date_str] = employee_name
+    Returns:
+        Liste der betroffenen Tage (date-Objekte)
+    """
+    from_date = from_date or datetime.now().date()
+    if unavail_type == "urlaub":
+        start = max(datetime.strptime(date, '%Y-%m-%d').date(), from_date)
+        end = datetime.strptime(end_date or date, '%Y-%m-%d').date()
+        return load_employee_shift_dates(team_id, name, start, end) if start <= end else []
     
-    conn.close()
-    return schedule
+    shift_dates = load_employee_shift_dates(team_id, name, from_date)
+    ordinals = np.array([day.toordinal() for day in shift_dates], dtype=np.int64)
+    if unavail_type == "wochentag" and weekday in WEEKDAY_NAMES:
+        blocked = (ordinals - 1) % 7 == WEEKDAY_NAMES.index(weekday)
+    elif unavail_type == "regel" and rule:
+        blocked = evaluate_unavailability_rule(rule, ordinals)
+    else:
+        return []
+    return [day for day, is_blocked in zip(shift_dates, blocked) if is_blocked]
 
-def save_unavailability(name, unavail_type, team_id, date=None, weekday=None, reason=""):
-    """Speichert Urlaub oder Wochentag-Nichtverfügbarkeit für ein bestimmtes Team"""
-    conn = sqlite3.connect('schichtplaner.db')
-    cursor = conn.cursor()
+def load_team_data(team_id):
+    """
+    Schnappschuss der Teamdaten für Teilansichten (Fragmente): Präferenzen, Plan und Nichtverfügbarkeit.
     
-    cursor.execute('''
-        INSERT INTO unavailability (team_id, name, type, date, weekday, reason)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (team_id, name, unavail_type, date, weekday, reason))
+    Liest alle Änderungszähler des Teams mit einer Abfrage und bedient sich dann aus den Caches
+    der einzelnen Loader - ein Teil-Rerun erhält so aktuelle Daten für eine Primärschlüssel-Abfrage.
     
-    conn.commit()
-    conn.close()
-
-def load_unavailability(team_id):
-    """Lädt alle Urlaubs- und Nichtverfügbarkeitseinträge für ein bestimmtes Team (alphabetisch sortiert)"""
+    Returns:
+        Dictionary mit 'preferences', 'schedule' und 'unavailability'
+    """
     conn = sqlite3.connect('schichtplaner.db')
     cursor = conn.cursor()
     
-    cursor.execute('SELECT name, type, date, weekday, reason FROM unavailability WHERE team_id = ? ORDER BY name, date, weekday', (team_id,))
-    results = cursor.fetchall()
+    cursor.execute('SELECT scope, counter FROM change_counters WHERE team_id = ?', (team_id,))
+    counters = dict(cursor.fetchall())
     
     conn.close()
-    return results
+    return {
+        'preferences': fetch_preferences(team_id, counters.get('preferences', 0)),
+        'schedule': fetch_schedule(team_id, counters.get('schedule', 0)),
+        'unavailability': fetch_unavailability(team_id, counters.get('unavailability', 0))
+    }
 
-def delete_unavailability(entry_id):
-    """Löscht einen Urlaubs-/Nichtverfügbarkeitseintrag"""
+def get_preference_by_name(name, team_id):
+    """Holt eine spezifische Präferenz nach Name für ein bestimmtes Team"""
     conn = sqlite3.connect('schichtplaner.db')
     cursor = conn.cursor()
     
-    cursor.execute('DELETE FROM unavailability WHERE id = ?', (entry_id,))
+    cursor.execute('SELECT preferred_days FROM preferences WHERE name = ? AND team_id = ?', (name, team_id))
+    result = cursor.fetchone()
     
-    conn.commit()
     conn.close()
+    if result:
+        return result[0].split(',')
+    return None
 
-def get_unavailability_by_id(entry_id):
-    """Holt einen spezifischen Urlaubs-/Nichtverfügbarkeitseintrag"""
-    conn = sqlite3.connect('schichtplaner.db')
-    cursor = conn.cursor()
+def save_schedule(schedule_data, team_id, expected_version=None, label=""):
+    """Speichert den generierten Schichtplan für ein bestimmtes Team und aktualisiert das Fairness-Ledger.
     
-    cursor.execute('SELECT id, name, type, date, weekday, reason FROM unavailability WHERE id = ?', (entry_id,))
-    result = cursor.fetchone()
+    Mit expected_version wird nur gespeichert, wenn das Team seit diesem Stand nicht geändert wurde
+    (sonst VersionConflictError). Jede Änderung wird mit label als neue Version im Verlauf
+    festgehalten. Gibt die neue Team-Version zurück.
+    """
+    def finish(cursor, prepared):
+        if prepared['changes']:
+            record_schedule_version(cursor, team_id, prepared['changes'], prepared['schedule'], label)
     
-    conn.close()
-    return result
+    return execute_schedule_write(team_id, expected_version, finish, schedule_data=schedule_data)
 
-def is_employee_unavailable(employee, date_obj, team_id):
-    """Prüft ob ein Mitarbeiter an einem bestimmten Datum nicht verfügbar ist"""
+def prepare_schedule_write(team_id, schedule_data=None, version_no=None):
+    """
+    Bereitet das Ersetzen des gespeicherten Plans außerhalb der Schreibtransaktion vor.
+    
+    Team-Version, bisheriger Plan und Präferenzen werden in einer Lesetransaktion gelesen (mit
+    version_no wird statt schedule_data der Plan dieser Version aus dem Verlauf rekonstruiert).
+    Geänderte Tage und Ledger-Buchungen (inkl. Feiertagsprüfung) werden hier berechnet, sodass der
+    Schreibjob nur noch die fertigen Zeilen schreibt.
+    
+    Returns:
+        Dict mit 'version' (gelesene Team-Version), 'schedule', 'changes' und 'ledger_rows'
+    """
     conn = sqlite3.connect('schichtplaner.db')
     cursor = conn.cursor()
     
-    date_str = date_obj.strftime('%Y-%m-%d')
-    weekday_name = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag'][date_obj.weekday()]
-    
-    # Prüfe Urlaub an diesem Datum
-    cursor.execute('SELECT id FROM unavailability WHERE team_id = ? AND name = ? AND type = "urlaub" AND date = ?', (team_id, employee, date_str))
-    if cursor.fetchone():
+    try:
+        cursor.execute('BEGIN')
+        cursor.execute('SELECT version FROM teams WHERE id = ?', (team_id,))
+        result = cursor.fetchone()
+        cursor.execute('SELECT date, employee_name FROM schedules WHERE team_id = ?', (team_id,))
+        old_schedule = CompactSchedule.from_rows(cursor.fetchall())
+        cursor.execute('SELECT name, preferred_days FROM preferences WHERE team_id = ?', (team_id,))
+        preferences = {name: preferred_days_str.split(',') for name, preferred_days_str in cursor.fetchall()}
+        if version_no is not None:
+            schedule_data = reconstruct_schedule_version(cursor, team_id, version_no)
+    finally:
         conn.close()
-        return True
     
-    # Prüfe generelle Nichtverfügbarkeit an diesem Wochentag
-    cursor.execute('SELECT id FROM unavailability WHERE team_id = ? AND name = ? AND type = "wochentag" AND weekday = ?', (team_id, employee, weekday_name))
-    if cursor.fetchone():
-        conn.close()
-        return True
+    return {
+        'version': result[0] if result else 0,
+        'schedule': schedule_data,
+        'changes': schedule_changes(old_schedule, schedule_data),
+        'ledger_rows': fairness_ledger_deltas(old_schedule, schedule_data, preferences)
+    }
+
+def execute_schedule_write(team_id, expected_version, finish, schedule_data=None, version_no=None, retries=3):
+    """
+    Ersetzt den gespeicherten Plan über den DatabaseWriter (siehe prepare_schedule_write).
     
-    conn.close()
-    return False
+    Der Job prüft die Team-Version, schreibt die vorbereiteten Zeilen und ruft finish(cursor, prepared)
+    für weitere Schreibschritte derselben Transaktion auf. Ohne expected_version wird gegen die beim
+    Vorbereiten gelesene Version geprüft und bei einer zwischenzeitlichen Änderung neu vorbereitet.
+    
+    Returns:
+        Neue Team-Version
+    """
+    for attempt in range(retries):
+        prepared = prepare_schedule_write(team_id, schedule_data, version_no)
+        
+        def job(cursor):
+            new_version = bump_team_version(cursor, team_id, expected_version if expected_version is not None else prepared['version'])
+            write_schedule(cursor, team_id, prepared)
+            finish(cursor, prepared)
+            return new_version
 
-# Session-Management für 90-Tage Passwort-Speicherung
-def create_session_token():
-    """Erstellt einen neuen Session-Token"""
-    return str(uuid.uuid4())
+        try:
+            return get_database_writer().execute(job)
+        except VersionConflictError:
+            if expected_version is not None or attempt == retries - 1:
+                raise
 
-def save_login_session(token):
-    """Speichert einen Login-Session-Token für 90 Tage"""
-    conn = sqlite3.connect('schichtplaner.db')
-    cursor = conn.cursor()
+def write_schedule(cursor, team_id, prepared):
+    """Schreibt einen vorbereiteten Plan (siehe prepare_schedule_write) innerhalb der laufenden Schreibtransaktion"""
+    apply_fairness_ledger_deltas(cursor, team_id, prepared['ledger_rows'])
+    bump_change_counter(cursor, team_id, 'schedule')
     
-    expires_at = datetime.now() + timedelta(days=90)
+    # Schreibe nur die geänderten Tage (Zeilen-Diff statt kompletter Neuspeicherung)
+    changes = prepared['changes']
+    cursor.executemany('DELETE FROM schedules WHERE team_id = ? AND date = ?',
+                       [(team_id, date_str) for date_str, _, _ in changes])
+    cursor.executemany('''
+        INSERT INTO schedules (team_id, date, employee_name)
+        VALUES (?, ?, ?)
+    ''', [(team_id, date_str, employee_name) for date_str, _, employee_name in changes if employee_name is not None])
+
+def record_schedule_version(cursor, team_id, changes, schedule_data, label=""):
+    """
+    Hält eine neue Plan-Version mit den geänderten (Datum, alt, neu)-Tripeln fest.
     
+    Versionen nach der aktuellen Position (rückgängig gemachte Stände) werden verworfen. Die erste
+    und jede SCHEDULE_CHECKPOINT_INTERVAL-te Version speichert zusätzlich den vollständigen Plan,
+    sodass der Verlauf nur mit der Zahl der Änderungen wächst und jede Version mit wenigen Deltas
+    rekonstruiert werden kann.
+    """
+    cursor.execute('SELECT schedule_position FROM teams WHERE id = ?', (team_id,))
+    position = cursor.fetchone()[0]
+    cursor.execute('DELETE FROM schedule_versions WHERE team_id = ? AND version_no > ?', (team_id, position))
+    
+    version_no = position + 1
+    checkpoint = (None, None, None)
+    if version_no == 1 or version_no % SCHEDULE_CHECKPOINT_INTERVAL == 0:
+        checkpoint = as_compact_schedule(schedule_data).to_blob()
+    
+    delta = zlib.compress(json.dumps(changes, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
     cursor.execute('''
-        INSERT INTO login_sessions (session_token, expires_at)
-        VALUES (?, ?)
-    ''', (token, expires_at))
+        INSERT INTO schedule_versions (team_id, version_no, label, change_count, delta, checkpoint_start, checkpoint_names, checkpoint)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (team_id, version_no, label, len(changes), delta, *checkpoint))
+    cursor.execute('UPDATE teams SET schedule_position = ? WHERE id = ?', (version_no, team_id))
+    return version_no
+
+def reconstruct_schedule_version(cursor, team_id, version_no):
+    """
+    Rekonstruiert den Plan einer Version ausgehend vom nächstgelegenen Checkpoint.
+    
+    Liegt ein Checkpoint bei oder vor der Version, werden die folgenden Deltas vorwärts angewendet,
+    sonst (z.B. Version 0 = Stand vor der ersten Version) die Deltas rückwärts vom nächsten Checkpoint.
+    Tage archivierter Jahre werden entfernt, da sie nicht mehr zum aktiven Plan gehören.
+    """
+    cursor.execute('''
+        SELECT version_no, checkpoint_start, checkpoint_names, checkpoint FROM schedule_versions
+        WHERE team_id = ? AND checkpoint IS NOT NULL AND version_no <= ? ORDER BY version_no DESC LIMIT 1
+    ''', (team_id, version_no))
+    checkpoint = cursor.fetchone()
+    forward = checkpoint is not None
+    if not forward:
+        cursor.execute('''
+            SELECT version_no, checkpoint_start, checkpoint_names, checkpoint FROM schedule_versions
+            WHERE team_id = ? AND checkpoint IS NOT NULL AND version_no > ? ORDER BY version_no ASC LIMIT 1
+        ''', (team_id, version_no))
+        checkpoint = cursor.fetchone()
+    if checkpoint is None or version_no < 0:
+        raise ValueError(f"Version {version_no} ist nicht im Verlauf vorhanden")
+    
+    checkpoint_no = checkpoint[0]
+    if forward:
+        cursor.execute('''
+            SELECT delta FROM schedule_versions WHERE team_id = ? AND version_no > ? AND version_no <= ? ORDER BY version_no ASC
+        ''', (team_id, checkpoint_no, version_no))
+    else:
+        cursor.execute('''
+            SELECT delta FROM schedule_versions WHERE team_id = ? AND version_no > ? AND version_no <= ? ORDER BY version_no DESC
+        ''', (team_id, version_no, checkpoint_no))
+    deltas = [json.loads(zlib.decompress(delta)) for (delta,) in cursor.fetchall()]
+    if forward and len(deltas) != version_no - checkpoint_no:
+        raise ValueError(f"Version {version_no} ist nicht im Verlauf vorhanden")
+    
+    plan = CompactSchedule.from_blob(*checkpoint[1:]).to_dict()
+    for delta in deltas:
+        for date_str, old_name, new_name in delta:
+            name = new_name if forward else old_name
+            if name is None:
+                plan.pop(date_str, None)
+            else:
+                plan[date_str] = name
+    schedule = CompactSchedule.from_dict(plan)
+    
+    cursor.execute('SELECT MAX(year) FROM schedule_archive WHERE team_id = ?', (team_id,))
+    last_archived_year = cursor.fetchone()[0]
+    if last_archived_year is not None and len(schedule.assignments):
+        ordinals = np.arange(len(schedule.assignments)) + schedule.start_ordinal
+        schedule = schedule.select(ordinals >= date(last_archived_year + 1, 1, 1).toordinal())
+    return schedule
+
+def move_schedule_history(team_id, version_no, expected_version=None):
+    """Setzt den Plan auf den Stand einer Version, ohne eine neue Version anzulegen (Undo/Redo). Gibt die neue Team-Version zurück."""
+    def finish(cursor, prepared):
+        cursor.execute('UPDATE teams SET schedule_position = ? WHERE id = ?', (version_no, team_id))
+    
+    return execute_schedule_write(team_id, expected_version, finish, version_no=version_no)
+
+def restore_schedule_version(team_id, version_no, expected_version=None):
+    """Stellt den Plan einer früheren Version als neue Version wieder her (spätere Versionen bleiben erhalten). Gibt die neue Team-Version zurück."""
+    def finish(cursor, prepared):
+        # Position ans Ende setzen, damit die Wiederherstellung keine Versionen verwirft
+        cursor.execute('UPDATE teams SET schedule_position = (SELECT COALESCE(MAX(version_no), 0) FROM schedule_versions WHERE team_id = ?) WHERE id = ?',
+                       (team_id, team_id))
+        if prepared['changes']:
+            record_schedule_version(cursor, team_id, prepared['changes'], prepared['schedule'], f"Version {version_no} wiederhergestellt")
+    
+    return execute_schedule_write(team_id, expected_version, finish, version_no=version_no)
+
+def load_schedule_history(team_id):
+    """Lädt den Plan-Verlauf: (aktuelle Position, [(Version, Zeitpunkt, Bezeichnung, geänderte Tage, Checkpoint)] neueste zuerst)"""
+    return fetch_schedule_history(team_id, get_change_counter(team_id, 'schedule'))
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def fetch_schedule_history(team_id, change_counter):
+    """Liest den Plan-Verlauf aus der Datenbank (ändert sich nur zusammen mit dem Plan)"""
+    conn = sqlite3.connect('schichtplaner.db')
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT schedule_position FROM teams WHERE id = ?', (team_id,))
+    result = cursor.fetchone()
+    cursor.execute('''
+        SELECT version_no, created_at, label, change_count, checkpoint IS NOT NULL
+        FROM schedule_versions WHERE team_id = ? ORDER BY version_no DESC LIMIT ?
+    ''', (team_id, SCHEDULE_HISTORY_LIST_LIMIT))
+    versions = cursor.fetchall()
+    
+    conn.close()
+    return (result[0] if result else 0), versions
+
+def load_schedule_version(team_id, version_no):
+    """Rekonstruiert den Plan einer Version lesend (z.B. für Vergleiche)"""
+    return fetch_schedule_version(team_id, version_no, get_change_counter(team_id, 'schedule'))
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def fetch_schedule_version(team_id, version_no, change_counter):
+    """Liest eine Plan-Version über den nächstgelegenen Checkpoint (change_counter dient nur als Cache-Schlüssel)"""
+    conn = sqlite3.connect('schichtplaner.db')
+    cursor = conn.cursor()
+    
+    try:
+        return reconstruct_schedule_version(cursor, team_id, version_no)
+    finally:
+        conn.close()
+
+def load_schedule(team_id):
+    """Lädt den gespeicherten Schichtplan für ein bestimmtes Team (als CompactSchedule)"""
+    return fetch_schedule(team_id, get_change_counter(team_id, 'schedule'))
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def fetch_schedule(team_id, change_counter):
+    """Liest den Schichtplan aus der Datenbank (change_counter dient nur als Cache-Schlüssel)"""
+    conn = sqlite3.connect('schichtplaner.db')
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT date, employee_name FROM schedules WHERE team_id = ? ORDER BY date', (team_id,))
+    results = cursor.fetchall()
+    
+    conn.close()
+    return CompactSchedule.from_rows(results)
+
+def load_schedule_window(team_id, start_date, end_date=None, employee=None, limit=None):
+    """
+    Lädt einen Ausschnitt des Plans per Bereichsabfrage (für Datumsauswahlen in großen Plänen).
+    
+    Args:
+        team_id: ID des Teams
+        start_date: Erster Tag (date)
+        end_date: Letzter Tag (date) oder None für offenes Ende
+        employee: Nur Schichten dieser Person oder None für alle
+        limit: Maximale Anzahl Tage oder None
+    
+    Returns:
+        Liste von (Datum als String, Name) in Datumsreihenfolge
+    """
+    return fetch_schedule_window(
+        team_id, start_date.isoformat(), end_date.isoformat() if end_date else '9999-12-31',
+        employee, limit or -1, get_change_counter(team_id, 'schedule')
+    )
+    
+@st.cache_data(max_entries=256, show_spinner=False)
+def fetch_schedule_window(team_id, start_date, end_date, employee, limit, change_counter):
+    """Liest einen Plan-Ausschnitt über idx_schedules_team_date bzw. idx_schedules_team_employee_date (LIMIT -1 = ohne Grenze)"""
+    conn = sqlite3.connect('schichtplaner.db')
+    cursor = conn.cursor()
+    
+    if employee is None:
+        cursor.execute('''
+            SELECT date, employee_name FROM schedules
+            WHERE team_id = ? AND date BETWEEN ? AND ?
+            ORDER BY date LIMIT ?
+        ''', (team_id, start_date, end_date, limit))
+    else:
+        cursor.execute('''
+            SELECT date, employee_name FROM schedules
+            WHERE team_id = ? AND employee_name = ? AND date BETWEEN ? AND ?
+            ORDER BY date LIMIT ?
+        ''', (team_id, employee, start_date, end_date, limit))
+    results = cursor.fetchall()
+    
+    conn.close()
+    return results
+
+def fairness_ledger_deltas(old_schedule, new_schedule, preferences):
+    """
+    Berechnet die Ledger-Buchungen für die Unterschiede zwischen altem und neuem Plan.
+    
+    Neue Schichten werden gutgeschrieben, ersetzte Schichten abgezogen. Tage, die im neuen Plan
+    fehlen, werden nur abgezogen, wenn sie in der Zukunft liegen - vergangene Schichten bleiben
+    als geleistete Arbeit im Ledger. Feiertage werden wie in der Statistik nicht gezählt.
+    
+    Returns:
+        Liste von (Name, Schichten, 1. Wahl, ..., 5. Wahl, kein Wunsch) als Differenzen
+    """
+    ordinals, old_names, new_names = schedule_change_arrays(old_schedule, new_schedule)
+    if len(ordinals) == 0:
+        return []
+    
+    days = [date.fromordinal(int(ordinal)) for ordinal in ordinals]
+    today_ordinal = datetime.now().date().toordinal()
+    
+    # Wunsch-Ränge nach den aktuellen Präferenzen des Teams
+    employees = sorted((set(old_names) | set(new_names)) - {None})
+    employee_index = {emp: i for i, emp in enumerate(employees)}
+    rank_matrix = build_rank_matrix({emp: preferences.get(emp, []) for emp in employees}, days)
+    
+    # Deltas je Person: [Schichten, 1. Wahl, ..., 5. Wahl, kein Wunsch]
+    deltas = defaultdict(lambda: [0] * (1 + len(PRIORITY_KEYS)))
+    for column, (day, old_name, new_name) in enumerate(zip(days, old_names, new_names)):
+        if is_holiday_berlin(day):
+            continue
+        if new_name is not None:
+            delta = deltas[new_name]
+            delta[0] += 1
+            delta[1 + rank_matrix[employee_index[new_name], column]] += 1
+        if old_name is not None and (new_name is not None or ordinals[column] >= today_ordinal):
+            delta = deltas[old_name]
+            delta[0] -= 1
+            delta[1 + rank_matrix[employee_index[old_name], column]] -= 1
+    
+    return [(name, *delta) for name, delta in deltas.items() if any(delta)]
+
+def apply_fairness_ledger_deltas(cursor, team_id, ledger_rows):
+    """Bucht vorberechnete Ledger-Differenzen (siehe fairness_ledger_deltas) innerhalb der laufenden Schreibtransaktion"""
+    cursor.executemany('''
+        INSERT INTO fairness_ledger (team_id, name, shifts, wish_first, wish_second, wish_third, wish_fourth, wish_fifth, wish_none)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(team_id, name) DO UPDATE SET
+            shifts = shifts + excluded.shifts,
+            wish_first = wish_first + excluded.wish_first,
+            wish_second = wish_second + excluded.wish_second,
+            wish_third = wish_third + excluded.wish_third,
+            wish_fourth = wish_fourth + excluded.wish_fourth,
+            wish_fifth = wish_fifth + excluded.wish_fifth,
+            wish_none = wish_none + excluded.wish_none,
+            updated_at = CURRENT_TIMESTAMP
+    ''', [(team_id, *row) for row in ledger_rows])
+
+def load_fairness_ledger(team_id):
+    """Lädt das Fairness-Ledger eines Teams: {Name: {'shifts': n, 'first': n, ..., 'none': n}}"""
+    return fetch_fairness_ledger(team_id, get_change_counter(team_id, 'schedule'))
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def fetch_fairness_ledger(team_id, change_counter):
+    """Liest das Fairness-Ledger aus der Datenbank (ändert sich nur zusammen mit dem Plan)"""
+    conn = sqlite3.connect('schichtplaner.db')
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT name, shifts, wish_first, wish_second, wish_third, wish_fourth, wish_fifth, wish_none
+        FROM fairness_ledger WHERE team_id = ? ORDER BY name ASC
+    ''', (team_id,))
+    results = cursor.fetchall()
+    
+    conn.close()
+    return {name: dict(zip(['shifts'] + PRIORITY_KEYS, counts)) for name, *counts in results}
+
+def ledger_carry_over(ledger, stored_schedule, start_date):
+    """
+    Bisherige Schichten je Person aus dem Fairness-Ledger als Übertrag für eine Neuplanung ab start_date.
+    
+    Das Ledger enthält bereits alle Tage des gespeicherten Plans, auch zukünftige. Diese Tage werden
+    beim Speichern ab start_date (bzw. ab heute) ersetzt und deshalb hier abgezogen - sonst zählten
+    sie einmal als Übertrag und ein zweites Mal als neue Schichten.
+    """
+    carry_over = {name: counts['shifts'] for name, counts in ledger.items()}
+    cutoff = date.fromordinal(min(start_date.toordinal(), datetime.now().date().toordinal()))
+    for day, name in as_compact_schedule(stored_schedule).between(cutoff, date.max).iter_days():
+        if name in carry_over and not is_holiday_berlin(day):
+            carry_over[name] -= 1
+    return carry_over
+
+def archive_schedule_years(team_id, before_year, expected_version=None):
+    """
+    Verschiebt alle Planjahre vor before_year aus der Tabelle schedules in das komprimierte Archiv.
+    
+    Je Jahr wird ein CompactSchedule-Block gespeichert (bereits archivierte Jahre werden ergänzt),
+    die aktive Tabelle bleibt so unabhängig vom Alter des Teams klein. Das Fairness-Ledger bleibt
+    unverändert, da vergangene Schichten dort ohnehin erhalten bleiben. Die Team-Version wird erhöht,
+    damit veraltete Sitzungen die archivierten Tage nicht erneut speichern (mit expected_version
+    wird nur archiviert, wenn das Team seit diesem Stand nicht geändert wurde).
+    
+    Returns:
+        Tuple (Anzahl der archivierten Schichttage, neue Team-Version oder None, wenn nichts archiviert wurde)
+    """
+    cutoff = f"{before_year:04d}-01-01"
+    
+    def job(cursor):
+        cursor.execute('SELECT date, employee_name FROM schedules WHERE team_id = ? AND date < ? ORDER BY date', (team_id, cutoff))
+        rows = cursor.fetchall()
+        if not rows:
+            return 0, None
+        
+        new_version = bump_team_version(cursor, team_id, expected_version)
+        bump_change_counter(cursor, team_id, 'schedule')
+        
+        rows_by_year = defaultdict(list)
+        for date_str, employee_name in rows:
+            rows_by_year[int(date_str[:4])].append((date_str, employee_name))
+        
+        for year, year_rows in rows_by_year.items():
+            year_schedule = CompactSchedule.from_rows(year_rows)
+            cursor.execute('SELECT start_ordinal, names, assignments FROM schedule_archive WHERE team_id = ? AND year = ?', (team_id, year))
+            archived = cursor.fetchone()
+            if archived:
+                year_schedule = CompactSchedule.merge(CompactSchedule.from_blob(*archived), year_schedule)
+            cursor.execute('''
+                INSERT OR REPLACE INTO schedule_archive (team_id, year, start_ordinal, names, assignments, shift_count)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (team_id, year, *year_schedule.to_blob(), len(year_schedule)))
+        
+        cursor.execute('DELETE FROM schedules WHERE team_id = ? AND date < ?', (team_id, cutoff))
+        return len(rows), new_version
+    
+    return get_database_writer().execute(job)
+
+def list_archived_years(team_id):
+    """Listet die archivierten Planjahre eines Teams: [(Jahr, Schichttage, archiviert am)]"""
+    conn = sqlite3.connect('schichtplaner.db')
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT year, shift_count, archived_at FROM schedule_archive WHERE team_id = ? ORDER BY year', (team_id,))
+    results = cursor.fetchall()
+    
+    conn.close()
+    return results
+
+def load_schedule_archive(team_id):
+    """Lädt alle archivierten Planjahre eines Teams als ein CompactSchedule (z.B. für Statistiken)"""
+    return fetch_schedule_archive(team_id, get_change_counter(team_id, 'schedule'))
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def fetch_schedule_archive(team_id, change_counter):
+    """Liest und entpackt das Plan-Archiv (change_counter dient nur als Cache-Schlüssel)"""
+    conn = sqlite3.connect('schichtplaner.db')
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT start_ordinal, names, assignments FROM schedule_archive WHERE team_id = ? ORDER BY year', (team_id,))
+    results = cursor.fetchall()
+    
+    conn.close()
+    return CompactSchedule.merge(*(CompactSchedule.from_blob(*row) for row in results))
+
+def backup_database(target_path, progress=None):
+    """
+    Erstellt eine Online-Sicherung der Datenbank über die SQLite-Backup-API.
+    
+    Die Kopie entsteht in einem einzigen Lesevorgang: im WAL-Modus blockiert das weder Leser
+    noch den Schreib-Thread, und die Sicherung zeigt einen konsistenten Stand. Schrittweises
+    Kopieren würde bei jedem Commit eines anderen Verbindungsobjekts neu beginnen.
+    
+    Args:
+        target_path: Zieldatei (wird überschrieben)
+        progress: Optionaler Callback progress(status, verbleibende Seiten, Seiten gesamt)
+    
+    Returns:
+        Größe der Sicherung in Bytes
+    """
+    source = sqlite3.connect('schichtplaner.db')
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, progress=progress)
+        # Sicherung als einzelne, eigenständige Datei (ohne -wal/-shm beim späteren Öffnen)
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+        source.close()
+    return os.path.getsize(target_path)
+
+def create_database_backup():
+    """Legt eine Sicherung in BACKUP_DIR an, löscht die ältesten über BACKUP_KEEP hinaus und gibt den Pfad zurück"""
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    target_path = os.path.join(BACKUP_DIR, f"schichtplaner_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.db")
+    backup_database(target_path)
+    
+    backups = sorted(name for name in os.listdir(BACKUP_DIR) if name.startswith('schichtplaner_') and name.endswith('.db'))
+    for name in backups[:-BACKUP_KEEP]:
+        os.remove(os.path.join(BACKUP_DIR, name))
+    return target_path
+
+def save_unavailability(name, unavail_type, team_id, date=None, weekday=None, reason="", end_date=None, rule=None):
+    """Speichert Urlaub (Zeitraum date bis end_date, inklusive), Wochentag-Nichtverfügbarkeit oder eine wiederkehrende Regel (dict) für ein bestimmtes Team"""
+    rule_json = json.dumps(rule, ensure_ascii=False) if rule is not None else None
+    if unavail_type == "urlaub" and end_date is None:
+        end_date = date
+    
+    def job(cursor):
+        cursor.execute('''
+            INSERT INTO unavailability (team_id, name, type, date, end_date, weekday, reason, rule)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (team_id, name, unavail_type, date, end_date, weekday, reason, rule_json))
+        bump_change_counter(cursor, team_id, 'unavailability')
+    
+    get_database_writer().execute(job)
+
+def load_unavailability(team_id):
+    """Lädt alle Urlaubs- und Nichtverfügbarkeitseinträge (name, type, date, end_date, weekday, reason, rule) für ein bestimmtes Team (alphabetisch sortiert)"""
+    return fetch_unavailability(team_id, get_change_counter(team_id, 'unavailability'))
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def fetch_unavailability(team_id, change_counter):
+    """Liest die Nichtverfügbarkeiten aus der Datenbank (change_counter dient nur als Cache-Schlüssel)"""
+    conn = sqlite3.connect('schichtplaner.db')
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT name, type, date, end_date, weekday, reason, rule FROM unavailability WHERE team_id = ? ORDER BY name, date, weekday', (team_id,))
+    results = cursor.fetchall()
+    
+    conn.close()
+    return results
+
+def list_unavailability(team_id, after=None, limit=UNAVAILABILITY_PAGE_SIZE):
+    """
+    Listet Nichtverfügbarkeiten seitenweise mit stabiler ID (Keyset-Pagination über den Listen-Index).
+    
+    Args:
+        team_id: ID des Teams
+        after: Sortierschlüssel (name, date, id) des letzten Eintrags der Vorseite oder None für die erste Seite
+        limit: Maximale Anzahl Einträge
+    
+    Returns:
+        Liste von (id, name, type, date, end_date, weekday, reason, rule), sortiert nach Name, Datum, ID
+    """
+    conn = sqlite3.connect('schichtplaner.db')
+    cursor = conn.cursor()
+    
+    if after is None:
+        cursor.execute('''
+            SELECT id, name, type, date, end_date, weekday, reason, rule FROM unavailability
+            WHERE team_id = ?
+            ORDER BY name, COALESCE(date, ''), id LIMIT ?
+        ''', (team_id, limit))
+    else:
+        cursor.execute('''
+            SELECT id, name, type, date, end_date, weekday, reason, rule FROM unavailability
+            WHERE team_id = ? AND (name, COALESCE(date, ''), id) > (?, ?, ?)
+            ORDER BY name, COALESCE(date, ''), id LIMIT ?
+        ''', (team_id, after[0], after[1] or '', after[2], limit))
+    results = cursor.fetchall()
+    
+    conn.close()
+    return results
+
+def count_unavailability(team_id):
+    """Zählt die Nichtverfügbarkeiten eines Teams"""
+    conn = sqlite3.connect('schichtplaner.db')
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT COUNT(*) FROM unavailability WHERE team_id = ?', (team_id,))
+    result = cursor.fetchone()
+    
+    conn.close()
+    return result[0]
+
+def delete_unavailability_entries(entry_ids, team_id):
+    """Löscht mehrere Einträge per Primärschlüssel in einer Transaktion (nur Einträge des Teams); gibt die Anzahl zurück"""
+    def job(cursor):
+        cursor.executemany('DELETE FROM unavailability WHERE id = ? AND team_id = ?',
+                           [(entry_id, team_id) for entry_id in entry_ids])
+        deleted = cursor.rowcount
+        if deleted:
+            bump_change_counter(cursor, team_id, 'unavailability')
+        return deleted
+    
+    return get_database_writer().execute(job)
+
+def get_unavailability_by_id(entry_id):
+    """Holt einen spezifischen Urlaubs-/Nichtverfügbarkeitseintrag"""
+    conn = sqlite3.connect('schichtplaner.db')
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT id, name, type, date, end_date, weekday, reason, rule FROM unavailability WHERE id = ?', (entry_id,))
+    result = cursor.fetchone()
     
-    conn.commit()
     conn.close()
+    return result
+
+def load_coverage_index(team_id):
+    """Lädt den Einspring-Index (CoverageIndex) des Teams für den gespeicherten Plan"""
+    return fetch_coverage_index(
+        team_id,
+        get_change_counter(team_id, 'preferences'),
+        get_change_counter(team_id, 'schedule'),
+        get_change_counter(team_id, 'unavailability')
+    )
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def fetch_coverage_index(team_id, preferences_counter, schedule_counter, unavailability_counter):
+    """Baut den Einspring-Index (die Zähler dienen nur als Cache-Schlüssel)"""
+    return CoverageIndex.build(
+        load_preferences(team_id),
+        load_schedule(team_id),
+        load_unavailability(team_id),
+        load_vacation_index(team_id)
+    )
+
+# Session-Management für 90-Tage Passwort-Speicherung
+class SessionTokenCache:
+    """
+    Prozessweiter Cache geprüfter Session-Tokens mit ihrem Ablaufzeitpunkt.
+    
+    Ein einmal in der Datenbank gefundener Token wird bis zum Ablauf ohne weitere Abfrage
+    bestätigt; abgelaufene Einträge werden beim Zugriff bzw. vom Session-Cleanup entfernt.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.expiry = {}
+    
+    def is_valid(self, token):
+        """True, wenn der Token im Cache liegt und noch nicht abgelaufen ist"""
+        with self.lock:
+            expires_at = self.expiry.get(token)
+            if expires_at is None:
+                return False
+            if expires_at <= datetime.now():
+                del self.expiry[token]
+                return False
+            return True
+    
+    def add(self, token, expires_at):
+        with self.lock:
+            self.expiry[token] = expires_at
+    
+    def prune(self):
+        """Entfernt abgelaufene Tokens aus dem Cache"""
+        now = datetime.now()
+        with self.lock:
+            for token in [token for token, expires_at in self.expiry.items() if expires_at <= now]:
+                del self.expiry[token]
+
+@st.cache_resource
+def get_session_token_cache():
+    """Prozessweiter Token-Cache (überlebt Streamlit-Reruns und wird von allen Sitzungen geteilt)"""
+    return SessionTokenCache()
+
+def create_session_token():
+    """Erstellt einen neuen Session-Token"""
+    return str(uuid.uuid4())
+
+def save_login_session(token):
+    """Speichert einen Login-Session-Token für 90 Tage"""
+    expires_at = datetime.now() + timedelta(days=90)
+    
+    get_database_writer().execute(lambda cursor: cursor.execute('''
+        INSERT INTO login_sessions (session_token, expires_at)
+        VALUES (?, ?)
+    ''', (token, expires_at)))
+    get_session_token_cache().add(token, expires_at)
 
 def is_valid_session_token(token):
-    """Prüft ob ein Session-Token noch gültig ist"""
+    """Prüft ob ein Session-Token noch gültig ist (Datenbank nur beim ersten Prüfen im Prozess)"""
     if not token:
         return False
-        
+    
+    token_cache = get_session_token_cache()
+    if token_cache.is_valid(token):
+        return True
+    
     try:
         conn = sqlite3.connect('schichtplaner.db')
         cursor = conn.cursor()
         
-        # Prüfe ob Tabelle existiert
-        cursor.execute('''
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name='login_sessions'
-        ''')
-        
-        if not cursor.fetchone():
-            conn.close()
-            return False
-        
         cursor.execute('''
             SELECT expires_at FROM login_sessions 
             WHERE session_token = ? AND expires_at > datetime('now')
@@ -349,31 +1620,39 @@ def is_valid_session_token(token):
         
         result = cursor.fetchone()
         conn.close()
-        
-        return result is not None
     except sqlite3.Error:
         return False
+    
+    if result is None:
+        return False
+    token_cache.add(token, datetime.fromisoformat(result[0]))
+    return True
 
-def cleanup_expired_sessions():
-    """Entfernt abgelaufene Session-Tokens"""
+def cleanup_expired_sessions(token_cache=None, writer=None):
+    """Entfernt abgelaufene Session-Tokens aus der Datenbank und dem Token-Cache (writer: für Aufrufe außerhalb des Skript-Threads)"""
     try:
-        conn = sqlite3.connect('schichtplaner.db')
-        cursor = conn.cursor()
-        
-        # Prüfe ob Tabelle existiert
-        cursor.execute('''
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name='login_sessions'
-        ''')
-        
-        if cursor.fetchone():
-            cursor.execute('DELETE FROM login_sessions WHERE expires_at <= datetime("now")')
-            conn.commit()
-        
-        conn.close()
+        (writer or get_database_writer()).execute(
+            lambda cursor: cursor.execute('DELETE FROM login_sessions WHERE expires_at <= datetime("now")')
+        )
     except sqlite3.Error:
-        # Fehler beim Cleanup ignorieren - Tabelle existiert möglicherweise noch nicht
+        # Fehler beim Cleanup ignorieren (z.B. gesperrte Datenbank) - der nächste Lauf holt es nach
         pass
+    
+    if token_cache is not None:
+        token_cache.prune()
+
+def start_session_cleanup(token_cache, interval=SESSION_CLEANUP_INTERVAL):
+    """Startet den Hintergrund-Thread, der alle interval Sekunden abgelaufene Sessions entfernt (über den DatabaseWriter)"""
+    writer = get_database_writer()
+    
+    def run():
+        while True:
+            time.sleep(interval)
+            cleanup_expired_sessions(token_cache, writer)
+    
+    thread = threading.Thread(target=run, name="schichtplaner-session-cleanup", daemon=True)
+    thread.start()
+    return thread
 
 # PDF-Generation-Funktionen
 def calculate_statistics_from_schedule(schedule_data, team_id=None):
@@ -391,48 +1670,42 @@ def calculate_statistics_from_schedule(schedule_data, team_id=None):
     
     # Initialisiere Zähler
     assignment_count = defaultdict(int)
-    preference_stats = defaultdict(lambda: {'first': 0, 'second': 0, 'third': 0, 'fourth': 0, 'fifth': 0, 'none': 0})
+    preference_stats = defaultdict(lambda: {key: 0 for key in PRIORITY_KEYS})
     
-    weekday_names = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag']
+    # Sammle alle Schichten (fehlerhafte Daten zählen als 'none')
+    if isinstance(schedule_data, CompactSchedule):
+        valid_schedule = schedule_data
+    else:
+        valid_schedule = {}
+        for date_str, employee in schedule_data.items():
+            try:
+                datetime.strptime(date_str, '%Y-%m-%d')
+                valid_schedule[date_str] = employee
+            except ValueError:
+                # Fehlerhafte Daten ignorieren
+                preference_stats[employee]['none'] += 1
     
-    # Durchlaufe alle Schichten und zähle (aber schließe Feiertage aus)
-    for date_str, employee in schedule_data.items():
-        try:
-            date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-            
-            # Überspringe Feiertage bei der Statistik-Berechnung
-            if is_holiday_berlin(date_obj):
+    if valid_schedule:
+        # Bewertung in einem Durchlauf (Feiertage werden dabei nicht mitgezählt)
+        employees, metrics = evaluate_schedule(valid_schedule, preferences)
+        for emp, count, emp_histogram in zip(employees, metrics['shift_counts'], metrics['employee_rank_histogram']):
+            if count == 0:
                 continue
-                
-            # Zähle Schichten
-            assignment_count[employee] += 1
-            
-            # Bestimme Wochentag
-            weekday_name = weekday_names[date_obj.weekday()]
-            
-            # Prüfe Wunscherfüllung
-            if employee in preferences and weekday_name in preferences[employee]:
-                priority_index = preferences[employee].index(weekday_name)
-                if priority_index == 0:  # 1. Wahl
-                    preference_stats[employee]['first'] += 1
-                elif priority_index == 1:  # 2. Wahl
-                    preference_stats[employee]['second'] += 1
-                elif priority_index == 2:  # 3. Wahl
-                    preference_stats[employee]['third'] += 1
-                elif priority_index == 3:  # 4. Wahl
-                    preference_stats[employee]['fourth'] += 1
-                elif priority_index == 4:  # 5. Wahl
-                    preference_stats[employee]['fifth'] += 1
-            else:
-                preference_stats[employee]['none'] += 1
-        except (ValueError, IndexError):
-            # Fehlerhafte Daten ignorieren
-            preference_stats[employee]['none'] += 1
+            assignment_count[emp] += int(count)
+            for key, rank_count in zip(PRIORITY_KEYS, emp_histogram):
+                preference_stats[emp][key] += int(rank_count)
     
     return dict(assignment_count), dict(preference_stats)
 
 def generate_pdf_report(schedule_data, title, weeks_data, include_statistics=False, team_id=None):
     """Generiert ein PDF-Report des Schichtplans mit optionalen Statistiken"""
+    # ReportLab erst beim ersten PDF laden (nicht beim Kaltstart)
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=20, leftMargin=20, topMargin=30, bottomMargin=30)
     
@@ -604,157 +1877,936 @@ def generate_pdf_report(schedule_data, title, weeks_data, include_statistics=Fal
     return buffer
 
 def get_current_and_next_weeks(schedule_data, num_weeks=4):
-    """Holt die aktuelle und nächsten n Kalenderwochen"""
-    current_date = datetime.now()
-    current_year, current_week, _ = current_date.isocalendar()
-    
-    target_weeks = []
-    for i in range(num_weeks):
-        week_num = current_week + i
-        year = current_year
-        
-        # Handle year rollover
-        if week_num > 52:
-            week_num = week_num - 52
-            year += 1
-        
-        target_weeks.append((year, week_num))
-    
-    # Filter schedule data for target weeks
-    filtered_data = {}
-    for date_str, employee in schedule_data.items():
-        date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-        year, week, _ = date_obj.isocalendar()
-        
-        if (year, week) in target_weeks:
-            filtered_data[date_str] = employee
+    """Holt die aktuelle und nächsten n Kalenderwochen (als CompactSchedule)"""
+    today = datetime.now().date()
+    week_start = today - timedelta(days=today.weekday())
+    week_end = week_start + timedelta(days=7 * num_weeks - 1)
     
-    return filtered_data
+    return as_compact_schedule(schedule_data).between(week_start, week_end)
 
-# Schichtplanungsalgorithmus
-def generate_fair_schedule(preferences, team_id, start_date=None, end_date=None, year=2025):
+# Urlaubsindex (Zeiträume je Mitarbeiter)
+class VacationIndex:
     """
-    Generiert einen fairen Schichtplan mit User-für-User Rotation:
-    1. Jeder Mitarbeiter kommt nacheinander dran (Round-Robin)
-    2. Jedem wird der bestmögliche verfügbare Tag zugeteilt (vorzugsweise 1. Wunsch)
-    3. Garantiert gleichmäßige Verteilung und maximale Wunscherfüllung
+    Intervallindex über die Urlaubszeiträume eines Teams.
     
-    Args:
-        preferences: Dictionary mit Mitarbeiter-Präferenzen
-        team_id: ID des Teams
-        start_date: Startdatum (datetime object) - überschreibt year Parameter
-        end_date: Enddatum (datetime object) - überschreibt year Parameter  
-        year: Jahr für Generierung (nur verwendet wenn start_date/end_date nicht gesetzt)
+    Je Mitarbeiter werden die Zeiträume als sortierte, zusammengeführte und überschneidungsfreie
+    Intervalle [Start, Ende] (Datums-Ordinale, inklusive) gehalten. Damit sind "ist X am Tag D
+    abwesend" und "wer fehlt im Zeitraum [A, B]" per Binärsuche in O(log n) je Mitarbeiter lösbar.
     """
-    # Bestimme Zeitraum
-    if start_date is None or end_date is None:
-        # Fallback auf Jahr-Parameter
-        start_date = datetime(year, 1, 1)
-        end_date = datetime(year, 12, 31)
     
-    # Erstelle Liste aller Arbeitstage im Zeitraum (Mo-Fr, ohne Feiertage)
+    def __init__(self, intervals_by_name=None):
+        self.starts = {}
+        self.ends = {}
+        for name, intervals in (intervals_by_name or {}).items():
+            merged = []
+            for start, end in sorted(intervals):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self.starts[name] = [start for start, _ in merged]
+            self.ends[name] = [end for _, end in merged]
     
-    available_days = []
-    current_date = start_date
-    while current_date <= end_date:
-        if current_date.weekday() < 5:  # Montag = 0, Freitag = 4
-            # Prüfe, ob es kein Feiertag in Berlin ist
-            if not is_holiday_berlin(current_date):
-                available_days.append(current_date)
-        current_date += timedelta(days=1)
+    @classmethod
+    def from_entries(cls, unavailability_entries):
+        """Baut den Index aus Einträgen von load_unavailability()"""
+        intervals_by_name = defaultdict(list)
+        for name, entry_type, date_str, end_date_str, weekday, reason, rule in unavailability_entries:
+            if entry_type == "urlaub" and date_str:
+                start = datetime.strptime(date_str, '%Y-%m-%d').toordinal()
+                end = datetime.strptime(end_date_str, '%Y-%m-%d').toordinal() if end_date_str else start
+                intervals_by_name[name].append((start, max(start, end)))
+        return cls(intervals_by_name)
+    
+    def intervals(self, name):
+        """Zusammengeführte Urlaubszeiträume eines Mitarbeiters als Liste von (date, date)"""
+        return [(date.fromordinal(start), date.fromordinal(end))
+                for start, end in zip(self.starts.get(name, []), self.ends.get(name, []))]
     
+    def overlaps(self, name, start_ordinal, end_ordinal):
+        """Überschneidet sich ein Urlaub des Mitarbeiters mit [start_ordinal, end_ordinal]?"""
+        ends = self.ends.get(name)
+        if not ends:
+            return False
+        position = bisect.bisect_left(ends, start_ordinal)  # Erstes Intervall, das nicht vor dem Zeitraum endet
+        return position < len(ends) and self.starts[name][position] <= end_ordinal
     
+    def absent_between(self, start, end):
+        """Alphabetisch sortierte Namen aller Mitarbeiter mit Urlaub im Zeitraum [start, end]"""
+        start_ordinal, end_ordinal = start.toordinal(), end.toordinal()
+        return sorted(name for name in self.ends if self.overlaps(name, start_ordinal, end_ordinal))
     
-    # Initialisiere Zähler
-    employees = list(preferences.keys())
-    assignment_count = {emp: 0 for emp in employees}
-    preference_stats = {emp: {'first': 0, 'second': 0, 'third': 0, 'fourth': 0, 'fifth': 0, 'none': 0} for emp in employees}
-    schedule = {}
+    def mask(self, employees, day_ordinals):
+        """bool-Matrix Mitarbeiter × Tag (Spalten = day_ordinals in beliebiger Reihenfolge)"""
+        day_ordinals = np.asarray(day_ordinals)
+        order = np.argsort(day_ordinals, kind='stable')
+        sorted_ordinals = day_ordinals[order]
+        
+        sorted_mask = np.zeros((len(employees), len(day_ordinals)), dtype=bool)
+        for row, name in enumerate(employees):
+            starts = self.starts.get(name)
+            if not starts:
+                continue
+            first_columns = np.searchsorted(sorted_ordinals, starts, side='left')
+            last_columns = np.searchsorted(sorted_ordinals, self.ends[name], side='right')
+            for first, last in zip(first_columns, last_columns):
+                sorted_mask[row, first:last] = True
+        
+        mask = np.empty_like(sorted_mask)
+        mask[:, order] = sorted_mask
+        return mask
+
+def load_vacation_index(team_id):
+    """Urlaubsindex eines Teams (neu aufgebaut nur, wenn sich die Nichtverfügbarkeiten geändert haben)"""
+    return fetch_vacation_index(team_id, get_change_counter(team_id, 'unavailability'))
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def fetch_vacation_index(team_id, change_counter):
+    """Baut den Urlaubsindex aus den gespeicherten Einträgen (change_counter dient nur als Cache-Schlüssel)"""
+    return VacationIndex.from_entries(load_unavailability(team_id))
+
+# Kostenmatrix (Mitarbeiter × Tag)
+def build_preference_ranks(preferences):
+    """Erstellt die int8-Rangtabelle Mitarbeiter × Wochentag (Mo-So), 0 = 1. Wahl, RANK_NONE = kein Wunsch"""
+    weekday_ranks = np.full((len(preferences), 7), RANK_NONE, dtype=np.int8)
     
-    # Wochentag-Namen für Zuordnung
-    weekday_names = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag']
+    for emp_index, preferred_days in enumerate(preferences.values()):
+        for rank, day in enumerate(preferred_days[:RANK_NONE]):
+            day_index = WEEKDAY_NAMES.index(day) if day in WEEKDAY_NAMES else None
+            # Nur das erste Vorkommen zählt (entspricht list.index)
+            if day_index is not None and weekday_ranks[emp_index, day_index] == RANK_NONE:
+                weekday_ranks[emp_index, day_index] = rank
     
-    # Round-Robin durch alle Mitarbeiter
-    employee_index = 0
+    return weekday_ranks
+
+def evaluate_unavailability_rule(rule, day_ordinals):
+    """
+    Wertet eine wiederkehrende Regel für die gegebenen Tage aus.
     
-    while available_days:
-        current_employee = employees[employee_index]
-        
-        # Finde den besten verfügbaren Tag für diesen Mitarbeiter
-        best_day = None
-        best_priority = 6  # Schlechter als alle Prioritäten (1-5)
-        
-        # Durchsuche verfügbare Tage nach bestem Match
-        for day in available_days:
-            # Prüfe ob Mitarbeiter an diesem Tag verfügbar ist
-            if is_employee_unavailable(current_employee, day, team_id):
-                continue  # Überspringe Urlaubs-/Nichtverfügbarkeitstage
-                
-            weekday_name = weekday_names[day.weekday()]
-            
-            if weekday_name in preferences[current_employee]:
-                # Tag ist in den Präferenzen - bestimme Priorität
-                priority = preferences[current_employee].index(weekday_name) + 1  # 1-5
-                if priority < best_priority:
-                    best_priority = priority
-                    best_day = day
+    Vollständig vektorisiert und linear in der Anzahl der Tage; unbekannte oder unvollständige
+    Regeln sperren keinen Tag.
+    
+    Args:
+        rule: Dictionary mit 'kind' (siehe UNAVAILABILITY_RULE_KINDS) und den Parametern des Musters
+        day_ordinals: int-Array mit Datums-Ordinalen
+    
+    Returns:
+        bool-Array (True = gesperrt)
+    """
+    day_ordinals = np.asarray(day_ordinals, dtype=np.int64)
+    day_weekdays = (day_ordinals - 1) % 7  # Ordinal 1 (01.01.0001) ist ein Montag
+    blocked = np.zeros(len(day_ordinals), dtype=bool)
+    
+    try:
+        kind = rule.get('kind')
+        if kind == 'every_nth_week':
+            weekday = WEEKDAY_NAMES.index(rule['weekday'])
+            interval = max(1, int(rule.get('interval', 1)))
+            anchor = datetime.strptime(rule['anchor'], '%Y-%m-%d').toordinal()
+            anchor += (weekday - (anchor - 1) % 7) % 7  # Erstes Vorkommen des Wochentags ab dem Startdatum
+            weeks_since_anchor = (day_ordinals - anchor) // 7
+            blocked = (day_weekdays == weekday) & (day_ordinals >= anchor) & (weeks_since_anchor % interval == 0)
+        elif kind == 'nth_weekday_of_month':
+            weekday = WEEKDAY_NAMES.index(rule['weekday'])
+            nth = int(rule['nth'])
+            days64 = (day_ordinals - EPOCH_ORDINAL).astype('datetime64[D]')
+            month_starts = days64.astype('datetime64[M]')
+            day_of_month = (days64 - month_starts.astype('datetime64[D]')).astype(np.int64) + 1
+            if nth > 0:
+                occurrence = (day_of_month - 1) // 7 + 1 == nth
             else:
-                # Tag ist nicht in Präferenzen - nur nehmen wenn nichts besseres da ist
-                if best_priority == 6:
-                    best_day = day
-        
-        # Falls kein Tag gefunden, suche nach anderen Mitarbeitern oder überspringe
-        if best_day is None:
-            # Wenn kein Tag für diesen Mitarbeiter verfügbar ist, überspringe ihn
-            employee_index = (employee_index + 1) % len(employees)
+                month_lengths = ((month_starts + 1).astype('datetime64[D]') - month_starts.astype('datetime64[D]')).astype(np.int64)
+                occurrence = day_of_month + 7 > month_lengths  # Letztes Vorkommen im Monat
+            blocked = (day_weekdays == weekday) & occurrence
+        elif kind == 'weekdays_in_range':
+            weekdays = [WEEKDAY_NAMES.index(name) for name in rule['weekdays']]
+            start = datetime.strptime(rule['start'], '%Y-%m-%d').toordinal()
+            end = datetime.strptime(rule['end'], '%Y-%m-%d').toordinal()
+            blocked = np.isin(day_weekdays, weekdays) & (day_ordinals >= start) & (day_ordinals <= end)
+    except (KeyError, ValueError, TypeError, AttributeError):
+        return np.zeros(len(day_ordinals), dtype=bool)
+    
+    return blocked
+
+def describe_unavailability_rule(rule_json):
+    """Lesbare Beschreibung einer gespeicherten Regel (JSON)"""
+    try:
+        rule = json.loads(rule_json)
+        kind = rule.get('kind')
+        if kind == 'every_nth_week':
+            interval = int(rule.get('interval', 1))
+            anchor = datetime.strptime(rule['anchor'], '%Y-%m-%d').strftime('%d.%m.%Y')
+            every_text = "Jeden" if interval == 1 else ("Jeden zweiten" if interval == 2 else f"Jeden {interval}.")
+            return f"{every_text} {rule['weekday']} ab {anchor}"
+        if kind == 'nth_weekday_of_month':
+            nth = int(rule['nth'])
+            nth_text = "Letzter" if nth < 0 else f"{nth}."
+            return f"{nth_text} {rule['weekday']} im Monat"
+        if kind == 'weekdays_in_range':
+            start = datetime.strptime(rule['start'], '%Y-%m-%d').strftime('%d.%m.%Y')
+            end = datetime.strptime(rule['end'], '%Y-%m-%d').strftime('%d.%m.%Y')
+            return f"{', '.join(rule['weekdays'])} vom {start} bis {end}"
+    except (KeyError, ValueError, TypeError, AttributeError):
+        pass
+    return "Ungültige Regel"
+
+def build_unavailability_mask(employees, days, unavailability_entries):
+    """Erstellt eine bool-Matrix Mitarbeiter × Tag (True = Urlaub, Wochentag-Sperre oder wiederkehrende Regel)"""
+    mask = np.zeros((len(employees), len(days)), dtype=bool)
+    if not unavailability_entries or not days:
+        return mask
+    
+    employee_index = {emp: i for i, emp in enumerate(employees)}
+    day_ordinals = np.fromiter((day.toordinal() for day in days), dtype=np.int64, count=len(days))
+    day_weekdays = np.fromiter((day.weekday() for day in days), dtype=np.int8, count=len(days))
+    
+    # Urlaub: Zeiträume über den Intervallindex
+    mask |= VacationIndex.from_entries(unavailability_entries).mask(employees, day_ordinals)
+    
+    for name, entry_type, date_str, end_date_str, weekday, reason, rule in unavailability_entries:
+        row = employee_index.get(name)
+        if row is None:
+            continue
+        if entry_type == "wochentag" and weekday in WEEKDAY_NAMES:
+            mask[row] |= day_weekdays == WEEKDAY_NAMES.index(weekday)
+        elif entry_type == "regel" and rule:
+            # Regeln werden erst hier für den konkreten Horizont ausgewertet (keine Zeile pro Tag)
+            mask[row] |= evaluate_unavailability_rule(json.loads(rule), day_ordinals)
+    
+    return mask
+
+def build_rank_matrix(preferences, days, unavailability_entries=None):
+    """
+    Baut die Kostenmatrix für einen Arbeitstag-Kalender.
+    
+    Args:
+        preferences: Dictionary mit Mitarbeiter-Präferenzen (Zeilenreihenfolge = Dictionary-Reihenfolge)
+        days: Liste von date/datetime-Objekten (Spalten)
+        unavailability_entries: Einträge aus load_unavailability() oder None
+    
+    Returns:
+        int8-Matrix [Mitarbeiter × Tag] mit Rang 0-4 (1.-5. Wahl), RANK_NONE für Tage ohne Wunsch
+        und RANK_UNAVAILABLE für Tage, an denen der Mitarbeiter nicht verfügbar ist
+    """
+    weekday_ranks = build_preference_ranks(preferences)
+    day_weekdays = np.fromiter((day.weekday() for day in days), dtype=np.int8, count=len(days))
+    rank_matrix = weekday_ranks[:, day_weekdays]
+    
+    if unavailability_entries:
+        mask = build_unavailability_mask(list(preferences.keys()), days, unavailability_entries)
+        rank_matrix[mask] = RANK_UNAVAILABLE
+    
+    return rank_matrix
+
+class CoverageIndex:
+    """
+    Wer kann einspringen: Wunsch-Rang, Verfügbarkeit und Auslastung aller Personen für jeden Tag des Plans.
+    
+    Wird einmal je Stand von Präferenzen, Plan und Nichtverfügbarkeiten aufgebaut (Matrizen
+    Person × Kalendertag), danach liefert candidates() die Rangliste für einen Tag ohne weitere Abfragen.
+    """
+    AVAILABLE = 0
+    REASONS = {1: "Urlaub", 2: "Wochentag-Sperre", 3: "Wiederkehrende Regel"}
+    
+    def __init__(self, employees, start_ordinal, weekday_ranks, reasons, loads, codes=None, holiday_mask=None):
+        self.employees = list(employees)
+        self.start_ordinal = int(start_ordinal)
+        self.weekday_ranks = weekday_ranks  # int8 [Person × Wochentag], 0 = 1. Wahl, RANK_NONE = kein Wunsch
+        self.reasons = reasons              # int8 [Person × Tag], 0 = verfügbar, sonst Schlüssel aus REASONS
+        self.loads = loads                  # Schichten je Person im Plan
+        day_count = reasons.shape[1]
+        self.weekdays = (np.arange(day_count, dtype=np.int64) + self.start_ordinal - 1) % 7
+        self.ranks = weekday_ranks[:, self.weekdays]
+        self.codes = codes if codes is not None else np.full(day_count, -1, dtype=np.int64)  # Person je Tag (-1 = keine/unbekannt)
+        self.holiday_mask = holiday_mask if holiday_mask is not None else np.zeros(day_count, dtype=bool)
+        
+        # Wochentag-Index: Plan-Tage mit Schicht je Wochentag (aufsteigend)
+        self.weekday_columns = [np.flatnonzero((self.codes >= 0) & (self.weekdays == weekday)) for weekday in range(7)]
+    
+    @classmethod
+    def build(cls, preferences, schedule, unavailability_entries=None, vacation_index=None):
+        """Baut den Index über den Zeitraum des Plans"""
+        employees = sorted(preferences)
+        schedule = as_compact_schedule(schedule)
+        day_count = len(schedule.assignments)
+        day_ordinals = np.arange(day_count, dtype=np.int64) + schedule.start_ordinal
+        days = [date.fromordinal(int(ordinal)) for ordinal in day_ordinals]
+        
+        weekday_ranks = build_preference_ranks({emp: preferences[emp] for emp in employees})
+        
+        # Gründe nach Vorrang: Urlaub vor Wochentag-Sperre vor Regel
+        entries = unavailability_entries or []
+        reasons = np.zeros((len(employees), day_count), dtype=np.int8)
+        for reason, entry_type in ((3, "regel"), (2, "wochentag")):
+            mask = build_unavailability_mask(employees, days, [entry for entry in entries if entry[1] == entry_type])
+            reasons[mask] = reason
+        if vacation_index is None:
+            vacation_index = VacationIndex.from_entries(entries)
+        reasons[vacation_index.mask(employees, day_ordinals)] = 1
+        
+        # Auslastung: Schichten je Person im gesamten Plan
+        employee_index = {emp: i for i, emp in enumerate(employees)}
+        code_map = np.array([employee_index.get(name, -1) for name in schedule.names] + [-1], dtype=np.int64)
+        codes = code_map[schedule.assignments]
+        loads = np.bincount(codes[codes >= 0], minlength=len(employees))
+        # Feiertage einmal je Jahr des Plans statt je Tag nachschlagen
+        holiday_years = range(days[0].year, days[-1].year + 1) if days else []
+        holiday_ordinals = [holiday.toordinal() for year in holiday_years for holiday in get_berlin_holidays(year)]
+        holiday_mask = np.isin(day_ordinals, np.array(holiday_ordinals, dtype=np.int64))
+        
+        return cls(employees, schedule.start_ordinal, weekday_ranks, reasons, loads, codes, holiday_mask)
+    
+    def candidates(self, day):
+        """
+        Rangliste für einen Tag: verfügbare Personen zuerst, dann nach Wunsch-Rang und Auslastung.
+        
+        Returns:
+            Liste von (Name, Rang, Schichten, Grund) - Grund ist None, wenn die Person verfügbar ist
+        """
+        column = day.toordinal() - self.start_ordinal
+        if not 0 <= column < self.ranks.shape[1]:
+            return []
+        ranks = self.ranks[:, column]
+        reasons = self.reasons[:, column]
+        order = np.lexsort((np.arange(len(self.employees)), self.loads, ranks, reasons != self.AVAILABLE))
+        return [
+            (self.employees[i], int(ranks[i]), int(self.loads[i]), self.REASONS.get(int(reasons[i])))
+            for i in order
+        ]
+    
+    def swap_partners(self, day, k=5, min_day=None):
+        """
+        Beste Tauschpartner für einen Plan-Tag: Tage, deren Tausch beide Wunsch-Ränge verbessert oder hält.
+        
+        Da der Wunsch-Rang nur vom Wochentag abhängt, werden nur die Wochentage durchsucht, an denen
+        die Person des Tages mindestens so gern arbeitet; dort prüfen Array-Vergleiche über den
+        Wochentag-Index alle Partner-Tage auf einmal (Rang der anderen Person, Verfügbarkeit beider,
+        Feiertage). Sortiert nach Rang-Gewinn, dann nach Nähe zum Tag.
+        
+        Args:
+            min_day: Frühester Partner-Tag (z.B. heute), None = ganzer Plan
+        
+        Returns:
+            Liste von bis zu k (date, Name, (Rang alt, Rang neu) der Person des Tages,
+            (Rang alt, Rang neu) der anderen Person)
+        """
+        column = day.toordinal() - self.start_ordinal
+        if not 0 <= column < len(self.codes) or self.codes[column] < 0:
+            return []
+        person = self.codes[column]
+        weekday = self.weekdays[column]
+        person_ranks = self.weekday_ranks[person]
+        first_column = max(0, min_day.toordinal() - self.start_ordinal) if min_day else 0
+        
+        found_columns = []
+        for partner_weekday in np.flatnonzero(person_ranks <= person_ranks[weekday]):
+            columns = self.weekday_columns[partner_weekday]
+            columns = columns[np.searchsorted(columns, first_column):]
+            partners = self.codes[columns]
+            keep = (
+                (partners != person)
+                & (self.weekday_ranks[partners, weekday] <= self.weekday_ranks[partners, partner_weekday])
+                & (self.reasons[person, columns] == self.AVAILABLE)
+                & (self.reasons[partners, column] == self.AVAILABLE)
+                & ~self.holiday_mask[columns]
+            )
+            found_columns.append(columns[keep])
+        
+        columns = np.concatenate(found_columns) if found_columns else np.zeros(0, dtype=np.int64)
+        if len(columns) == 0:
+            return []
+        partners = self.codes[columns]
+        partner_weekdays = self.weekdays[columns]
+        person_after = person_ranks[partner_weekdays].astype(np.int64)
+        partner_before = self.weekday_ranks[partners, partner_weekdays].astype(np.int64)
+        partner_after = self.weekday_ranks[partners, weekday].astype(np.int64)
+        gain = (int(person_ranks[weekday]) - person_after) + (partner_before - partner_after)
+        order = np.lexsort((np.abs(columns - column), -gain))[:k]
+        
+        return [
+            (date.fromordinal(int(columns[i]) + self.start_ordinal), self.employees[partners[i]],
+             (int(person_ranks[weekday]), int(person_after[i])), (int(partner_before[i]), int(partner_after[i])))
+            for i in order
+        ]
+
+# Bewertung von Schichtplänen
+def evaluate_assignments(assignments, rank_matrix, holiday_mask=None):
+    """
+    Bewertet einen oder viele Schichtpläne in einem Durchlauf über die Array-Darstellung.
+    
+    Args:
+        assignments: int-Array [Tage] oder [Pläne × Tage] mit dem Mitarbeiter-Index je Tag (-1 = keine Schicht)
+        rank_matrix: Kostenmatrix aus build_rank_matrix() [Mitarbeiter × Tage]
+        holiday_mask: Optionale bool-Maske [Tage], True an Feiertagen
+    
+    Returns:
+        Dictionary mit den Kennzahlen je Plan:
+        - shift_counts: Schichten je Mitarbeiter (ohne Feiertage)
+        - fair_share_deviation: Abweichung vom fairen Anteil je Mitarbeiter
+        - gini: Gini-Koeffizient der Schichtverteilung (0 = perfekt gleich verteilt)
+        - rank_histogram: Anzahl Schichten je Wunsch-Rang (1.-5. Wahl, kein Wunsch)
+        - employee_rank_histogram: Wunsch-Ränge je Mitarbeiter
+        - availability_violations: Schichten an Tagen mit Urlaub oder Wochentag-Sperre
+        - holiday_assignments: Schichten an Feiertagen
+        Bei einem einzelnen Plan (1D-Eingabe) ohne die führende Plan-Dimension.
+    """
+    assignments = np.asarray(assignments)
+    single_plan = assignments.ndim == 1
+    assignments = np.atleast_2d(assignments)
+    num_plans, num_days = assignments.shape
+    num_employees = rank_matrix.shape[0]
+    num_ranks = len(PRIORITY_KEYS)
+    
+    if holiday_mask is None:
+        holiday_mask = np.zeros(num_days, dtype=bool)
+    
+    assigned = assignments >= 0
+    counted = assigned & ~holiday_mask
+    employee_rows = np.where(assigned, assignments, 0)
+    ranks = rank_matrix[employee_rows, np.arange(num_days)]
+    violations = assigned & (ranks == RANK_UNAVAILABLE)
+    
+    # Schichten je Mitarbeiter: ein bincount über alle Pläne (Offset je Plan, Überlauf-Bin für freie Tage)
+    plan_offsets = np.arange(num_plans)[:, None]
+    count_bins = np.where(counted, employee_rows, num_employees) + plan_offsets * (num_employees + 1)
+    shift_counts = np.bincount(count_bins.ravel(), minlength=num_plans * (num_employees + 1))
+    shift_counts = shift_counts.reshape(num_plans, num_employees + 1)[:, :num_employees]
+    
+    # Wunsch-Ränge je Mitarbeiter (Konflikte mit Nichtverfügbarkeit zählen separat)
+    ranked = counted & ~violations
+    rank_bins = np.where(ranked, employee_rows * num_ranks + ranks, num_employees * num_ranks)
+    rank_bins = rank_bins + plan_offsets * (num_employees * num_ranks + 1)
+    employee_rank_histogram = np.bincount(rank_bins.ravel(), minlength=num_plans * (num_employees * num_ranks + 1))
+    employee_rank_histogram = employee_rank_histogram.reshape(num_plans, -1)[:, :-1].reshape(num_plans, num_employees, num_ranks)
+    
+    # Fairness: Abweichung vom fairen Anteil und Gini-Koeffizient
+    totals = shift_counts.sum(axis=1)
+    fair_share = totals / max(num_employees, 1)
+    sorted_counts = np.sort(shift_counts, axis=1)
+    gini_weights = 2 * np.arange(1, num_employees + 1) - num_employees - 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        gini = (sorted_counts * gini_weights).sum(axis=1) / (num_employees * totals)
+    gini = np.nan_to_num(gini)
+    
+    metrics = {
+        'shift_counts': shift_counts,
+        'fair_share_deviation': shift_counts - fair_share[:, None],
+        'gini': gini,
+        'rank_histogram': employee_rank_histogram.sum(axis=1),
+        'employee_rank_histogram': employee_rank_histogram,
+        'availability_violations': violations.sum(axis=1),
+        'holiday_assignments': (assigned & holiday_mask).sum(axis=1),
+    }
+    
+    if single_plan:
+        metrics = {key: value[0] for key, value in metrics.items()}
+    return metrics
+
+def evaluate_schedule(schedule_data, preferences, unavailability_entries=None):
+    """
+    Bewertet einen gespeicherten oder generierten Schichtplan (CompactSchedule oder {'YYYY-MM-DD': 'Name'}).
+    
+    Returns:
+        Tuple (employees, metrics): Mitarbeiterliste in Zeilenreihenfolge der Kennzahlen
+        und das Ergebnis von evaluate_assignments()
+    """
+    plan = as_compact_schedule(schedule_data)
+    days = plan.dates()
+    
+    # Mitarbeiter ohne Präferenzen (z.B. gelöschte Personen) werden mit bewertet
+    employees = list(preferences.keys()) + sorted(set(plan.names) - set(preferences.keys()))
+    employee_index = {emp: i for i, emp in enumerate(employees)}
+    
+    rank_matrix = build_rank_matrix({emp: preferences.get(emp, []) for emp in employees}, days, unavailability_entries)
+    name_to_row = np.array([employee_index[name] for name in plan.names], dtype=np.int64)
+    assignments = name_to_row[plan.codes()] if len(plan.names) else np.zeros(0, dtype=np.int64)
+    holiday_mask = np.fromiter((is_holiday_berlin(day) for day in days), dtype=bool, count=len(days))
+    
+    return employees, evaluate_assignments(assignments, rank_matrix, holiday_mask)
+
+# Schichtplanungsalgorithmus
+def assign_round_robin(rank_matrix, open_days, shift_totals):
+    """
+    Vergibt freie Tage per Round-Robin auf der Kostenmatrix.
+    
+    Als nächstes ist dran, wer insgesamt die wenigsten Schichten hat (bei Gleichstand in fester
+    Reihenfolge, bei gleichen Startwerten also exakt Round-Robin). Jeder bekommt den frühesten
+    freien Tag mit dem besten Wunsch-Rang, ohne passenden Wunsch den letzten freien Tag.
+    
+    Args:
+        rank_matrix: Kostenmatrix aus build_rank_matrix() [Mitarbeiter × Tage]
+        open_days: bool-Array [Tage], True für noch zu vergebende Tage
+        shift_totals: float-Array [Mitarbeiter] mit Startwerten, wird fortgeschrieben
+    
+    Returns:
+        int-Array [Tage] mit dem Mitarbeiter-Index je vergebenem Tag (-1 = nicht vergeben)
+    """
+    num_employees, num_days = rank_matrix.shape
+    assignments = np.full(num_days, -1, dtype=np.int64)
+    open_days = open_days.copy()
+    remaining_days = int(open_days.sum())
+    active = np.ones(num_employees, dtype=bool)
+    
+    while remaining_days and active.any():
+        employee_index = int(np.argmin(np.where(active, shift_totals, np.inf)))
+        employee_ranks = rank_matrix[employee_index]
+        candidates = open_days & (employee_ranks != RANK_UNAVAILABLE)
+        
+        # Falls kein Tag verfügbar ist, überspringe diesen Mitarbeiter dauerhaft
+        # (es werden nur Tage vergeben, nie neue frei)
+        if not candidates.any():
+            active[employee_index] = False
             continue
         
-        # Weise Tag zu
-        schedule[best_day.strftime('%Y-%m-%d')] = current_employee
-        available_days.remove(best_day)
-        assignment_count[current_employee] += 1
-        
-        # Aktualisiere Präferenz-Statistiken
-        weekday_name = weekday_names[best_day.weekday()]
-        if weekday_name in preferences[current_employee]:
-            priority_index = preferences[current_employee].index(weekday_name)
-            if priority_index == 0:  # 1. Wahl
-                preference_stats[current_employee]['first'] += 1
-            elif priority_index == 1:  # 2. Wahl
-                preference_stats[current_employee]['second'] += 1
-            elif priority_index == 2:  # 3. Wahl
-                preference_stats[current_employee]['third'] += 1
-            elif priority_index == 3:  # 4. Wahl
-                preference_stats[current_employee]['fourth'] += 1
-            elif priority_index == 4:  # 5. Wahl
-                preference_stats[current_employee]['fifth'] += 1
+        # Finde den besten verfügbaren Tag
+        candidate_ranks = np.where(candidates, employee_ranks, RANK_NONE + 1)
+        best_rank = int(candidate_ranks.min())
+        if best_rank < RANK_NONE:
+            best_index = int(np.argmax(candidate_ranks == best_rank))
         else:
-            preference_stats[current_employee]['none'] += 1
+            best_index = int(np.flatnonzero(candidates)[-1])
+        
+        # Weise Tag zu
+        assignments[best_index] = employee_index
+        open_days[best_index] = False
+        remaining_days -= 1
+        shift_totals[employee_index] += 1
+    
+    return assignments
+
+def rebalance_assignments(assignments, rank_matrix):
+    """
+    Verschiebt einzelne Tage von Personen über dem fairen Anteil zu Personen darunter,
+    bis sich die Schichtzahlen um höchstens 1 unterscheiden (jede Verschiebung = eine Änderung).
+    Bevorzugt werden Tage mit gutem Wunsch-Rang für den Empfänger. Ändert assignments direkt.
+    """
+    num_employees = rank_matrix.shape[0]
+    counts = np.bincount(assignments[assignments >= 0], minlength=num_employees)
+    
+    for _ in range(len(assignments)):
+        order = np.argsort(counts, kind='stable')
+        moved = False
+        for receiver in order:
+            for donor in order[::-1]:
+                if counts[donor] - counts[receiver] < 2:
+                    break
+                donor_days = np.flatnonzero(assignments == donor)
+                receiver_ranks = rank_matrix[receiver, donor_days].astype(np.int16)
+                possible = receiver_ranks != RANK_UNAVAILABLE
+                if not possible.any():
+                    continue
+                # Bester Rang für den Empfänger, bei Gleichstand der schlechteste für den Abgebenden
+                donor_ranks = rank_matrix[donor, donor_days].astype(np.int16)
+                score = np.where(possible, receiver_ranks * 16 - donor_ranks, np.iinfo(np.int16).max)
+                day_index = donor_days[int(np.argmin(score))]
+                assignments[day_index] = receiver
+                counts[donor] -= 1
+                counts[receiver] += 1
+                moved = True
+                break
+            if moved:
+                break
+        if not moved:
+            break
+    
+    return assignments
+
+def improve_assignments_by_swaps(assignments, rank_matrix, tolerance=0.5):
+    """
+    Verbessert die Wunscherfüllung von Personen, deren durchschnittlicher Wunsch-Rang um mehr als
+    tolerance schlechter ist als der Teamdurchschnitt (z.B. nach geänderten Präferenzen).
+    
+    Getauscht werden Tagespaare mit einer anderen Person, für die sich der Rang nicht verschlechtert;
+    die Schichtzahlen bleiben gleich. Alle anderen Tage bleiben unberührt. Ändert assignments direkt.
+    """
+    num_employees = rank_matrix.shape[0]
+    assigned_days = np.flatnonzero(assignments >= 0)
+    if len(assigned_days) == 0:
+        return assignments
+    
+    ranks = rank_matrix.astype(np.int16)
+    day_ranks = ranks[assignments[assigned_days], assigned_days]
+    rank_sums = np.bincount(assignments[assigned_days], weights=day_ranks, minlength=num_employees)
+    counts = np.bincount(assignments[assigned_days], minlength=num_employees)
+    team_mean = rank_sums.sum() / counts.sum()
+    
+    # Schlechteste Tage zuerst
+    for day_index in assigned_days[np.argsort(-day_ranks, kind='stable')]:
+        first = assignments[day_index]
+        if rank_sums[first] / counts[first] <= team_mean + tolerance:
+            continue
+        
+        partners = assignments[assigned_days]
+        first_here = ranks[first, day_index]
+        first_there = ranks[first, assigned_days]
+        partner_here = ranks[partners, day_index]
+        partner_there = ranks[partners, assigned_days]
         
-        # Nächster Mitarbeiter (Round-Robin)
-        employee_index = (employee_index + 1) % len(employees)
+        possible = ((partners != first) &
+                    (first_there != RANK_UNAVAILABLE) & (partner_here != RANK_UNAVAILABLE) &
+                    (first_there < first_here) & (partner_here <= partner_there))
+        if not possible.any():
+            continue
+        
+        gain = np.where(possible, (first_here - first_there) + (partner_there - partner_here), -1)
+        partner_day = assigned_days[int(np.argmax(gain))]
+        partner = assignments[partner_day]
+        rank_sums[first] += ranks[first, partner_day] - first_here
+        rank_sums[partner] += ranks[partner, day_index] - ranks[partner, partner_day]
+        assignments[day_index], assignments[partner_day] = partner, first
     
+    return assignments
+
+def summarize_assignments(assignments, rank_matrix, employees):
+    """Berechnet assignment_count, preference_score und preference_stats wie generate_fair_schedule"""
+    metrics = evaluate_assignments(assignments, rank_matrix)
+    assignment_count = {emp: int(count) for emp, count in zip(employees, metrics['shift_counts'])}
+    preference_stats = {
+        emp: {key: int(count) for key, count in zip(PRIORITY_KEYS, emp_histogram)}
+        for emp, emp_histogram in zip(employees, metrics['employee_rank_histogram'])
+    }
     
     # Berechne traditionelle preference_score für Kompatibilität mit vorhandener UI
-    preference_score = {}
-    for emp in employees:
-        preference_score[emp] = (preference_stats[emp]['first'] + 
-                               preference_stats[emp]['second'] + 
-                               preference_stats[emp]['third'] +
-                               preference_stats[emp]['fourth'] +
-                               preference_stats[emp]['fifth'])
+    preference_score = {emp: assignment_count[emp] - preference_stats[emp]['none'] for emp in employees}
+    
+    return assignment_count, preference_score, preference_stats
+
+def generate_fair_schedule(preferences, team_id, start_date=None, end_date=None, year=2025, carry_over=None):
+    """
+    Generiert einen fairen Schichtplan mit User-für-User Rotation:
+    1. Jeder Mitarbeiter kommt nacheinander dran (Round-Robin)
+    2. Jedem wird der bestmögliche verfügbare Tag zugeteilt (vorzugsweise 1. Wunsch)
+    3. Garantiert gleichmäßige Verteilung und maximale Wunscherfüllung
+    
+    Args:
+        preferences: Dictionary mit Mitarbeiter-Präferenzen
+        team_id: ID des Teams
+        start_date: Startdatum (datetime object) - überschreibt year Parameter
+        end_date: Enddatum (datetime object) - überschreibt year Parameter  
+        year: Jahr für Generierung (nur verwendet wenn start_date/end_date nicht gesetzt)
+        carry_over: Optional {Name: bisherige Schichten} aus dem Fairness-Ledger ohne den zu ersetzenden
+            Plan (siehe ledger_carry_over). Wer bisher mehr Schichten hatte, kommt entsprechend später
+            wieder an die Reihe. Personen ohne Eintrag starten mit dem Teamdurchschnitt.
+    """
+    # Bestimme Zeitraum
+    if start_date is None or end_date is None:
+        # Fallback auf Jahr-Parameter
+        start_date = datetime(year, 1, 1)
+        end_date = datetime(year, 12, 31)
+    
+    # Erstelle Liste aller Arbeitstage im Zeitraum (Mo-Fr, ohne Feiertage)
+    available_days = get_working_days(start_date, end_date)
+    employees = list(preferences.keys())
+    
+    # Kostenmatrix: Rang je Mitarbeiter und Tag, Urlaub/Sperren sind maskiert
+    rank_matrix = build_rank_matrix(preferences, available_days, load_unavailability(team_id))
+    
+    # Startwerte aus dem Fairness-Ledger (relativ zur Person mit den wenigsten Schichten)
+    shift_totals = np.zeros(len(employees))
+    if carry_over:
+        known_shifts = [carry_over[emp] for emp in employees if emp in carry_over]
+        default_shifts = np.mean(known_shifts) if known_shifts else 0
+        shift_totals = np.array([carry_over.get(emp, default_shifts) for emp in employees], dtype=float)
+        shift_totals -= shift_totals.min()
+    
+    assignments = assign_round_robin(rank_matrix, np.ones(len(available_days), dtype=bool), shift_totals)
+    
+    schedule = {
+        available_days[day_index].strftime('%Y-%m-%d'): employees[assignments[day_index]]
+        for day_index in np.flatnonzero(assignments >= 0)
+    }
+    assignment_count, preference_score, preference_stats = summarize_assignments(assignments, rank_matrix, employees)
     
     return schedule, assignment_count, preference_score, preference_stats
 
+def generate_stable_schedule(preferences, team_id, base_schedule, start_date, end_date, improve_preferences=True):
+    """
+    Generiert einen Schichtplan mit möglichst wenigen Änderungen gegenüber einem bestehenden Plan (Warmstart):
+    1. Gültige Zuteilungen aus base_schedule bleiben bestehen
+    2. Konflikte (Urlaub/Sperre, gelöschte Personen, Feiertage) und neue Tage werden per Round-Robin vergeben
+    3. Einzelne Tage werden nur verschoben, um den fairen Anteil wiederherzustellen
+    4. Optional werden Tage getauscht, wenn sich die Wunscherfüllung für beide Personen verbessert
+    
+    Args:
+        preferences: Dictionary mit Mitarbeiter-Präferenzen
+        team_id: ID des Teams
+        base_schedule: Bisheriger Plan (z.B. aus load_schedule())
+        start_date: Startdatum (datetime object)
+        end_date: Enddatum (datetime object)
+        improve_preferences: Tagestausch zur Verbesserung der Wunscherfüllung erlauben
+    
+    Returns:
+        schedule (gesamter Plan, außerhalb des Zeitraums unverändert), assignment_count, preference_score,
+        preference_stats (für den Zeitraum) und changes (Liste von (date_str, alter Name, neuer Name))
+    """
+    base_plan = as_compact_schedule(base_schedule)
+    available_days = get_working_days(start_date, end_date)
+    employees = list(preferences.keys())
+    employee_index = {emp: i for i, emp in enumerate(employees)}
+    rank_matrix = build_rank_matrix(preferences, available_days, load_unavailability(team_id))
+    
+    # Warmstart: bisherige Zuteilung je Arbeitstag übernehmen, Konflikte freigeben
+    assignments = np.full(len(available_days), -1, dtype=np.int64)
+    if available_days:
+        first_ordinal = available_days[0].toordinal()
+        day_offsets = np.array([day.toordinal() for day in available_days]) - first_ordinal
+        base_names = base_plan.window(first_ordinal, available_days[-1].toordinal() + 1)[day_offsets]
+        assignments = np.array([employee_index.get(name, -1) for name in base_names], dtype=np.int64)
+        kept_days = np.flatnonzero(assignments >= 0)
+        conflicts = rank_matrix[assignments[kept_days], kept_days] == RANK_UNAVAILABLE
+        assignments[kept_days[conflicts]] = -1
+    
+    # Freie Tage auffüllen und fairen Anteil wiederherstellen
+    shift_totals = np.bincount(assignments[assignments >= 0], minlength=len(employees)).astype(float)
+    filled = assign_round_robin(rank_matrix, assignments < 0, shift_totals)
+    assignments = np.where(assignments >= 0, assignments, filled)
+    rebalance_assignments(assignments, rank_matrix)
+    if improve_preferences:
+        improve_assignments_by_swaps(assignments, rank_matrix)
+    
+    # Neuer Plan: außerhalb des Zeitraums bleibt der bisherige Plan unverändert
+    calendar_ordinals = np.arange(len(base_plan.assignments)) + base_plan.start_ordinal
+    in_period = (calendar_ordinals >= start_date.toordinal()) & (calendar_ordinals <= end_date.toordinal())
+    schedule = base_plan.select(~in_period)
+    for day_index in np.flatnonzero(assignments >= 0):
+        schedule[available_days[day_index]] = employees[assignments[day_index]]
+    
+    assignment_count, preference_score, preference_stats = summarize_assignments(assignments, rank_matrix, employees)
+    changes = schedule_changes(base_plan, schedule)
+    
+    return schedule, assignment_count, preference_score, preference_stats, changes
+
+def plan_offboarding(preferences, base_schedule, name, shift_dates, unavailability_entries=None):
+    """
+    Verteilt Schichttage einer Person auf das übrige Team (beim Ausscheiden oder bei Konflikten mit neuem Urlaub).
+    
+    Nur diese Tage werden neu vergeben: per Round-Robin ausgehend von den künftigen Schichten jeder
+    Person (fairer Anteil), danach Tagestausch unter diesen Tagen zur Verbesserung der Wünsche.
+    Tage, an denen niemand verfügbar ist, bleiben unbesetzt.
+    
+    Args:
+        preferences: Präferenzen des Teams (inkl. der abgebenden Person)
+        base_schedule: Bisheriger Plan
+        shift_dates: Neu zu vergebende Tage der Person (z.B. aus load_employee_shift_dates())
+    
+    Returns:
+        Tuple (neuer Plan, Liste unbesetzter Tage)
+    """
+    schedule = as_compact_schedule(base_schedule).copy()
+    remaining = {emp: days for emp, days in preferences.items() if emp != name}
+    if not shift_dates:
+        return schedule, []
+    
+    employees = list(remaining)
+    rank_matrix = build_rank_matrix(remaining, shift_dates, unavailability_entries)
+    
+    # Startwerte: künftige Schichten je Person ab dem ersten abzugebenden Tag
+    future_ordinals = np.arange(len(schedule.assignments)) + schedule.start_ordinal
+    future_counts = Counter(schedule.select(future_ordinals >= shift_dates[0].toordinal()).values())
+    shift_totals = np.array([future_counts.get(emp, 0) for emp in employees], dtype=float)
+    
+    assignments = assign_round_robin(rank_matrix, np.ones(len(shift_dates), dtype=bool), shift_totals)
+    improve_assignments_by_swaps(assignments, rank_matrix)
+    
+    unassigned = []
+    for day, employee_index in zip(shift_dates, assignments.tolist()):
+        if employee_index >= 0:
+            schedule[day] = employees[employee_index]
+        else:
+            del schedule[day]
+            unassigned.append(day)
+    return schedule, unassigned
+
+# Optimistisches Sperren: zuletzt gesehener Team-Stand pro Sitzung
+def track_team_version(team_id, scope='page'):
+    """Merkt sich pro Sitzung und Bereich den zuletzt angezeigten Stand eines Teams.
+    
+    Gibt die Version zurück, die der Nutzer beim Auslösen dieses Laufs gesehen hat - sie wird
+    bei allen Schreibzugriffen als expected_version übergeben. Die Seite und jedes Fragment führen
+    einen eigenen Stand (scope), damit ein Fragment-Rerun nicht den Stand weiterschiebt, auf dem der
+    Rest der Seite beruht. Plan und Präferenzen werden je Version einmal als Schnappschuss geladen
+    (Basis für die Konfliktanzeige) und verworfen, sobald kein Bereich mehr auf sie verweist.
+    """
+    versions = st.session_state.setdefault('team_versions', {})
+    base_versions = st.session_state.setdefault('team_base_versions', {})
+    snapshots = st.session_state.setdefault('team_snapshots', {}).setdefault(team_id, {})
+    
+    current_version = get_team_version(team_id)
+    expected_version = versions.get((team_id, scope), current_version)
+    versions[(team_id, scope)] = current_version
+    base_versions[(team_id, scope)] = expected_version
+    
+    if current_version not in snapshots:
+        snapshots[current_version] = (load_schedule(team_id), load_preferences(team_id))
+    referenced = {version for (versioned_team, _), version in (*versions.items(), *base_versions.items()) if versioned_team == team_id}
+    for version in list(snapshots):
+        if version not in referenced:
+            del snapshots[version]
+    
+    return expected_version
+
+def remember_team_version(team_id, new_version=None, scope='page'):
+    """Übernimmt die Version nach einem eigenen erfolgreichen Schreibzugriff (kein Konflikt mit sich selbst)"""
+    versions = st.session_state.setdefault('team_versions', {})
+    versions[(team_id, scope)] = new_version if new_version is not None else get_team_version(team_id)
+
+def show_version_conflict(error):
+    """Zeigt einen Versionskonflikt samt Zeilen-Diff zwischen gesehenem und aktuellem Stand an"""
+    st.error(f"⚠️ Das Team wurde zwischenzeitlich in einer anderen Sitzung geändert (Version {error.expected_version} → {error.current_version}). Ihre Änderung wurde **nicht** gespeichert.")
+    
+    # Schnappschuss des Stands suchen, den der Nutzer gesehen hat
+    base = st.session_state.get('team_snapshots', {}).get(error.team_id, {}).get(error.expected_version)
+    
+    if base is not None:
+        seen_schedule, seen_preferences = base
+        
+        plan_changes = schedule_changes(seen_schedule, load_schedule(error.team_id))
+        if plan_changes:
+            st.markdown(f"**Geänderte Schichten ({len(plan_changes)}):**")
+            st.dataframe(pd.DataFrame([
+                {
+                    "Datum": datetime.strptime(date_str, '%Y-%m-%d').strftime('%d.%m.%Y'),
+                    "Ihr Stand": old_employee or "—",
+                    "Aktuell": new_employee or "—"
+                }
+                for date_str, old_employee, new_employee in plan_changes
+            ]), use_container_width=True, hide_index=True)
+        
+        current_preferences = load_preferences(error.team_id)
+        preference_changes = [
+            {
+                "Person": name,
+                "Ihr Stand": ', '.join(seen_preferences[name]) if name in seen_preferences else "—",
+                "Aktuell": ', '.join(current_preferences[name]) if name in current_preferences else "—"
+            }
+            for name in sorted(set(seen_preferences) | set(current_preferences))
+            if seen_preferences.get(name) != current_preferences.get(name)
+        ]
+        if preference_changes:
+            st.markdown(f"**Geänderte Wünsche ({len(preference_changes)}):**")
+            st.dataframe(pd.DataFrame(preference_changes), use_container_width=True, hide_index=True)
+    
+    st.info("💡 Die Ansicht zeigt jetzt den aktuellen Stand. Bitte prüfen Sie die Änderungen und führen Sie Ihre Aktion erneut aus.")
+
+def format_schedule_day(date_str, employee):
+    """Anzeigetext eines Plan-Tags in Auswahllisten: 'TT.MM.JJJJ (Wochentag) - Name'"""
+    day = datetime.strptime(date_str, '%Y-%m-%d')
+    return f"{day.strftime('%d.%m.%Y')} ({WEEKDAY_NAMES[day.weekday()]}) - {employee}"
+
+def schedule_day_picker(label, key, team_id, schedule, employees, exclude=None, help=None):
+    """
+    Datumsauswahl mit Fenster für große Pläne: Sprung zu einer Woche und Suche nach Person.
+    
+    Geladen werden per Bereichsabfrage nur die Tage der sichtbaren Wochen bzw. die nächsten
+    Schichten der gesuchten Person, die Auswahlliste bleibt unabhängig von der Planlänge klein.
+    
+    Returns:
+        (Datum als String, Anzeigetext) des gewählten Tages oder None
+    """
+    ordinals = schedule.ordinals()
+    first_day, last_day = date.fromordinal(int(ordinals[0])), date.fromordinal(int(ordinals[-1]))
+    week_key, employee_key = f"{key}_week", f"{key}_employee"
+    if not (first_day <= st.session_state.get(week_key, first_day - timedelta(days=1)) <= last_day):
+        st.session_state[week_key] = min(max(datetime.now().date(), first_day), last_day)
+    if st.session_state.get(employee_key) not in employees:
+        st.session_state[employee_key] = None
+    
+    week_day = st.date_input("Springe zu Woche:", min_value=first_day, max_value=last_day,
+                             format="DD.MM.YYYY", key=week_key)
+    employee = st.selectbox("Person suchen:", [None] + employees,
+                            format_func=lambda name: "Alle" if name is None else name, key=employee_key)
+    
+    window_start = week_day - timedelta(days=week_day.weekday())
+    if employee is None:
+        window_end = window_start + timedelta(weeks=DATE_PICKER_WINDOW_WEEKS, days=-1)
+        rows = load_schedule_window(team_id, window_start, window_end)
+        window_text = f"{window_start.strftime('%d.%m.%Y')} – {window_end.strftime('%d.%m.%Y')}"
+    else:
+        rows = load_schedule_window(team_id, window_start, employee=employee, limit=DATE_PICKER_SEARCH_LIMIT)
+        window_text = f"nächste Schichten von {employee} ab {window_start.strftime('%d.%m.%Y')}"
+    
+    options = [(date_str, format_schedule_day(date_str, name)) for date_str, name in rows if date_str != exclude]
+    if st.session_state.get(key) not in options:
+        st.session_state.pop(key, None)
+    if not options:
+        st.caption(f"Keine geplanten Tage ({window_text}).")
+        return None
+    
+    st.caption(f"{len(options)} Tage: {window_text}")
+    return st.selectbox(label, options, format_func=lambda x: x[1], help=help, key=key)
+
+def jump_schedule_day_picker(key, date_str, employee):
+    """Stellt eine schedule_day_picker-Auswahl auf einen Tag (z.B. als on_click eines Vorschlags)"""
+    st.session_state[f"{key}_week"] = datetime.strptime(date_str, '%Y-%m-%d').date()
+    st.session_state[f"{key}_employee"] = None
+    st.session_state[key] = (date_str, format_schedule_day(date_str, employee))
+
+def remember_unavailability_conflicts(team_id, name, conflict_days):
+    """Merkt sich die Konflikte einer gerade gespeicherten Nichtverfügbarkeit für die Anzeige nach dem Rerun"""
+    if conflict_days:
+        st.session_state.unavailability_conflicts = {
+            'team_id': team_id,
+            'name': name,
+            'dates': [day.isoformat() for day in conflict_days]
+        }
+    else:
+        st.session_state.pop('unavailability_conflicts', None)
+
+def show_schedule_diff(diff):
+    """Zeigt einen Planvergleich (diff_schedules) als Tabelle je Person"""
+    if not diff:
+        st.info("💡 Keine Unterschiede zwischen den Plänen.")
+        return
+    
+    def format_days(days):
+        return ", ".join(day.strftime('%d.%m.%y') for day in days) or "—"
+    
+    st.dataframe(pd.DataFrame([
+        {
+            "Name": name,
+            "Netto": f"{entry['net']:+d}",
+            "🥇 Δ 1. Wahl": entry['wishes']['first'],
+            "🥈 Δ 2. Wahl": entry['wishes']['second'],
+            "🥉 Δ 3. Wahl": entry['wishes']['third'],
+            "🏅 Δ 4./5. Wahl": entry['wishes']['fourth'] + entry['wishes']['fifth'],
+            "Δ ohne Wunsch": entry['wishes']['none'],
+            "➕ Neue Tage": format_days(entry['added']),
+            "➖ Entfallene Tage": format_days(entry['removed'])
+        }
+        for name, entry in diff.items()
+    ]), use_container_width=True, hide_index=True)
+
+@st.cache_resource(show_spinner=False)
+def initialize_app():
+    """
+    Einmal pro Prozess: Datenbank anlegen/migrieren, abgelaufene Sessions entfernen und den
+    Session-Cleanup als Hintergrund-Timer starten. Danach sind alle Tabellen garantiert vorhanden.
+    
+    Returns:
+        Dictionary mit den Kaltstart-Messwerten in Sekunden ('init'; 'first_render' nach dem ersten Lauf)
+    """
+    started = time.perf_counter()
+    init_database()
+    token_cache = get_session_token_cache()
+    cleanup_expired_sessions(token_cache)
+    start_session_cleanup(token_cache)
+    return {'init': time.perf_counter() - started}
+
+def record_first_render(startup_timings):
+    """Misst einmal pro Prozess die Dauer des ersten Skriptlaufs inkl. Imports (Zeit bis zur ersten Anzeige) und protokolliert den Kaltstart"""
+    if 'first_render' not in startup_timings:
+        startup_timings['first_render'] = time.perf_counter() - SCRIPT_STARTED
+        logger.info(
+            "Kaltstart: Initialisierung %.0f ms, erste Anzeige %.0f ms",
+            startup_timings['init'] * 1000, startup_timings['first_render'] * 1000
+        )
+
 # Passwort-Authentifizierung mit 90-Tage Speicherung
 def check_password():
     """Überprüft das Passwort für den Zugang zur App mit 90-Tage Speicherung"""
     
-    # Initialisiere Datenbank falls noch nicht geschehen
-    init_database()
-    
-    # Cleanup abgelaufene Sessions
-    cleanup_expired_sessions()
+    # Datenbank-Migrationen und Session-Cleanup nur beim ersten Lauf des Prozesses
+    initialize_app()
     
     # Prüfe ob bereits ein gültiger Session-Token existiert
     if "session_token" in st.session_state:
@@ -1204,6 +3256,42 @@ def main():
         ["Personen eingeben", "Urlaub eintragen", "Schichtplan generieren", "Manuelle Änderungen", "Plan anzeigen"]
     )
     
+    # Kennzahlen der Schreibwarteschlange (Group-Commits und Backpressure)
+    with st.sidebar.expander("🗄️ Datenbank-Schreibzugriffe"):
+        writer_stats = get_database_writer().stats()
+        st.caption(
+            f"Jobs: {writer_stats['jobs']} | Fehlgeschlagen: {writer_stats['failed']}  \n"
+            f"Commits: {writer_stats['commits']} | Ø Gruppe: {writer_stats['avg_batch']:.1f} | Max: {writer_stats['max_batch']}  \n"
+            f"Warteschlange: {writer_stats['queue_depth']} | Blockiert: {writer_stats['blocked_submits']} ({writer_stats['blocked_seconds']:.2f}s)"
+        )
+        
+        # Kaltstart des Prozesses: Migrationen/Session-Cleanup und Dauer des ersten Skriptlaufs inkl. Imports
+        startup_timings = initialize_app()
+        first_render = startup_timings.get('first_render')
+        st.caption(
+            f"Kaltstart: Initialisierung {startup_timings['init'] * 1000:.0f} ms | "
+            f"Erste Anzeige {f'{first_render * 1000:.0f} ms' if first_render is not None else '—'}"
+        )
+    
+    # Online-Sicherung (blockiert weder Leser noch Schreibzugriffe)
+    with st.sidebar.expander("💾 Datenbank-Sicherung"):
+        if st.button("💾 Sicherung erstellen", key="create_backup"):
+            try:
+                st.session_state.last_backup = create_database_backup()
+            except Exception as e:
+                st.error(f"❌ Sicherung fehlgeschlagen: {str(e)}")
+        
+        last_backup = st.session_state.get('last_backup')
+        if last_backup and os.path.exists(last_backup):
+            st.caption(f"Letzte Sicherung: {os.path.basename(last_backup)} ({os.path.getsize(last_backup) / 1024:.0f} KB)")
+            with open(last_backup, 'rb') as backup_file:
+                st.download_button(
+                    label="⬇️ Sicherung herunterladen",
+                    data=backup_file.read(),
+                    file_name=os.path.basename(last_backup),
+                    mime="application/vnd.sqlite3"
+                )
+    
     # Stelle sicher, dass wir eine gültige Team-ID haben
     if selected_team == "+ neues Team":
         st.warning("⚠️ Bitte erstellen Sie zuerst ein neues Team oder wählen Sie ein bestehendes Team aus.")
@@ -1214,6 +3302,9 @@ def main():
         st.error(f"❌ Team '{selected_team}' nicht gefunden!")
         return
     
+    # Version, auf der die Schreibaktionen dieses Laufs beruhen (optimistisches Sperren)
+    expected_version = track_team_version(current_team_id)
+    
     if mode == "Personen eingeben":
         # Reset Import/Export-Bereich nur beim ersten Aufruf des Tabs
         if 'current_mode' not in st.session_state or st.session_state.current_mode != "Personen eingeben":
@@ -1240,22 +3331,42 @@ def main():
                 with tab_import:
                     st.subheader("📥 Konfiguration importieren")
                     
-                    st.markdown("**Dateiformat:**")
-                    st.markdown("- Eine Zeile pro Mitarbeiter")
-                    st.markdown("- Format: `Name,1,2,3,4,5`")
-                    st.markdown("- Die Zahlen 1-5 sind die Prioritäten für Mo, Di, Mi, Do, Fr")
-                    st.markdown("- Jede Priorität 1-5 muss genau einmal verwendet werden")
+                    import_kind = st.radio(
+                        "Dateiart:",
+                        ["👥 Präferenzen", "🏖️ Urlaub (CSV)"],
+                        horizontal=True,
+                        key="import_kind"
+                    )
                     
-                    st.markdown("**Beispiel-Datei:**")
-                    example_text = """Thomas,3,2,1,4,5
+                    st.markdown("**Dateiformat:**")
+                    if import_kind == "👥 Präferenzen":
+                        st.markdown("- Eine Zeile pro Mitarbeiter")
+                        st.markdown("- Format: `Name,1,2,3,4,5`")
+                        st.markdown("- Die Zahlen 1-5 sind die Prioritäten für Mo, Di, Mi, Do, Fr")
+                        st.markdown("- Jede Priorität 1-5 muss genau einmal verwendet werden")
+                        st.markdown("- Mehrere Teams: Kopfzeile `Team,Name,Mo,Di,Mi,Do,Fr` und Team-Name als erste Spalte (fehlende Teams werden angelegt)")
+                        
+                        st.markdown("**Beispiel-Datei:**")
+                        example_text = """Thomas,3,2,1,4,5
 Anna,1,3,5,2,4
 Max,2,1,4,3,5"""
+                    else:
+                        st.markdown("- Eine Zeile pro Urlaubszeitraum, optional mit Kopfzeile")
+                        st.markdown("- Format: `Name,Von,Bis,Grund` (Grund optional)")
+                        st.markdown("- Datum als `JJJJ-MM-TT` oder `TT.MM.JJJJ`, beide Tage inklusive")
+                        st.markdown("- Die Person muss im Team bereits angelegt sein")
+                        st.markdown("- Mehrere Teams: Kopfzeile `Team,Name,Von,Bis,Grund` und Team-Name als erste Spalte")
+                        
+                        st.markdown("**Beispiel-Datei:**")
+                        example_text = """Name,Von,Bis,Grund
+Thomas,2026-07-13,2026-07-31,Sommerurlaub
+Anna,21.12.2026,01.01.2027,"""
                     st.code(example_text, language="text")
                     
                     # Datei-Upload
                     uploaded_file = st.file_uploader(
                         "Textdatei mit Konfiguration auswählen:",
-                        type=['txt'],
+                        type=['txt', 'csv'],
                         help="Wählen Sie eine Textdatei mit der gewünschten Konfiguration aus"
                     )
                     
@@ -1263,61 +3374,155 @@ Max,2,1,4,3,5"""
                     col1, col2 = st.columns(2)
                     
                     with col1:
-                        import_mode = st.radio(
-                            "Import-Modus:",
-                            ["➕ Zu bestehenden Personen hinzufügen", "🔄 Alle bestehenden Personen überschreiben"],
-                            help="Wählen Sie, ob bestehende Daten ergänzt oder ersetzt werden sollen"
+                        if import_kind == "👥 Präferenzen":
+                            import_mode = st.radio(
+                                "Import-Modus:",
+                                ["➕ Zu bestehenden Personen hinzufügen", "🔄 Alle bestehenden Personen überschreiben"],
+                                help="Wählen Sie, ob bestehende Daten ergänzt oder ersetzt werden sollen"
+                            )
+                        else:
+                            import_mode = st.radio(
+                                "Import-Modus:",
+                                ["➕ Zu bestehenden Urlauben hinzufügen", "🔄 Alle bestehenden Urlaube überschreiben"],
+                                help="Beim Überschreiben bleiben Wochentag-Sperren und Regeln erhalten"
+                            )
+                        import_partial = st.checkbox(
+                            "Fehlerhafte Zeilen überspringen",
+                            value=False,
+                            help="Standardmäßig wird bei einem Fehler nichts gespeichert (alles oder nichts)"
                         )
                     
                     with col2:
                         if st.button("📋 Vorschau aus Upload erstellen", disabled=uploaded_file is None):
                             if uploaded_file:
                                 try:
-                                    file_content = uploaded_file.read().decode("utf-8")
-                                    st.text_area("Datei-Inhalt:", file_content, height=200, disabled=True)
+                                    # Nur den Anfang anzeigen - große Dateien werden nicht komplett geladen
+                                    uploaded_file.seek(0)
+                                    preview_lines = []
+                                    for line_num, line, _ in iter_import_lines(uploaded_file):
+                                        if line_num > 50:
+                                            preview_lines.append("...")
+                                            break
+                                        preview_lines.append(line)
+                                    st.text_area("Datei-Inhalt:", "\n".join(preview_lines), height=200, disabled=True)
                                 except Exception as e:
                                     st.error(f"❌ Fehler beim Lesen der Datei: {str(e)}")
                     
                     # Import durchführen
                     if uploaded_file and st.button("🚀 Import starten", type="primary"):
+                        if import_kind == "🏖️ Urlaub (CSV)":
+                            try:
+                                overwrite = import_mode.startswith("🔄")
+                                uploaded_file.seek(0)
+                                import_progress = st.progress(0.0, text="Importiere...")
+                                success, message, _ = stream_import(
+                                    uploaded_file, 'vacation', current_team_id, overwrite,
+                                    all_or_nothing=not import_partial,
+                                    progress=lambda fraction, lines: import_progress.progress(fraction, text=f"{lines} Zeilen verarbeitet"),
+                                    total_bytes=uploaded_file.size
+                                )
+                                if success:
+                                    st.success(f"✅ {message}")
+                                else:
+                                    st.error(f"❌ {message}")
+                            except Exception as e:
+                                st.error(f"❌ Fehler beim Import: {str(e)}")
+                        else:
+                            try:
+                                overwrite = import_mode.startswith("🔄")
+                                uploaded_file.seek(0)
+                                import_progress = st.progress(0.0, text="Importiere...")
+                                
+                                success, message, new_version = stream_import(
+                                    uploaded_file, 'preferences', current_team_id, overwrite,
+                                    all_or_nothing=not import_partial,
+                                    expected_version=expected_version,
+                                    progress=lambda fraction, lines: import_progress.progress(fraction, text=f"{lines} Zeilen verarbeitet"),
+                                    total_bytes=uploaded_file.size
+                                )
+                                # Nur den eigenen Import übernehmen (nicht zwischenzeitliche Änderungen anderer Sitzungen)
+                                if success and new_version is not None:
+                                    remember_team_version(current_team_id, new_version)
+                                
+                                if success:
+                                    st.success(f"✅ {message}")
+                                    st.balloons()
+                                    
+                                    # Zeige importierte Daten
+                                    updated_preferences = load_preferences(current_team_id)
+                                    if updated_preferences:
+                                        st.subheader("Importierte Konfiguration:")
+                                        prefs_list = []
+                                        for name, days in updated_preferences.items():
+                                            if len(days) >= 5:
+                                                prefs_list.append({
+                                                    "Name": name,
+                                                    "🥇 1. Wahl": days[0],
+                                                    "🥈 2. Wahl": days[1], 
+                                                    "🥉 3. Wahl": days[2],
+                                                    "🏅 4. Wahl": days[3],
+                                                    "🏅 5. Wahl": days[4]
+                                                })
+                                        
+                                        if prefs_list:
+                                            prefs_df = pd.DataFrame(prefs_list)
+                                            st.dataframe(prefs_df, use_container_width=True, hide_index=True)
+                                    
+                                    # Schließe den Import/Export-Bereich nach erfolgreichem Import
+                                    st.session_state.show_import_export = False
+                                    st.rerun()
+                                else:
+                                    st.error(f"❌ {message}")
+                                    
+                            except VersionConflictError as e:
+                                show_version_conflict(e)
+                            except Exception as e:
+                                st.error(f"❌ Fehler beim Import: {str(e)}")
+                    
+                    st.markdown("---")
+                    st.subheader("📦 Team-Snapshot wiederherstellen")
+                    st.caption("Stellt Präferenzen, Urlaube, Regeln, Plan und Fairness-Ledger eines Teams aus einer Snapshot-Datei wieder her.")
+                    
+                    snapshot_file = st.file_uploader(
+                        "Snapshot-Datei auswählen:",
+                        type=['gz'],
+                        key="snapshot_upload"
+                    )
+                    snapshot_target = st.radio(
+                        "Ziel:",
+                        [f"🔄 Team '{selected_team}' ersetzen", "➕ Als neues Team anlegen"],
+                        horizontal=True,
+                        key="snapshot_target"
+                    )
+                    snapshot_team_name = ""
+                    if snapshot_target.startswith("➕"):
+                        snapshot_team_name = st.text_input(
+                            "Name des neuen Teams:",
+                            placeholder="Leer lassen für den Namen aus dem Snapshot",
+                            key="snapshot_team_name"
+                        ).strip()
+                    
+                    if snapshot_file and st.button("♻️ Snapshot wiederherstellen", type="primary"):
                         try:
-                            file_content = uploaded_file.read().decode("utf-8")
-                            overwrite = import_mode == "🔄 Alle bestehenden Personen überschreiben"
-                            
-                            success, message = import_preferences_from_text(file_content, current_team_id, overwrite)
-                            
+                            snapshot_file.seek(0)
+                            replace_current = snapshot_target.startswith("🔄")
+                            success, message, _, new_version = import_team_snapshot(
+                                snapshot_file,
+                                current_team_id if replace_current else None,
+                                expected_version if replace_current else None,
+                                None if replace_current else snapshot_team_name or None
+                            )
                             if success:
+                                # Ein neu angelegtes Team lässt den Stand des aktuellen Teams unberührt
+                                if replace_current:
+                                    remember_team_version(current_team_id, new_version)
                                 st.success(f"✅ {message}")
-                                st.balloons()
-                                
-                                # Zeige importierte Daten
-                                updated_preferences = load_preferences(current_team_id)
-                                if updated_preferences:
-                                    st.subheader("Importierte Konfiguration:")
-                                    prefs_list = []
-                                    for name, days in updated_preferences.items():
-                                        if len(days) >= 5:
-                                            prefs_list.append({
-                                                "Name": name,
-                                                "🥇 1. Wahl": days[0],
-                                                "🥈 2. Wahl": days[1], 
-                                                "🥉 3. Wahl": days[2],
-                                                "🏅 4. Wahl": days[3],
-                                                "🏅 5. Wahl": days[4]
-                                            })
-                                    
-                                    if prefs_list:
-                                        prefs_df = pd.DataFrame(prefs_list)
-                                        st.dataframe(prefs_df, use_container_width=True, hide_index=True)
-                                
-                                # Schließe den Import/Export-Bereich nach erfolgreichem Import
-                                st.session_state.show_import_export = False
-                                st.rerun()
                             else:
                                 st.error(f"❌ {message}")
-                                
+                        except VersionConflictError as e:
+                            show_version_conflict(e)
                         except Exception as e:
-                            st.error(f"❌ Fehler beim Import: {str(e)}")
+                            st.error(f"❌ Fehler bei der Wiederherstellung: {str(e)}")
                 
                 with tab_export:
                     st.subheader("📤 Konfiguration exportieren")
@@ -1357,6 +3562,31 @@ Max,2,1,4,3,5"""
                             st.success("✅ Klicken Sie auf den Button oben, um die Datei herunterzuladen.")
                         else:
                             st.error("❌ Fehler beim Erstellen der Export-Daten.")
+                    
+                    st.markdown("---")
+                    st.subheader("📦 Team-Snapshot")
+                    st.caption("Vollständige Sicherung des Teams (Präferenzen, Urlaube, Regeln, Plan, Fairness-Ledger) als komprimierte Datei.")
+                    
+                    # Snapshot nur auf Anforderung erzeugen (liest alle Tabellen des Teams) und für diesen Stand behalten
+                    if st.button("📦 Snapshot erstellen", key="create_team_snapshot"):
+                        snapshot_date = datetime.now().strftime("%Y%m%d_%H%M%S")
+                        st.session_state.team_snapshot_export = (
+                            current_team_id,
+                            get_team_version(current_team_id),
+                            f"schichtplaner_team_{selected_team}_{snapshot_date}.jsonl.gz",
+                            export_team_snapshot(current_team_id)
+                        )
+                    
+                    snapshot_export = st.session_state.get('team_snapshot_export')
+                    if snapshot_export and snapshot_export[0] == current_team_id:
+                        if snapshot_export[1] != get_team_version(current_team_id):
+                            st.caption("ℹ️ Das Team wurde seit dem Snapshot geändert - für den aktuellen Stand neu erstellen.")
+                        st.download_button(
+                            label="📦 Team-Snapshot herunterladen",
+                            data=snapshot_export[3],
+                            file_name=snapshot_export[2],
+                            mime="application/gzip"
+                        )
         
         st.markdown("---")
         
@@ -1397,282 +3627,347 @@ Max,2,1,4,3,5"""
         
         st.divider()
         
-        # Bearbeitungsmodus
-        if st.session_state.get("edit_mode", False):
-            st.subheader(f"✏️ Person bearbeiten: {st.session_state.edit_name}")
-            st.info("💡 Ändern Sie die gewünschten Werte und speichern Sie.")
-            
-            edit_name = st.text_input(
-                "Name:",
-                value=st.session_state.edit_name,
-                key="edit_name_input"
-            )
-            
-            weekdays = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag']
-            current_prefs = st.session_state.edit_prefs
-            
-            col1, col2, col3, col4, col5 = st.columns(5)
-            
-            with col1:
-                edit_first = st.selectbox(
-                    "🥇 1. Wahl:",
-                    weekdays,
-                    index=weekdays.index(current_prefs[0]) if len(current_prefs) > 0 and current_prefs[0] in weekdays else 0,
-                    key="edit_first_choice"
-                )
+        # Teilansichten als Fragmente: Eingaben darin laufen als Teil-Rerun ohne den Rest der Seite
+        @st.fragment
+        def person_edit_form():
+            """Formular zum Bearbeiten einer Person (Fragment)"""
+            # Eigene Basisversion je Teil-Rerun (der Stand aus main() kann inzwischen veraltet sein)
+            expected_version = track_team_version(current_team_id, 'person_edit_form')
             
-            with col2:
-                available_second = [day for day in weekdays if day != edit_first]
-                edit_second = st.selectbox(
-                    "🥈 2. Wahl:",
-                    available_second,
-                    index=available_second.index(current_prefs[1]) if len(current_prefs) > 1 and current_prefs[1] in available_second else 0,
-                    key="edit_second_choice"
+            # Bearbeitungsmodus
+            if st.session_state.get("edit_mode", False):
+                st.subheader(f"✏️ Person bearbeiten: {st.session_state.edit_name}")
+                st.info("💡 Ändern Sie die gewünschten Werte und speichern Sie.")
+                
+                edit_name = st.text_input(
+                    "Name:",
+                    value=st.session_state.edit_name,
+                    key="edit_name_input"
                 )
-            
-            with col3:
-                available_third = [day for day in weekdays if day not in [edit_first, edit_second]]
-                edit_third = st.selectbox(
+                
+                weekdays = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag']
+                current_prefs = st.session_state.edit_prefs
+                
+                col1, col2, col3, col4, col5 = st.columns(5)
+                
+                with col1:
+                    edit_first = st.selectbox(
+                        "🥇 1. Wahl:",
+                        weekdays,
+                        index=weekdays.index(current_prefs[0]) if len(current_prefs) > 0 and current_prefs[0] in weekdays else 0,
+                        key="edit_first_choice"
+                    )
+                
+                with col2:
+                    available_second = [day for day in weekdays if day != edit_first]
+                    edit_second = st.selectbox(
+                        "🥈 2. Wahl:",
+                        available_second,
+                        index=available_second.index(current_prefs[1]) if len(current_prefs) > 1 and current_prefs[1] in available_second else 0,
+                        key="edit_second_choice"
+                    )
+                
+                with col3:
+                    available_third = [day for day in weekdays if day not in [edit_first, edit_second]]
+                    edit_third = st.selectbox(
+                        "🥉 3. Wahl:",
+                        available_third,
+                        index=available_third.index(current_prefs[2]) if len(current_prefs) > 2 and current_prefs[2] in available_third else 0,
+                        key="edit_third_choice"
+                    )
+                
+                with col4:
+                    available_fourth = [day for day in weekdays if day not in [edit_first, edit_second, edit_third]]
+                    edit_fourth = st.selectbox(
+                        "🏅 4. Wahl:",
+                        available_fourth,
+                        index=available_fourth.index(current_prefs[3]) if len(current_prefs) > 3 and current_prefs[3] in available_fourth else 0,
+                        key="edit_fourth_choice"
+                    )
+                
+                with col5:
+                    available_fifth = [day for day in weekdays if day not in [edit_first, edit_second, edit_third, edit_fourth]]
+                    edit_fifth = st.selectbox(
+                        "🏅 5. Wahl:",
+                        available_fifth,
+                        index=available_fifth.index(current_prefs[4]) if len(current_prefs) > 4 and current_prefs[4] in available_fifth else 0,
+                        key="edit_fifth_choice"
+                    )
+                
+                col_save, col_cancel = st.columns(2)
+                
+                with col_save:
+                    if st.button("💾 Änderungen speichern", type="primary"):
+                        # Speichere neue/geänderte Person (bei Namensänderung wird die alte Person ersetzt)
+                        new_prefs = [edit_first, edit_second, edit_third, edit_fourth, edit_fifth]
+                        try:
+                            new_version = save_preferences(edit_name, new_prefs, current_team_id, expected_version, previous_name=st.session_state.edit_name)
+                        except VersionConflictError as e:
+                            show_version_conflict(e)
+                            return
+                        remember_team_version(current_team_id, new_version, 'person_edit_form')
+                        
+                        st.success(f"✅ Person **{edit_name}** wurde aktualisiert!")
+                        
+                        # Reset edit mode
+                        del st.session_state.edit_mode
+                        del st.session_state.edit_name
+                        del st.session_state.edit_prefs
+                        st.rerun()
+                
+                with col_cancel:
+                    if st.button("❌ Abbrechen", type="secondary"):
+                        # Reset edit mode
+                        del st.session_state.edit_mode
+                        del st.session_state.edit_name
+                        del st.session_state.edit_prefs
+                        st.rerun()
+                
+                st.divider()
+        
+        person_edit_form()
+        
+        @st.fragment
+        def new_person_form():
+            """Formular für neue Personen (Fragment)"""
+            expected_version = track_team_version(current_team_id, 'new_person_form')
+            
+            # Eingabeformular ohne Form (um Session State Problem zu vermeiden)
+            st.subheader("Neue Person hinzufügen")
+            
+            # Initialisiere Session State für Formular-Reset
+            if 'form_reset_trigger' not in st.session_state:
+                st.session_state.form_reset_trigger = 0
+            
+            name = st.text_input(
+                "Name des Mitarbeitenden:",
+                placeholder="z.B. Max Mustermann",
+                key=f"name_input_{st.session_state.form_reset_trigger}"
+            )
+            
+            weekdays = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag']
+            
+            st.markdown("**Geben Sie Ihre 5 Wunsch-Wochentage in Prioritätsreihenfolge an:**")
+            
+            col1, col2, col3, col4, col5 = st.columns(5)
+            
+            with col1:
+                first_choice = st.selectbox(
+                    "🥇 1. Wahl:",
+                    ["Bitte wählen..."] + weekdays,
+                    index=0,
+                    help="Ihr absoluter Lieblings-Wochentag",
+                    key=f"first_choice_{st.session_state.form_reset_trigger}"
+                )
+            
+            with col2:
+                # Entferne die bereits gewählten Optionen
+                chosen_days = []
+                if first_choice != "Bitte wählen...":
+                    chosen_days.append(first_choice)
+                available_second = [day for day in weekdays if day not in chosen_days]
+                
+                second_choice = st.selectbox(
+                    "🥈 2. Wahl:",
+                    ["Bitte wählen..."] + available_second,
+                    index=0,
+                    help="Ihr zweitliebster Wochentag",
+                    key=f"second_choice_{st.session_state.form_reset_trigger}"
+                )
+            
+            with col3:
+                # Entferne bereits gewählte Optionen
+                chosen_days = []
+                if first_choice != "Bitte wählen...":
+                    chosen_days.append(first_choice)
+                if second_choice != "Bitte wählen...":
+                    chosen_days.append(second_choice)
+                available_third = [day for day in weekdays if day not in chosen_days]
+                
+                third_choice = st.selectbox(
                     "🥉 3. Wahl:",
-                    available_third,
-                    index=available_third.index(current_prefs[2]) if len(current_prefs) > 2 and current_prefs[2] in available_third else 0,
-                    key="edit_third_choice"
+                    ["Bitte wählen..."] + available_third,
+                    index=0,
+                    help="Ihr drittliebster Wochentag",
+                    key=f"third_choice_{st.session_state.form_reset_trigger}"
                 )
             
             with col4:
-                available_fourth = [day for day in weekdays if day not in [edit_first, edit_second, edit_third]]
-                edit_fourth = st.selectbox(
+                # Entferne bereits gewählte Optionen
+                chosen_days = []
+                if first_choice != "Bitte wählen...":
+                    chosen_days.append(first_choice)
+                if second_choice != "Bitte wählen...":
+                    chosen_days.append(second_choice)
+                if third_choice != "Bitte wählen...":
+                    chosen_days.append(third_choice)
+                available_fourth = [day for day in weekdays if day not in chosen_days]
+                
+                fourth_choice = st.selectbox(
                     "🏅 4. Wahl:",
-                    available_fourth,
-                    index=available_fourth.index(current_prefs[3]) if len(current_prefs) > 3 and current_prefs[3] in available_fourth else 0,
-                    key="edit_fourth_choice"
+                    ["Bitte wählen..."] + available_fourth,
+                    index=0,
+                    help="Ihr viertliebster Wochentag",
+                    key=f"fourth_choice_{st.session_state.form_reset_trigger}"
                 )
             
             with col5:
-                available_fifth = [day for day in weekdays if day not in [edit_first, edit_second, edit_third, edit_fourth]]
-                edit_fifth = st.selectbox(
+                # Entferne bereits gewählte Optionen
+                chosen_days = []
+                if first_choice != "Bitte wählen...":
+                    chosen_days.append(first_choice)
+                if second_choice != "Bitte wählen...":
+                    chosen_days.append(second_choice)
+                if third_choice != "Bitte wählen...":
+                    chosen_days.append(third_choice)
+                if fourth_choice != "Bitte wählen...":
+                    chosen_days.append(fourth_choice)
+                available_fifth = [day for day in weekdays if day not in chosen_days]
+                
+                fifth_choice = st.selectbox(
                     "🏅 5. Wahl:",
-                    available_fifth,
-                    index=available_fifth.index(current_prefs[4]) if len(current_prefs) > 4 and current_prefs[4] in available_fifth else 0,
-                    key="edit_fifth_choice"
+                    ["Bitte wählen..."] + available_fifth,
+                    index=0,
+                    help="Ihr fünftliebster Wochentag",
+                    key=f"fifth_choice_{st.session_state.form_reset_trigger}"
                 )
             
-            col_save, col_cancel = st.columns(2)
+            # Submit Button außerhalb des Forms
+            submitted = st.button("Person speichern", type="primary", use_container_width=True)
             
-            with col_save:
-                if st.button("💾 Änderungen speichern", type="primary"):
-                    # Lösche alte Person wenn Name geändert wurde
-                    if edit_name != st.session_state.edit_name:
-                        delete_preference(st.session_state.edit_name, current_team_id)
-                    
-                    # Speichere neue/geänderte Person
-                    new_prefs = [edit_first, edit_second, edit_third, edit_fourth, edit_fifth]
-                    save_preferences(edit_name, new_prefs, current_team_id)
+            if submitted:
+                # Validierung der Eingaben
+                if not name.strip():
+                    st.error("❌ Bitte geben Sie einen Namen ein.")
+                elif (first_choice == "Bitte wählen..." or 
+                      second_choice == "Bitte wählen..." or 
+                      third_choice == "Bitte wählen..." or
+                      fourth_choice == "Bitte wählen..." or
+                      fifth_choice == "Bitte wählen..."):
+                    # Zeige genau was noch fehlt
+                    missing = []
+                    if first_choice == "Bitte wählen...":
+                        missing.append("🥇 1. Wahl")
+                    if second_choice == "Bitte wählen...":
+                        missing.append("🥈 2. Wahl") 
+                    if third_choice == "Bitte wählen...":
+                        missing.append("🥉 3. Wahl")
+                    if fourth_choice == "Bitte wählen...":
+                        missing.append("🏅 4. Wahl")
+                    if fifth_choice == "Bitte wählen...":
+                        missing.append("🏅 5. Wahl")
                     
-                    st.success(f"✅ Person **{edit_name}** wurde aktualisiert!")
-                    
-                    # Reset edit mode
-                    del st.session_state.edit_mode
-                    del st.session_state.edit_name
-                    del st.session_state.edit_prefs
-                    st.rerun()
-            
-            with col_cancel:
-                if st.button("❌ Abbrechen", type="secondary"):
-                    # Reset edit mode
-                    del st.session_state.edit_mode
-                    del st.session_state.edit_name
-                    del st.session_state.edit_prefs
-                    st.rerun()
-            
-            st.divider()
-        
-        # Eingabeformular ohne Form (um Session State Problem zu vermeiden)
-        st.subheader("Neue Person hinzufügen")
-        
-        # Initialisiere Session State für Formular-Reset
-        if 'form_reset_trigger' not in st.session_state:
-            st.session_state.form_reset_trigger = 0
-        
-        name = st.text_input(
-            "Name des Mitarbeitenden:",
-            placeholder="z.B. Max Mustermann",
-            key=f"name_input_{st.session_state.form_reset_trigger}"
-        )
-        
-        weekdays = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag']
-        
-        st.markdown("**Geben Sie Ihre 5 Wunsch-Wochentage in Prioritätsreihenfolge an:**")
-        
-        col1, col2, col3, col4, col5 = st.columns(5)
-        
-        with col1:
-            first_choice = st.selectbox(
-                "🥇 1. Wahl:",
-                ["Bitte wählen..."] + weekdays,
-                index=0,
-                help="Ihr absoluter Lieblings-Wochentag",
-                key=f"first_choice_{st.session_state.form_reset_trigger}"
-            )
-        
-        with col2:
-            # Entferne die bereits gewählten Optionen
-            chosen_days = []
-            if first_choice != "Bitte wählen...":
-                chosen_days.append(first_choice)
-            available_second = [day for day in weekdays if day not in chosen_days]
-            
-            second_choice = st.selectbox(
-                "🥈 2. Wahl:",
-                ["Bitte wählen..."] + available_second,
-                index=0,
-                help="Ihr zweitliebster Wochentag",
-                key=f"second_choice_{st.session_state.form_reset_trigger}"
-            )
-        
-        with col3:
-            # Entferne bereits gewählte Optionen
-            chosen_days = []
-            if first_choice != "Bitte wählen...":
-                chosen_days.append(first_choice)
-            if second_choice != "Bitte wählen...":
-                chosen_days.append(second_choice)
-            available_third = [day for day in weekdays if day not in chosen_days]
-            
-            third_choice = st.selectbox(
-                "🥉 3. Wahl:",
-                ["Bitte wählen..."] + available_third,
-                index=0,
-                help="Ihr drittliebster Wochentag",
-                key=f"third_choice_{st.session_state.form_reset_trigger}"
-            )
-        
-        with col4:
-            # Entferne bereits gewählte Optionen
-            chosen_days = []
-            if first_choice != "Bitte wählen...":
-                chosen_days.append(first_choice)
-            if second_choice != "Bitte wählen...":
-                chosen_days.append(second_choice)
-            if third_choice != "Bitte wählen...":
-                chosen_days.append(third_choice)
-            available_fourth = [day for day in weekdays if day not in chosen_days]
-            
-            fourth_choice = st.selectbox(
-                "🏅 4. Wahl:",
-                ["Bitte wählen..."] + available_fourth,
-                index=0,
-                help="Ihr viertliebster Wochentag",
-                key=f"fourth_choice_{st.session_state.form_reset_trigger}"
-            )
-        
-        with col5:
-            # Entferne bereits gewählte Optionen
-            chosen_days = []
-            if first_choice != "Bitte wählen...":
-                chosen_days.append(first_choice)
-            if second_choice != "Bitte wählen...":
-                chosen_days.append(second_choice)
-            if third_choice != "Bitte wählen...":
-                chosen_days.append(third_choice)
-            if fourth_choice != "Bitte wählen...":
-                chosen_days.append(fourth_choice)
-            available_fifth = [day for day in weekdays if day not in chosen_days]
-            
-            fifth_choice = st.selectbox(
-                "🏅 5. Wahl:",
-                ["Bitte wählen..."] + available_fifth,
-                index=0,
-                help="Ihr fünftliebster Wochentag",
-                key=f"fifth_choice_{st.session_state.form_reset_trigger}"
-            )
-        
-        # Submit Button außerhalb des Forms
-        submitted = st.button("Person speichern", type="primary", use_container_width=True)
-        
-        if submitted:
-            # Validierung der Eingaben
-            if not name.strip():
-                st.error("❌ Bitte geben Sie einen Namen ein.")
-            elif (first_choice == "Bitte wählen..." or 
-                  second_choice == "Bitte wählen..." or 
-                  third_choice == "Bitte wählen..." or
-                  fourth_choice == "Bitte wählen..." or
-                  fifth_choice == "Bitte wählen..."):
-                # Zeige genau was noch fehlt
-                missing = []
-                if first_choice == "Bitte wählen...":
-                    missing.append("🥇 1. Wahl")
-                if second_choice == "Bitte wählen...":
-                    missing.append("🥈 2. Wahl") 
-                if third_choice == "Bitte wählen...":
-                    missing.append("🥉 3. Wahl")
-                if fourth_choice == "Bitte wählen...":
-                    missing.append("🏅 4. Wahl")
-                if fifth_choice == "Bitte wählen...":
-                    missing.append("🏅 5. Wahl")
-                
-                st.error(f"❌ Bitte vervollständigen Sie Ihre Auswahl!")
-                st.warning(f"💡 **Noch fehlend**: {' und '.join(missing)}")
-                st.info("ℹ️ **Hinweis**: Sie müssen alle 5 Prioritäten (1., 2., 3., 4. und 5. Wahl) auswählen, um eine faire Schichtverteilung zu ermöglichen.")
-            else:
-                # Prüfe auf Duplikate
-                choices = [first_choice, second_choice, third_choice, fourth_choice, fifth_choice]
-                if len(set(choices)) != 5:
-                    st.error("❌ Bitte wählen Sie 5 verschiedene Wochentage aus.")
-                    st.warning(f"💡 **Problem**: Doppelte Auswahl erkannt. Jeder Tag darf nur einmal gewählt werden.")
+                    st.error(f"❌ Bitte vervollständigen Sie Ihre Auswahl!")
+                    st.warning(f"💡 **Noch fehlend**: {' und '.join(missing)}")
+                    st.info("ℹ️ **Hinweis**: Sie müssen alle 5 Prioritäten (1., 2., 3., 4. und 5. Wahl) auswählen, um eine faire Schichtverteilung zu ermöglichen.")
                 else:
-                    # Alles korrekt - speichern
-                    preferred_days = [first_choice, second_choice, third_choice, fourth_choice, fifth_choice]
-                    save_preferences(name.strip(), preferred_days, current_team_id)
-                    st.success(f"✅ Person **{name.strip()}** erfolgreich im Team **{selected_team}** gespeichert! 🎉")
-                    st.success(f"🎯 **Ihre Prioritäten**: 🥇 {first_choice} | 🥈 {second_choice} | 🥉 {third_choice} | 🏅 {fourth_choice} | 🏅 {fifth_choice}")
-                    st.balloons()  # Kleine Feier! 🎈
-                    # Reset das Formular durch Erhöhung des Triggers
-                    st.session_state.form_reset_trigger += 1
-                    st.rerun()
+                    # Prüfe auf Duplikate
+                    choices = [first_choice, second_choice, third_choice, fourth_choice, fifth_choice]
+                    if len(set(choices)) != 5:
+                        st.error("❌ Bitte wählen Sie 5 verschiedene Wochentage aus.")
+                        st.warning(f"💡 **Problem**: Doppelte Auswahl erkannt. Jeder Tag darf nur einmal gewählt werden.")
+                    else:
+                        # Alles korrekt - speichern
+                        preferred_days = [first_choice, second_choice, third_choice, fourth_choice, fifth_choice]
+                        try:
+                            new_version = save_preferences(name.strip(), preferred_days, current_team_id, expected_version)
+                        except VersionConflictError as e:
+                            show_version_conflict(e)
+                            return
+                        remember_team_version(current_team_id, new_version, 'new_person_form')
+                        st.success(f"✅ Person **{name.strip()}** erfolgreich im Team **{selected_team}** gespeichert! 🎉")
+                        st.success(f"🎯 **Ihre Prioritäten**: 🥇 {first_choice} | 🥈 {second_choice} | 🥉 {third_choice} | 🏅 {fourth_choice} | 🏅 {fifth_choice}")
+                        st.balloons()  # Kleine Feier! 🎈
+                        # Reset das Formular durch Erhöhung des Triggers
+                        st.session_state.form_reset_trigger += 1
+                        st.rerun()
         
-        # Bearbeitungs- und Löschoptionen
-        if existing_prefs:
-            st.divider()
-            st.subheader("🔧 Personen bearbeiten/löschen")
-            
-            col1, col2 = st.columns(2)
+        new_person_form()
+        
+        @st.fragment
+        def person_actions():
+            """Personen bearbeiten/löschen inkl. Offboarding-Vorschau (Fragment)"""
+            expected_version = track_team_version(current_team_id, 'person_actions')
+            team_data = load_team_data(current_team_id)
+            existing_prefs = team_data['preferences']
             
-            with col1:
-                st.markdown("**Person bearbeiten:**")
-                edit_name = st.selectbox(
-                    "Person auswählen:",
-                    ["Keine Auswahl"] + list(existing_prefs.keys()),
-                    key="edit_selectbox"
-                )
+            # Bearbeitungs- und Löschoptionen
+            if existing_prefs:
+                st.divider()
+                st.subheader("🔧 Personen bearbeiten/löschen")
                 
-                if edit_name != "Keine Auswahl":
-                    if st.button(f"✏️ {edit_name} bearbeiten", type="secondary"):
-                        st.session_state.edit_mode = True
-                        st.session_state.edit_name = edit_name
-                        st.session_state.edit_prefs = existing_prefs[edit_name]
-                        st.rerun()
-            
-            with col2:
-                st.markdown("**Person löschen:**")
-                delete_name = st.selectbox(
-                    "Person auswählen:",
-                    ["Keine Auswahl"] + list(existing_prefs.keys()),
-                    key="delete_selectbox"
-                )
+                col1, col2 = st.columns(2)
                 
-                if delete_name != "Keine Auswahl":
-                    if st.button(f"🗑️ {delete_name} löschen", type="secondary"):
-                        if st.session_state.get("confirm_delete", False):
-                            delete_preference(delete_name, current_team_id)
-                            st.success(f"✅ Person **{delete_name}** wurde gelöscht.")
-                            if "confirm_delete" in st.session_state:
-                                del st.session_state["confirm_delete"]
+                with col1:
+                    st.markdown("**Person bearbeiten:**")
+                    edit_name = st.selectbox(
+                        "Person auswählen:",
+                        ["Keine Auswahl"] + list(existing_prefs.keys()),
+                        key="edit_selectbox"
+                    )
+                    
+                    if edit_name != "Keine Auswahl":
+                        if st.button(f"✏️ {edit_name} bearbeiten", type="secondary"):
+                            st.session_state.edit_mode = True
+                            st.session_state.edit_name = edit_name
+                            st.session_state.edit_prefs = existing_prefs[edit_name]
                             st.rerun()
-                        else:
-                            st.session_state.confirm_delete = True
-                            st.warning(f"⚠️ Klicken Sie erneut, um **{delete_name}** endgültig zu löschen!")
+                
+                with col2:
+                    st.markdown("**Person löschen:**")
+                    delete_name = st.selectbox(
+                        "Person auswählen:",
+                        ["Keine Auswahl"] + list(existing_prefs.keys()),
+                        key="delete_selectbox"
+                    )
+                    
+                    if delete_name != "Keine Auswahl":
+                        # Offboarding: künftige Schichten der Person auf das verbleibende Team verteilen
+                        future_shift_dates = load_employee_shift_dates(current_team_id, delete_name, datetime.now().date())
+                        redistribute_shifts = False
+                        if future_shift_dates:
+                            st.info(f"📅 {delete_name} hat noch {len(future_shift_dates)} künftige Schichten im Plan.")
+                            redistribute_shifts = st.checkbox(
+                                "🔀 Künftige Schichten auf das Team verteilen",
+                                value=True,
+                                key="offboarding_redistribute",
+                                help="Nur diese Tage werden neu vergeben - fair nach Schichtanzahl und Wünschen"
+                            )
+                            if redistribute_shifts:
+                                offboarding_schedule, unassigned_days = plan_offboarding(
+                                    existing_prefs,
+                                    team_data['schedule'],
+                                    delete_name,
+                                    future_shift_dates,
+                                    team_data['unavailability']
+                                )
+                                with st.expander("👥 Vorschau der Umverteilung"):
+                                    show_schedule_diff(diff_schedules(team_data['schedule'], offboarding_schedule, existing_prefs))
+                                if unassigned_days:
+                                    st.warning(f"⚠️ {len(unassigned_days)} Tage bleiben unbesetzt (niemand verfügbar): "
+                                               + ", ".join(day.strftime('%d.%m.%Y') for day in unassigned_days))
+                        
+                        if st.button(f"🗑️ {delete_name} löschen", type="secondary"):
+                            if st.session_state.get("confirm_delete", False):
+                                try:
+                                    if redistribute_shifts:
+                                        new_version = offboard_employee(delete_name, offboarding_schedule, current_team_id, expected_version)
+                                    else:
+                                        new_version = delete_preference(delete_name, current_team_id, expected_version)
+                                except VersionConflictError as e:
+                                    del st.session_state["confirm_delete"]
+                                    show_version_conflict(e)
+                                    return
+                                remember_team_version(current_team_id, new_version, 'person_actions')
+                                st.success(f"✅ Person **{delete_name}** wurde gelöscht.")
+                                if "confirm_delete" in st.session_state:
+                                    del st.session_state["confirm_delete"]
+                                st.rerun()
+                            else:
+                                st.session_state.confirm_delete = True
+                                st.warning(f"⚠️ Klicken Sie erneut, um **{delete_name}** endgültig zu löschen!")
+        
+        person_actions()
     
     elif mode == "Urlaub eintragen":
         # Setze current_mode für korrekte Navigation
@@ -1686,37 +3981,118 @@ Max,2,1,4,3,5"""
             st.warning(f"Noch keine Personen im Team '{selected_team}' eingegeben. Bitte gehen Sie zuerst zu 'Personen eingeben'.")
             return
         
-        # Lade vorhandene Einträge für das aktuelle Team
-        unavail_entries = load_unavailability(current_team_id)
+        # Konflikte der zuletzt gespeicherten Nichtverfügbarkeit mit bereits geplanten Schichten
+        conflict_state = st.session_state.get('unavailability_conflicts')
+        if conflict_state and conflict_state['team_id'] == current_team_id:
+            conflict_name = conflict_state['name']
+            current_schedule = load_schedule(current_team_id)
+            # Nur Tage, die weiterhin mit der Person besetzt sind
+            conflict_days = [
+                datetime.strptime(date_str, '%Y-%m-%d').date() for date_str in conflict_state['dates']
+                if current_schedule.get(date_str) == conflict_name
+            ]
+            if not conflict_days:
+                st.session_state.pop('unavailability_conflicts')
+            else:
+                st.warning(f"⚠️ **{conflict_name}** ist an {len(conflict_days)} bereits geplanten Tagen eingeteilt, die jetzt gesperrt sind.")
+                repaired_schedule, _ = plan_offboarding(
+                    preferences, current_schedule, conflict_name, conflict_days, load_unavailability(current_team_id)
+                )
+                st.dataframe(pd.DataFrame([
+                    {
+                        "Datum": day.strftime('%d.%m.%Y'),
+                        "Wochentag": WEEKDAY_NAMES[day.weekday()],
+                        "Bisher": conflict_name,
+                        "Vorschlag": repaired_schedule.get(day) or "— unbesetzt (niemand verfügbar)"
+                    }
+                    for day in conflict_days
+                ]), use_container_width=True, hide_index=True)
+                
+                col_repair, col_ignore = st.columns(2)
+                with col_repair:
+                    if st.button("🔧 Vorschläge übernehmen", type="primary", key="repair_conflicts", use_container_width=True):
+                        try:
+                            new_version = save_schedule(repaired_schedule, current_team_id, expected_version,
+                                                        label=f"Konflikte behoben: {conflict_name}")
+                        except VersionConflictError as e:
+                            show_version_conflict(e)
+                            return
+                        remember_team_version(current_team_id, new_version)
+                        st.session_state.pop('unavailability_conflicts')
+                        st.rerun()
+                with col_ignore:
+                    if st.button("Ignorieren", key="ignore_conflicts", use_container_width=True):
+                        st.session_state.pop('unavailability_conflicts')
+                        st.rerun()
+                st.divider()
+        
+        # Lade die aktuelle Seite der Einträge (Keyset-Pagination, stabile IDs)
+        unavail_count = count_unavailability(current_team_id)
+        page_cursors = st.session_state.setdefault('unavail_page_cursors', {}).setdefault(current_team_id, [None])
+        unavail_page = list_unavailability(current_team_id, after=page_cursors[-1], limit=UNAVAILABILITY_PAGE_SIZE + 1)
+        if not unavail_page and len(page_cursors) > 1:
+            # Seite ist leer geworden (z.B. nach dem Löschen) - zurück zur ersten Seite
+            page_cursors[1:] = []
+            unavail_page = list_unavailability(current_team_id, limit=UNAVAILABILITY_PAGE_SIZE + 1)
+        has_next_page = len(unavail_page) > UNAVAILABILITY_PAGE_SIZE
+        unavail_page = unavail_page[:UNAVAILABILITY_PAGE_SIZE]
         
         # Zeige bereits eingetragene Urlaube/Nichtverfügbarkeiten
-        if unavail_entries:
+        if unavail_page:
             st.subheader("Bereits eingetragene Urlaube und Nichtverfügbarkeiten:")
             
             # Erstelle DataFrame für bessere Darstellung
-            entries_list = []
-            for i, (name, entry_type, date, weekday, reason) in enumerate(unavail_entries):
-                if entry_type == "urlaub":
-                    if date:
-                        date_obj = datetime.strptime(date, '%Y-%m-%d')
-                        formatted_date = date_obj.strftime('%d.%m.%Y')
-                        entry_desc = f"📅 Urlaub am {formatted_date}"
-                    else:
-                        entry_desc = "📅 Urlaub (Datum fehlt)"
-                else:  # wochentag
-                    entry_desc = f"⛔ Nie verfügbar am {weekday}"
-                
-                entries_list.append({
+            entries_df = pd.DataFrame([
+                {
                     "Name": name,
-                    "Art": entry_desc,
-                    "Grund": reason if reason else "-",
-                    "ID": i  # Für Löschen
-                })
+                    "Art": describe_unavailability_entry(entry_type, entry_date, end_date, weekday, rule),
+                    "Grund": reason if reason else "-"
+                }
+                for entry_id, name, entry_type, entry_date, end_date, weekday, reason, rule in unavail_page
+            ])
+            st.dataframe(entries_df, use_container_width=True, hide_index=True)
             
-            entries_df = pd.DataFrame(entries_list)
-            st.dataframe(entries_df[["Name", "Art", "Grund"]], use_container_width=True, hide_index=True)
+            # Seitennavigation
+            page_number = len(page_cursors)
+            page_count = max(1, -(-unavail_count // UNAVAILABILITY_PAGE_SIZE))
+            col_prev, col_info, col_next = st.columns([1, 2, 1])
+            with col_prev:
+                if st.button("◀ Zurück", disabled=page_number == 1, key="unavail_page_prev"):
+                    page_cursors.pop()
+                    st.rerun()
+            with col_info:
+                st.write(f"**Team '{selected_team}'**: {unavail_count} Einträge (Seite {page_number} von {page_count})")
+            with col_next:
+                if st.button("Weiter ▶", disabled=not has_next_page, key="unavail_page_next"):
+                    last_id, last_name, _, last_date = unavail_page[-1][:4]
+                    page_cursors.append((last_name, last_date, last_id))
+                    st.rerun()
             
-            st.write(f"**Team '{selected_team}'**: {len(unavail_entries)} Einträge")
+            # Abwesenheiten in einem Zeitraum (Intervallindex)
+            vacation_index = load_vacation_index(current_team_id)
+            with st.expander("🔎 Wer fehlt in einem Zeitraum?"):
+                absence_range = st.date_input(
+                    "Zeitraum:",
+                    value=(datetime.now().date(), datetime.now().date() + timedelta(days=13)),
+                    format="DD.MM.YYYY",
+                    key="absence_query_range"
+                )
+                if len(absence_range) == 2:
+                    absent_names = vacation_index.absent_between(absence_range[0], absence_range[1])
+                    if absent_names:
+                        st.dataframe(pd.DataFrame([
+                            {
+                                "Name": name,
+                                "Urlaub": ", ".join(
+                                    f"{start.strftime('%d.%m.%Y')} - {end.strftime('%d.%m.%Y')}"
+                                    for start, end in vacation_index.intervals(name)
+                                    if start <= absence_range[1] and end >= absence_range[0]
+                                )
+                            }
+                            for name in absent_names
+                        ]), use_container_width=True, hide_index=True)
+                    else:
+                        st.info("💡 In diesem Zeitraum ist niemand im Urlaub.")
         
         st.divider()
         
@@ -1739,18 +4115,19 @@ Max,2,1,4,3,5"""
         with col2:
             unavail_type = st.radio(
                 "Art der Nichtverfügbarkeit:",
-                ["🏖️ Urlaub (spezifisches Datum)", "⛔ Generell nie verfügbar (Wochentag)"],
+                ["🏖️ Urlaub (Zeitraum)", "⛔ Generell nie verfügbar (Wochentag)", "🔁 Wiederkehrend (Regel)"],
                 key=f"unavail_type_{st.session_state.unavail_form_reset_trigger}"
             )
         
-        if unavail_type == "🏖️ Urlaub (spezifisches Datum)":
+        if unavail_type == "🏖️ Urlaub (Zeitraum)":
             col3, col4 = st.columns(2)
             with col3:
-                unavail_date = st.date_input(
-                    "Urlaubsdatum:",
-                    value=datetime.now().date(),
-                    min_value=datetime(2025, 1, 1).date(),
-                    max_value=datetime(2025, 12, 31).date(),
+                unavail_range = st.date_input(
+                    "Urlaubszeitraum (erster und letzter Tag):",
+                    value=(datetime.now().date(), datetime.now().date()),
+                    min_value=datetime(datetime.now().year - 1, 1, 1).date(),
+                    max_value=datetime(datetime.now().year + 2, 12, 31).date(),
+                    format="DD.MM.YYYY",
                     key=f"unavail_date_{st.session_state.unavail_form_reset_trigger}"
                 )
             with col4:
@@ -1759,7 +4136,7 @@ Max,2,1,4,3,5"""
                     placeholder="z.B. Familienurlaub, Arzttermin...",
                     key=f"unavail_reason_{st.session_state.unavail_form_reset_trigger}"
                 )
-        else:  # Wochentag
+        elif unavail_type == "⛔ Generell nie verfügbar (Wochentag)":
             col3, col4 = st.columns(2)
             with col3:
                 unavail_weekday = st.selectbox(
@@ -1773,6 +4150,53 @@ Max,2,1,4,3,5"""
                     placeholder="z.B. Kinderbetreuung, andere Verpflichtung...",
                     key=f"unavail_reason_{st.session_state.unavail_form_reset_trigger}"
                 )
+        else:  # Regel
+            form_key = st.session_state.unavail_form_reset_trigger
+            rule_kind = st.selectbox(
+                "Muster:",
+                list(UNAVAILABILITY_RULE_KINDS.keys()),
+                format_func=lambda kind: UNAVAILABILITY_RULE_KINDS[kind],
+                key=f"unavail_rule_kind_{form_key}"
+            )
+            
+            col3, col4 = st.columns(2)
+            with col3:
+                if rule_kind == 'every_nth_week':
+                    rule_weekday = st.selectbox("Wochentag:", WEEKDAY_NAMES, key=f"unavail_rule_weekday_{form_key}")
+                    rule_interval = st.number_input("Alle n Wochen:", min_value=1, max_value=8, value=2, key=f"unavail_rule_interval_{form_key}")
+                    rule_anchor = st.date_input("Ab (erstes Vorkommen):", value=datetime.now().date(), format="DD.MM.YYYY", key=f"unavail_rule_anchor_{form_key}")
+                    unavail_rule = {'kind': rule_kind, 'weekday': rule_weekday, 'interval': int(rule_interval), 'anchor': rule_anchor.strftime('%Y-%m-%d')}
+                elif rule_kind == 'nth_weekday_of_month':
+                    rule_weekday = st.selectbox("Wochentag:", WEEKDAY_NAMES, key=f"unavail_rule_weekday_{form_key}")
+                    rule_nth = st.selectbox("Vorkommen im Monat:", [1, 2, 3, 4, -1], format_func=lambda nth: "Letzter" if nth < 0 else f"{nth}.", key=f"unavail_rule_nth_{form_key}")
+                    unavail_rule = {'kind': rule_kind, 'weekday': rule_weekday, 'nth': rule_nth}
+                else:  # weekdays_in_range
+                    rule_weekdays = st.multiselect("Wochentage:", WEEKDAY_NAMES, key=f"unavail_rule_weekdays_{form_key}")
+                    rule_range = st.date_input(
+                        "Zeitraum:",
+                        value=(datetime.now().date(), datetime.now().date() + timedelta(days=27)),
+                        format="DD.MM.YYYY",
+                        key=f"unavail_rule_range_{form_key}"
+                    )
+                    unavail_rule = {
+                        'kind': rule_kind,
+                        'weekdays': [day for day in WEEKDAY_NAMES if day in rule_weekdays],
+                        'start': rule_range[0].strftime('%Y-%m-%d'),
+                        'end': rule_range[-1].strftime('%Y-%m-%d')
+                    } if rule_weekdays and rule_range else None
+            with col4:
+                unavail_reason = st.text_input(
+                    "Grund (optional):",
+                    placeholder="z.B. Berufsschule, Teamtermin...",
+                    key=f"unavail_reason_{form_key}"
+                )
+                
+                # Vorschau: nächste gesperrte Arbeitstage (Auswertung nur für die nächsten 26 Wochen)
+                if unavail_rule:
+                    preview_days = get_working_days(datetime.now().date(), datetime.now().date() + timedelta(weeks=26))
+                    preview_mask = evaluate_unavailability_rule(unavail_rule, [day.toordinal() for day in preview_days])
+                    next_blocked = [day.strftime('%d.%m.%Y') for day, blocked in zip(preview_days, preview_mask) if blocked][:5]
+                    st.caption("**Nächste Termine:** " + (", ".join(next_blocked) if next_blocked else "keine in den nächsten 26 Wochen"))
         
         # Submit Button
         submitted = st.button("Nichtverfügbarkeit speichern", type="primary", use_container_width=True)
@@ -1781,27 +4205,55 @@ Max,2,1,4,3,5"""
             # Validierung der Eingaben
             if unavail_name == "Bitte wählen...":
                 st.error("❌ Bitte wählen Sie eine Person aus.")
-            elif unavail_type == "🏖️ Urlaub (spezifisches Datum)":
-                # Prüfe Urlaubsdatum
-                if unavail_date:
-                    # Prüfe ob es ein Werktag ist
-                    if unavail_date.weekday() >= 5:  # Samstag=5, Sonntag=6
+            elif unavail_type == "🏖️ Urlaub (Zeitraum)":
+                # Prüfe Urlaubszeitraum (ein einzelnes Datum gilt als eintägiger Urlaub)
+                if unavail_range:
+                    vacation_start = unavail_range[0]
+                    vacation_end = unavail_range[-1]
+                    
+                    # Prüfe ob der Zeitraum mindestens einen Werktag enthält
+                    if not any((vacation_start + timedelta(days=offset)).weekday() < 5 for offset in range(min((vacation_end - vacation_start).days + 1, 7))):
                         st.error("❌ Urlaub kann nur für Werktage (Mo-Fr) eingetragen werden.")
                     else:
-                        # Speichere Urlaub
+                        # Speichere Urlaub als ein Zeitraum
                         save_unavailability(
                             unavail_name, 
                             "urlaub", 
                             current_team_id,
-                            date=unavail_date.strftime('%Y-%m-%d'),
+                            date=vacation_start.strftime('%Y-%m-%d'),
+                            end_date=vacation_end.strftime('%Y-%m-%d'),
                             reason=unavail_reason
                         )
-                        st.success(f"✅ Urlaub für **{unavail_name}** am {unavail_date.strftime('%d.%m.%Y')} im Team **{selected_team}** eingetragen! 🏖️")
+                        remember_unavailability_conflicts(current_team_id, unavail_name, find_unavailability_conflicts(
+                            unavail_name, "urlaub", current_team_id,
+                            date=vacation_start.strftime('%Y-%m-%d'), end_date=vacation_end.strftime('%Y-%m-%d')
+                        ))
+                        period_text = format_vacation_period(vacation_start.strftime('%Y-%m-%d'), vacation_end.strftime('%Y-%m-%d'))
+                        st.success(f"✅ Urlaub für **{unavail_name}** {period_text} im Team **{selected_team}** eingetragen! 🏖️")
                         # Reset das Formular
                         st.session_state.unavail_form_reset_trigger += 1
                         st.rerun()
                 else:
-                    st.error("❌ Bitte wählen Sie ein Datum aus.")
+                    st.error("❌ Bitte wählen Sie einen Zeitraum aus.")
+            elif unavail_type == "🔁 Wiederkehrend (Regel)":
+                if not unavail_rule:
+                    st.error("❌ Bitte wählen Sie mindestens einen Wochentag aus.")
+                else:
+                    # Speichere nur die Regel - die gesperrten Tage werden erst bei der Planung ausgewertet
+                    save_unavailability(
+                        unavail_name,
+                        "regel",
+                        current_team_id,
+                        reason=unavail_reason,
+                        rule=unavail_rule
+                    )
+                    remember_unavailability_conflicts(current_team_id, unavail_name, find_unavailability_conflicts(
+                        unavail_name, "regel", current_team_id, rule=unavail_rule
+                    ))
+                    st.success(f"✅ Regel für **{unavail_name}** im Team **{selected_team}** gespeichert: {describe_unavailability_rule(json.dumps(unavail_rule))} 🔁")
+                    # Reset das Formular
+                    st.session_state.unavail_form_reset_trigger += 1
+                    st.rerun()
             else:  # Wochentag
                 if unavail_weekday == "Bitte wählen...":
                     st.error("❌ Bitte wählen Sie einen Wochentag aus.")
@@ -1814,62 +4266,46 @@ Max,2,1,4,3,5"""
                         weekday=unavail_weekday,
                         reason=unavail_reason
                     )
+                    remember_unavailability_conflicts(current_team_id, unavail_name, find_unavailability_conflicts(
+                        unavail_name, "wochentag", current_team_id, weekday=unavail_weekday
+                    ))
                     st.success(f"✅ **{unavail_name}** ist im Team **{selected_team}** ab sofort nie am {unavail_weekday} verfügbar! ⛔")
                     # Reset das Formular
                     st.session_state.unavail_form_reset_trigger += 1
                     st.rerun()
         
-        # Löschoptionen
-        if unavail_entries:
+        # Löschoptionen (Mehrfachauswahl auf der aktuellen Seite, gelöscht wird per ID)
+        if unavail_page:
             st.divider()
             st.subheader("🗑️ Einträge löschen")
             
-            # Erstelle Optionen für Selectbox
-            delete_options = ["Keine Auswahl"]
-            for i, (name, entry_type, date, weekday, reason) in enumerate(unavail_entries):
-                if entry_type == "urlaub":
-                    if date:
-                        date_obj = datetime.strptime(date, '%Y-%m-%d')
-                        formatted_date = date_obj.strftime('%d.%m.%Y')
-                        option_text = f"{name} - Urlaub am {formatted_date}"
-                    else:
-                        option_text = f"{name} - Urlaub (Datum fehlt)"
-                else:  # wochentag
-                    option_text = f"{name} - Nie verfügbar am {weekday}"
-                
+            entry_labels = {}
+            for entry_id, name, entry_type, entry_date, end_date, weekday, reason, rule in unavail_page:
+                option_text = f"{name} - {describe_unavailability_entry(entry_type, entry_date, end_date, weekday, rule)}"
                 if reason:
                     option_text += f" ({reason})"
-                    
-                delete_options.append(option_text)
+                entry_labels[entry_id] = option_text
             
-            delete_selection = st.selectbox(
-                "Eintrag zum Löschen auswählen:",
-                delete_options,
-                key="delete_unavail_selectbox"
+            delete_ids = st.multiselect(
+                "Einträge zum Löschen auswählen:",
+                list(entry_labels.keys()),
+                format_func=lambda entry_id: entry_labels[entry_id],
+                key="delete_unavail_multiselect"
             )
             
-            if delete_selection != "Keine Auswahl":
-                selected_index = delete_options.index(delete_selection) - 1  # -1 wegen "Keine Auswahl"
-                
-                if st.button(f"🗑️ Löschen: {delete_selection}", type="secondary"):
+            if delete_ids:
+                if st.button(f"🗑️ {len(delete_ids)} Einträge löschen", type="secondary"):
                     if st.session_state.get("confirm_delete_unavail", False):
-                        # Lösche den Eintrag - wir brauchen die echte DB ID
-                        conn = sqlite3.connect('schichtplaner.db')
-                        cursor = conn.cursor()
-                        cursor.execute('SELECT id FROM unavailability WHERE team_id = ? ORDER BY name, date, weekday LIMIT 1 OFFSET ?', (current_team_id, selected_index))
-                        result = cursor.fetchone()
-                        if result:
-                            entry_id = result[0]
-                            delete_unavailability(entry_id)
-                            st.success(f"✅ Eintrag wurde gelöscht.")
-                        conn.close()
+                        deleted = delete_unavailability_entries(delete_ids, current_team_id)
+                        st.success(f"✅ {deleted} Einträge wurden gelöscht.")
                         
                         if "confirm_delete_unavail" in st.session_state:
                             del st.session_state["confirm_delete_unavail"]
+                        del st.session_state["delete_unavail_multiselect"]
                         st.rerun()
                     else:
                         st.session_state.confirm_delete_unavail = True
-                        st.warning(f"⚠️ Klicken Sie erneut, um den Eintrag endgültig zu löschen!")
+                        st.warning(f"⚠️ Klicken Sie erneut, um die Einträge endgültig zu löschen!")
     
     elif mode == "Schichtplan generieren":
         # Setze current_mode für korrekte Navigation
@@ -2014,23 +4450,94 @@ Max,2,1,4,3,5"""
             if 'schedule_valid' not in locals() or not schedule_valid:
                 schedule_button_disabled = True
                 
+        # Übertrag aus früheren Plänen (Fairness-Ledger)
+        ledger = load_fairness_ledger(current_team_id)
+        use_carry_over = st.checkbox(
+            "⚖️ Ausgleich aus früheren Plänen berücksichtigen",
+            value=False,
+            disabled=not ledger,
+            help="Wer in bisherigen Plänen mehr Schichten hatte, bekommt im neuen Plan entsprechend weniger"
+        )
+        if ledger:
+            with st.expander("📒 Bisherige Schichten (Fairness-Ledger)"):
+                ledger_df = pd.DataFrame([
+                    {
+                        "Name": name,
+                        "Schichten gesamt": counts['shifts'],
+                        "🥇 1. Wünsche": counts['first'],
+                        "🥈 2. Wünsche": counts['second'],
+                        "🥉 3. Wünsche": counts['third'],
+                        "🏅 4. Wünsche": counts['fourth'],
+                        "🏅 5. Wünsche": counts['fifth']
+                    }
+                    for name, counts in ledger.items()
+                ])
+                st.dataframe(ledger_df, use_container_width=True, hide_index=True)
+        
+        # Stabile Neuplanung auf Basis des gespeicherten Plans (Warmstart)
+        stored_schedule = load_schedule(current_team_id)
+        stable_mode = st.checkbox(
+            "🧷 Stabil neu planen (gespeicherten Plan als Ausgangspunkt)",
+            value=False,
+            disabled=not stored_schedule,
+            help="Nur Konflikte, neue Tage, der faire Anteil und deutlich verschlechterte Wünsche werden angepasst - alle anderen Tage bleiben unverändert. Der Ausgleich aus früheren Plänen gilt nur für die komplette Neuplanung."
+        )
+        
         if st.button("🎯 Schichtplan generieren", type="primary", disabled=schedule_button_disabled):
             with st.spinner("Generiere optimalen Schichtplan..."):
-                schedule, assignment_count, preference_score, preference_stats = generate_fair_schedule(
-                    preferences, 
-                    current_team_id,
-                    start_date=schedule_start_date, 
-                    end_date=schedule_end_date
-                )
-                save_schedule(schedule, current_team_id)
+                changes = None
+                if stable_mode:
+                    schedule, assignment_count, preference_score, preference_stats, changes = generate_stable_schedule(
+                        preferences,
+                        current_team_id,
+                        stored_schedule,
+                        start_date=schedule_start_date,
+                        end_date=schedule_end_date
+                    )
+                else:
+                    carry_over = ledger_carry_over(ledger, stored_schedule, schedule_start_date) if use_carry_over else None
+                    schedule, assignment_count, preference_score, preference_stats = generate_fair_schedule(
+                        preferences, 
+                        current_team_id,
+                        start_date=schedule_start_date, 
+                        end_date=schedule_end_date,
+                        carry_over=carry_over
+                    )
+                try:
+                    new_version = save_schedule(schedule, current_team_id, expected_version, label="Plan generiert")
+                except VersionConflictError as e:
+                    show_version_conflict(e)
+                    return
+                remember_team_version(current_team_id, new_version)
             
                 # Berechne Anzahl generierter Schichten
-                num_shifts = len(schedule)
+                num_shifts = sum(assignment_count.values())
                 period_text = f"{schedule_start_date.strftime('%d.%m.%Y')} - {schedule_end_date.strftime('%d.%m.%Y')}"
                 
                 st.success(f"✅ Schichtplan für Team **{selected_team}** erfolgreich generiert!")
                 st.info(f"📅 **Zeitraum**: {period_text} | **Schichten**: {num_shifts}")
             
+            # Geänderte Tage gegenüber dem gespeicherten Plan (nur bei stabiler Neuplanung)
+            if changes is not None:
+                st.subheader(f"🔁 Geänderte Tage ({len(changes)})")
+                if changes:
+                    changes_df = pd.DataFrame([
+                        {
+                            "Datum": datetime.strptime(date_str, '%Y-%m-%d').strftime('%d.%m.%Y'),
+                            "Bisher": old_employee or "—",
+                            "Neu": new_employee or "—"
+                        }
+                        for date_str, old_employee, new_employee in changes
+                    ])
+                    st.dataframe(changes_df, use_container_width=True, hide_index=True)
+                else:
+                    st.info("💡 Keine Änderungen gegenüber dem gespeicherten Plan nötig.")
+            
+            # Wer hat gegenüber dem bisherigen Plan welche Tage gewonnen oder verloren
+            if stored_schedule:
+                with st.expander("👥 Änderungen je Person gegenüber dem bisherigen Plan"):
+                    show_schedule_diff(diff_schedules(stored_schedule, schedule, preferences))
+            
             # Statistiken anzeigen
             col1, col2 = st.columns([1, 3])
             
@@ -2093,6 +4600,21 @@ Max,2,1,4,3,5"""
                 with col_e:
                     st.metric("🏅 5. Wünsche", total_fifth)
             
+            # Qualitätskennzahlen des generierten Plans
+            st.subheader("⚖️ Fairness und Qualität")
+            employees, metrics = evaluate_schedule(schedule, preferences, load_unavailability(current_team_id))
+            
+            col_a, col_b, col_c, col_d = st.columns(4)
+            with col_a:
+                st.metric("Gini-Koeffizient", f"{metrics['gini']:.3f}",
+                          help="0 = alle haben gleich viele Schichten, 1 = maximal ungleich")
+            with col_b:
+                st.metric("Max. Abweichung vom fairen Anteil", f"{np.abs(metrics['fair_share_deviation']).max():.1f} Schichten")
+            with col_c:
+                st.metric("Verfügbarkeitskonflikte", int(metrics['availability_violations']))
+            with col_d:
+                st.metric("Schichten an Feiertagen", int(metrics['holiday_assignments']))
+            
             st.info("💡 Der Plan wurde gespeichert und kann unter 'Plan anzeigen' eingesehen werden.")
     
     elif mode == "Manuelle Änderungen":
@@ -2101,215 +4623,363 @@ Max,2,1,4,3,5"""
         
         st.header("✏️ Manuelle Änderungen")
         
-        schedule = load_schedule(current_team_id)
+        # Versionsverlauf: Rückgängig/Wiederholen und Wiederherstellen früherer Stände
+        history_position, history = load_schedule_history(current_team_id)
+        latest_version = history[0][0] if history else 0
+        with st.expander(f"🕘 Versionsverlauf (Version {history_position} von {latest_version})"):
+            col_undo, col_redo = st.columns(2)
+            with col_undo:
+                undo_clicked = st.button("↩️ Rückgängig", disabled=history_position == 0, key="schedule_undo", use_container_width=True)
+            with col_redo:
+                redo_clicked = st.button("↪️ Wiederholen", disabled=history_position >= latest_version, key="schedule_redo", use_container_width=True)
+            
+            if history:
+                st.dataframe(pd.DataFrame([
+                    {
+                        "": "👉" if version_no == history_position else "",
+                        "Version": version_no,
+                        "Zeitpunkt": created_at,
+                        "Änderung": label or "—",
+                        "Geänderte Tage": change_count
+                    }
+                    for version_no, created_at, label, change_count, _ in history
+                ]), use_container_width=True, hide_index=True)
+                
+                col_version, col_restore = st.columns([3, 1])
+                with col_version:
+                    restore_version = st.selectbox(
+                        "Version wiederherstellen:",
+                        [version_no for version_no, *_ in history] + ([0] if history[-1][0] == 1 else []),
+                        format_func=lambda version_no: f"Version {version_no}" if version_no else "Version 0 (vor der ersten Version)",
+                        key="restore_version"
+                    )
+                with col_restore:
+                    st.write("")
+                    restore_clicked = st.button("♻️ Wiederherstellen", key="schedule_restore", use_container_width=True)
+            else:
+                st.caption("Noch keine gespeicherten Versionen.")
+                restore_clicked = False
+            
+            try:
+                if undo_clicked or redo_clicked:
+                    new_version = move_schedule_history(current_team_id, history_position + (1 if redo_clicked else -1), expected_version)
+                    remember_team_version(current_team_id, new_version)
+                    st.rerun()
+                if restore_clicked:
+                    new_version = restore_schedule_version(current_team_id, restore_version, expected_version)
+                    remember_team_version(current_team_id, new_version)
+                    st.rerun()
+            except VersionConflictError as e:
+                show_version_conflict(e)
+                return
+            except ValueError as e:
+                st.error(f"❌ {str(e)}")
+        
+        # Planvergleich: aktueller Plan, frühere Versionen oder Pläne anderer Teams
+        with st.expander("🔍 Pläne vergleichen"):
+            compare_sources = [('current', current_team_id)] + [('version', version_no) for version_no, *_ in history]
+            compare_sources += [('team', team_id) for team_id, _ in get_teams() if team_id != current_team_id]
+            team_names = dict(get_teams())
+            
+            def format_compare_source(source):
+                kind, value = source
+                if kind == 'current':
+                    return "Aktueller Plan"
+                if kind == 'version':
+                    return f"Version {value}"
+                return f"Team '{team_names.get(value, value)}'"
+            
+            def load_compare_source(source):
+                kind, value = source
+                if kind == 'version':
+                    return load_schedule_version(current_team_id, value)
+                return load_schedule(value)
+            
+            col_a, col_b = st.columns(2)
+            with col_a:
+                # Standard: vorletzte Version (Liste: aktueller Plan, dann Versionen absteigend)
+                compare_old = st.selectbox("Von:", compare_sources, index=min(2, len(compare_sources) - 1),
+                                           format_func=format_compare_source, key="compare_old")
+            with col_b:
+                compare_new = st.selectbox("Nach:", compare_sources, index=0,
+                                           format_func=format_compare_source, key="compare_new")
+            
+            if compare_old == compare_new:
+                st.caption("Bitte zwei unterschiedliche Pläne auswählen.")
+            else:
+                try:
+                    show_schedule_diff(diff_schedules(
+                        load_compare_source(compare_old),
+                        load_compare_source(compare_new),
+                        load_preferences(current_team_id)
+                    ))
+                except ValueError as e:
+                    st.error(f"❌ {str(e)}")
+        
+        team_data = load_team_data(current_team_id)
+        schedule = team_data['schedule']
         
         if not schedule:
             st.warning(f"Noch kein Schichtplan für Team '{selected_team}' generiert. Bitte gehen Sie zu 'Schichtplan generieren'.")
             return
         
-        preferences = load_preferences(current_team_id)
-        if not preferences:
+        if not team_data['preferences']:
             st.warning(f"Keine Mitarbeitenden im Team '{selected_team}' definiert. Bitte gehen Sie zu 'Personen eingeben'.")
             return
         
         st.info("💡 Hier können Sie einzelne Tage im Schichtplan tauschen oder ändern.")
         
-        # Auswahl des Bearbeitungsmodus
-        edit_mode = st.radio(
-            "Was möchten Sie tun?",
-            ["Einzelnen Tag ändern", "Zwei Tage tauschen"],
-            horizontal=True
-        )
-        
-        if edit_mode == "Einzelnen Tag ändern":
-            st.subheader("📅 Einzelnen Tag ändern")
-            
-            # Erstelle Liste aller verfügbaren Tage
-            date_options = []
-            for date_str, employee in sorted(schedule.items()):
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                weekday_name = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag"][date_obj.weekday()]
-                display_text = f"{date_obj.strftime('%d.%m.%Y')} ({weekday_name}) - {employee}"
-                date_options.append((date_str, display_text))
-            
-            # Tag auswählen
-            selected_date_info = st.selectbox(
-                "Tag auswählen:",
-                date_options,
-                format_func=lambda x: x[1],
-                help="Wählen Sie den Tag, den Sie ändern möchten"
+        @st.fragment
+        def schedule_edit_view():
+            """Einzelnen Tag ändern oder zwei Tage tauschen (Fragment)"""
+            expected_version = track_team_version(current_team_id, 'schedule_edit_view')
+            team_data = load_team_data(current_team_id)
+            schedule, preferences = team_data['schedule'], team_data['preferences']
+            if not schedule or not preferences:
+                # Inzwischen von anderer Stelle geleert: ganze Seite mit Hinweis neu aufbauen
+                st.rerun()
+            
+            # Auswahl des Bearbeitungsmodus
+            edit_mode = st.radio(
+                "Was möchten Sie tun?",
+                ["Einzelnen Tag ändern", "Zwei Tage tauschen"],
+                horizontal=True
             )
             
-            if selected_date_info:
-                selected_date_str = selected_date_info[0]
-                current_employee = schedule[selected_date_str]
-                date_obj = datetime.strptime(selected_date_str, '%Y-%m-%d')
-                weekday_name = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag"][date_obj.weekday()]
+            if edit_mode == "Einzelnen Tag ändern":
+                st.subheader("📅 Einzelnen Tag ändern")
+                
+                # Tag auswählen (nur das sichtbare Fenster des Plans wird geladen)
+                selected_date_info = schedule_day_picker(
+                    "Tag auswählen:",
+                    "edit_date",
+                    current_team_id,
+                    schedule,
+                    list(preferences.keys()),
+                    help="Wählen Sie den Tag, den Sie ändern möchten"
+                )
+                
+                if selected_date_info:
+                    selected_date_str = selected_date_info[0]
+                    current_employee = schedule[selected_date_str]
+                    date_obj = datetime.strptime(selected_date_str, '%Y-%m-%d')
+                    weekday_name = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag"][date_obj.weekday()]
+                    
+                    st.info(f"**Aktuell:** {date_obj.strftime('%d.%m.%Y')} ({weekday_name}) → {current_employee}")
+                    
+                    # Neuen Mitarbeiter auswählen: Rangliste aus dem Einspring-Index (verfügbar, Wunsch-Rang, Auslastung)
+                    candidates = load_coverage_index(current_team_id).candidates(date_obj.date())
+                    candidate_info = {name: (rank, load, reason) for name, rank, load, reason in candidates}
+                    employee_options = [name for name, *_ in candidates]
+                    try:
+                        current_index = employee_options.index(current_employee)
+                    except ValueError:
+                        current_index = 0
+                    
+                    def format_candidate(name):
+                        rank, load, reason = candidate_info[name]
+                        wish_text = f"{rank + 1}. Wahl" if rank < RANK_NONE else "kein Wunsch"
+                        status = f"❌ {reason}" if reason else f"✅ {wish_text}"
+                        current_text = " · aktuell" if name == current_employee else ""
+                        return f"{name} – {status} · {load} Schichten{current_text}"
+                    
+                    new_employee = st.selectbox(
+                        "Neuen Mitarbeiter auswählen:",
+                        employee_options,
+                        index=current_index,
+                        format_func=format_candidate,
+                        help="Sortiert nach Verfügbarkeit, Wunsch-Rang und Anzahl der Schichten im Plan"
+                    )
+                    
+                    # Warnung bei Änderung anzeigen
+                    if new_employee != current_employee:
+                        st.warning(f"⚠️ Sie sind dabei, {current_employee} durch {new_employee} zu ersetzen.")
+                        
+                        unavailable_reasons = []
+                        if candidate_info[new_employee][2]:
+                            unavailable_reasons.append(candidate_info[new_employee][2])
+                        if is_holiday_berlin(date_obj):
+                            unavailable_reasons.append("Feiertag in Berlin")
+                        
+                        if unavailable_reasons:
+                            reason_text = " und ".join(unavailable_reasons)
+                            st.error(f"❌ {new_employee} ist an diesem Tag nicht verfügbar ({reason_text})!")
+                        
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            if st.button("✅ Änderung bestätigen", type="primary"):
+                                # Aktualisiere den Schedule
+                                updated_schedule = schedule.copy()
+                                updated_schedule[selected_date_str] = new_employee
+                                try:
+                                    new_version = save_schedule(
+                                        updated_schedule, current_team_id, expected_version,
+                                        label=f"{date_obj.strftime('%d.%m.%Y')}: {current_employee} → {new_employee}"
+                                    )
+                                except VersionConflictError as e:
+                                    show_version_conflict(e)
+                                    return
+                                remember_team_version(current_team_id, new_version, 'schedule_edit_view')
+                                st.success(f"✅ Tag erfolgreich geändert: {date_obj.strftime('%d.%m.%Y')} → {new_employee}")
+                                st.rerun()
+                        
+                        with col2:
+                            if st.button("❌ Abbrechen", type="secondary"):
+                                st.rerun()
+                    else:
+                        st.info("💡 Keine Änderung ausgewählt.")
+            
+            elif edit_mode == "Zwei Tage tauschen":
+                st.subheader("🔄 Zwei Tage tauschen")
                 
-                st.info(f"**Aktuell:** {date_obj.strftime('%d.%m.%Y')} ({weekday_name}) → {current_employee}")
+                col1, col2 = st.columns(2)
                 
-                # Neuen Mitarbeiter auswählen
-                employee_options = sorted(preferences.keys())
-                try:
-                    current_index = employee_options.index(current_employee)
-                except ValueError:
-                    current_index = 0
+                with col1:
+                    st.markdown("**Erster Tag:**")
+                    first_date_info = schedule_day_picker(
+                        "Ersten Tag auswählen:",
+                        "first_date",
+                        current_team_id,
+                        schedule,
+                        list(preferences.keys()),
+                        help="Wählen Sie den ersten Tag zum Tauschen"
+                    )
                 
-                new_employee = st.selectbox(
-                    "Neuen Mitarbeiter auswählen:",
-                    employee_options,
-                    index=current_index,
-                    help="Wählen Sie den Mitarbeiter, der an diesem Tag arbeiten soll"
-                )
+                with col2:
+                    st.markdown("**Zweiter Tag:**")
+                    # Der erste Tag wird aus den Optionen herausgefiltert
+                    second_date_info = schedule_day_picker(
+                        "Zweiten Tag auswählen:",
+                        "second_date",
+                        current_team_id,
+                        schedule,
+                        list(preferences.keys()),
+                        exclude=first_date_info[0] if first_date_info else None,
+                        help="Wählen Sie den zweiten Tag zum Tauschen"
+                    )
                 
-                # Warnung bei Änderung anzeigen
-                if new_employee != current_employee:
-                    st.warning(f"⚠️ Sie sind dabei, {current_employee} durch {new_employee} zu ersetzen.")
+                # Tauschvorschläge: Partner-Tage, an denen beide mindestens so gern arbeiten und verfügbar sind
+                if first_date_info:
+                    suggestions = load_coverage_index(current_team_id).swap_partners(
+                        datetime.strptime(first_date_info[0], '%Y-%m-%d').date(),
+                        k=5,
+                        min_day=datetime.now().date()
+                    )
                     
-                    # Prüfe Verfügbarkeit des neuen Mitarbeiters
-                    if is_employee_unavailable(new_employee, date_obj, current_team_id):
-                        st.error(f"❌ {new_employee} ist an diesem Tag nicht verfügbar (Urlaub oder Wochentag-Sperre)!")
+                    def format_rank(rank):
+                        return f"{rank + 1}. Wahl" if rank < RANK_NONE else "kein Wunsch"
                     
-                    unavailable_reasons = []
-                    if is_employee_unavailable(new_employee, date_obj, current_team_id):
-                        unavailable_reasons.append("Urlaub oder Wochentag-Sperre")
-                    if is_holiday_berlin(date_obj):
-                        unavailable_reasons.append("Feiertag in Berlin")
+                    with st.expander(f"💡 Tauschvorschläge ({len(suggestions)})", expanded=bool(suggestions)):
+                        if suggestions:
+                            first_employee_name = schedule[first_date_info[0]]
+                            for i, (partner_day, partner_name, (own_before, own_after), (partner_before, partner_after)) in enumerate(suggestions):
+                                partner_date_str = partner_day.isoformat()
+                                st.button(
+                                    f"{format_schedule_day(partner_date_str, partner_name)} · "
+                                    f"{first_employee_name}: {format_rank(own_before)} → {format_rank(own_after)}, "
+                                    f"{partner_name}: {format_rank(partner_before)} → {format_rank(partner_after)}",
+                                    key=f"swap_suggestion_{i}",
+                                    on_click=jump_schedule_day_picker,
+                                    args=("second_date", partner_date_str, partner_name)
+                                )
+                        else:
+                            st.caption("Keine künftigen Tage gefunden, deren Tausch beide Wünsche verbessert oder hält.")
+                
+                if first_date_info and second_date_info:
+                    first_date_str = first_date_info[0]
+                    second_date_str = second_date_info[0]
+                    
+                    first_employee = schedule[first_date_str]
+                    second_employee = schedule[second_date_str]
                     
-                    if unavailable_reasons:
-                        reason_text = " und ".join(unavailable_reasons)
-                        st.error(f"❌ {new_employee} ist an diesem Tag nicht verfügbar ({reason_text})!")
+                    first_date_obj = datetime.strptime(first_date_str, '%Y-%m-%d')
+                    second_date_obj = datetime.strptime(second_date_str, '%Y-%m-%d')
+                    
+                    first_weekday = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag"][first_date_obj.weekday()]
+                    second_weekday = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag"][second_date_obj.weekday()]
+                    
+                    st.info(f"""
+                    **Tausch-Vorschau:**
+                    - {first_date_obj.strftime('%d.%m.%Y')} ({first_weekday}): {first_employee} → {second_employee}
+                    - {second_date_obj.strftime('%d.%m.%Y')} ({second_weekday}): {second_employee} → {first_employee}
+                    """)
+                    
+                    # Prüfe Verfügbarkeit beider Mitarbeiter für die neuen Tage (inkl. Feiertage)
+                    warnings = []
+                    swap_employees = list(dict.fromkeys([first_employee, second_employee]))
+                    swap_ranks = build_rank_matrix(
+                        {emp: preferences.get(emp, []) for emp in swap_employees},
+                        [first_date_obj, second_date_obj],
+                        load_unavailability(current_team_id)
+                    )
+                    first_row = swap_employees.index(first_employee)
+                    second_row = swap_employees.index(second_employee)
+                    
+                    # Prüfe ersten Mitarbeiter (second_employee) am ersten Tag (first_date_obj)
+                    unavailable_reasons_first = []
+                    if swap_ranks[second_row, 0] == RANK_UNAVAILABLE:
+                        unavailable_reasons_first.append("Urlaub/Wochentag-Sperre")
+                    if is_holiday_berlin(first_date_obj):
+                        unavailable_reasons_first.append("Feiertag")
+                        
+                    if unavailable_reasons_first:
+                        reason_text = "/".join(unavailable_reasons_first)
+                        warnings.append(f"❌ {second_employee} ist am {first_date_obj.strftime('%d.%m.%Y')} nicht verfügbar ({reason_text})!")
+                    
+                    # Prüfe zweiten Mitarbeiter (first_employee) am zweiten Tag (second_date_obj)
+                    unavailable_reasons_second = []
+                    if swap_ranks[first_row, 1] == RANK_UNAVAILABLE:
+                        unavailable_reasons_second.append("Urlaub/Wochentag-Sperre")
+                    if is_holiday_berlin(second_date_obj):
+                        unavailable_reasons_second.append("Feiertag")
+                        
+                    if unavailable_reasons_second:
+                        reason_text = "/".join(unavailable_reasons_second)
+                        warnings.append(f"❌ {first_employee} ist am {second_date_obj.strftime('%d.%m.%Y')} nicht verfügbar ({reason_text})!")
+                    
+                    if warnings:
+                        for warning in warnings:
+                            st.error(warning)
                     
                     col1, col2 = st.columns(2)
                     with col1:
-                        if st.button("✅ Änderung bestätigen", type="primary"):
-                            # Aktualisiere den Schedule
+                        if st.button("🔄 Tausch bestätigen", type="primary", disabled=bool(warnings)):
+                            # Führe den Tausch durch
                             updated_schedule = schedule.copy()
-                            updated_schedule[selected_date_str] = new_employee
-                            save_schedule(updated_schedule, current_team_id)
-                            st.success(f"✅ Tag erfolgreich geändert: {date_obj.strftime('%d.%m.%Y')} → {new_employee}")
+                            updated_schedule[first_date_str] = second_employee
+                            updated_schedule[second_date_str] = first_employee
+                            try:
+                                new_version = save_schedule(
+                                    updated_schedule, current_team_id, expected_version,
+                                    label=f"Tausch {first_date_str} ↔ {second_date_str}"
+                                )
+                            except VersionConflictError as e:
+                                show_version_conflict(e)
+                                return
+                            remember_team_version(current_team_id, new_version, 'schedule_edit_view')
+                            st.success(f"✅ Tausch erfolgreich durchgeführt!")
                             st.rerun()
                     
                     with col2:
                         if st.button("❌ Abbrechen", type="secondary"):
                             st.rerun()
-                else:
-                    st.info("💡 Keine Änderung ausgewählt.")
         
-        elif edit_mode == "Zwei Tage tauschen":
-            st.subheader("🔄 Zwei Tage tauschen")
-            
-            # Erstelle Liste aller verfügbaren Tage
-            date_options = []
-            for date_str, employee in sorted(schedule.items()):
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                weekday_name = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag"][date_obj.weekday()]
-                display_text = f"{date_obj.strftime('%d.%m.%Y')} ({weekday_name}) - {employee}"
-                date_options.append((date_str, display_text))
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("**Erster Tag:**")
-                first_date_info = st.selectbox(
-                    "Ersten Tag auswählen:",
-                    date_options,
-                    format_func=lambda x: x[1],
-                    help="Wählen Sie den ersten Tag zum Tauschen",
-                    key="first_date"
-                )
+        schedule_edit_view()
+        
+        st.divider()
+        
+        # Zeige aktuelle Übersicht der nächsten Wochen
+        st.subheader("📋 Aktuelle Übersicht (nächste 4 Wochen)")
+        
+        # Hole die nächsten 4 Wochen
+        current_weeks_schedule = get_current_and_next_weeks(schedule, 4)
+        
+        if current_weeks_schedule:
+            # Baue weeks_data für aktuelle Wochen
+            weekly_data_current = {}
             
-            with col2:
-                st.markdown("**Zweiter Tag:**")
-                # Filtere den ersten Tag aus den Optionen heraus
-                filtered_options = [opt for opt in date_options if opt != first_date_info] if first_date_info else date_options
-                
-                second_date_info = st.selectbox(
-                    "Zweiten Tag auswählen:",
-                    filtered_options,
-                    format_func=lambda x: x[1],
-                    help="Wählen Sie den zweiten Tag zum Tauschen",
-                    key="second_date"
-                )
-            
-            if first_date_info and second_date_info:
-                first_date_str = first_date_info[0]
-                second_date_str = second_date_info[0]
-                
-                first_employee = schedule[first_date_str]
-                second_employee = schedule[second_date_str]
-                
-                first_date_obj = datetime.strptime(first_date_str, '%Y-%m-%d')
-                second_date_obj = datetime.strptime(second_date_str, '%Y-%m-%d')
-                
-                first_weekday = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag"][first_date_obj.weekday()]
-                second_weekday = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag"][second_date_obj.weekday()]
-                
-                st.info(f"""
-                **Tausch-Vorschau:**
-                - {first_date_obj.strftime('%d.%m.%Y')} ({first_weekday}): {first_employee} → {second_employee}
-                - {second_date_obj.strftime('%d.%m.%Y')} ({second_weekday}): {second_employee} → {first_employee}
-                """)
-                
-                # Prüfe Verfügbarkeit beider Mitarbeiter für die neuen Tage (inkl. Feiertage)
-                warnings = []
-                
-                # Prüfe ersten Mitarbeiter (second_employee) am ersten Tag (first_date_obj)
-                unavailable_reasons_first = []
-                if is_employee_unavailable(second_employee, first_date_obj, current_team_id):
-                    unavailable_reasons_first.append("Urlaub/Wochentag-Sperre")
-                if is_holiday_berlin(first_date_obj):
-                    unavailable_reasons_first.append("Feiertag")
-                    
-                if unavailable_reasons_first:
-                    reason_text = "/".join(unavailable_reasons_first)
-                    warnings.append(f"❌ {second_employee} ist am {first_date_obj.strftime('%d.%m.%Y')} nicht verfügbar ({reason_text})!")
-                
-                # Prüfe zweiten Mitarbeiter (first_employee) am zweiten Tag (second_date_obj)
-                unavailable_reasons_second = []
-                if is_employee_unavailable(first_employee, second_date_obj, current_team_id):
-                    unavailable_reasons_second.append("Urlaub/Wochentag-Sperre")
-                if is_holiday_berlin(second_date_obj):
-                    unavailable_reasons_second.append("Feiertag")
-                    
-                if unavailable_reasons_second:
-                    reason_text = "/".join(unavailable_reasons_second)
-                    warnings.append(f"❌ {first_employee} ist am {second_date_obj.strftime('%d.%m.%Y')} nicht verfügbar ({reason_text})!")
-                
-                if warnings:
-                    for warning in warnings:
-                        st.error(warning)
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.button("🔄 Tausch bestätigen", type="primary", disabled=bool(warnings)):
-                        # Führe den Tausch durch
-                        updated_schedule = schedule.copy()
-                        updated_schedule[first_date_str] = second_employee
-                        updated_schedule[second_date_str] = first_employee
-                        save_schedule(updated_schedule, current_team_id)
-                        st.success(f"✅ Tausch erfolgreich durchgeführt!")
-                        st.rerun()
-                
-                with col2:
-                    if st.button("❌ Abbrechen", type="secondary"):
-                        st.rerun()
-        
-        st.divider()
-        
-        # Zeige aktuelle Übersicht der nächsten Wochen
-        st.subheader("📋 Aktuelle Übersicht (nächste 4 Wochen)")
-        
-        # Hole die nächsten 4 Wochen
-        current_weeks_schedule = get_current_and_next_weeks(schedule, 4)
-        
-        if current_weeks_schedule:
-            # Baue weeks_data für aktuelle Wochen
-            weekly_data_current = {}
-            
-            for date_str, employee in current_weeks_schedule.items():
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                year, week, weekday = date_obj.isocalendar()
+            for date_obj, employee in current_weeks_schedule.iter_days():
+                year, week, weekday = date_obj.isocalendar()
                 
                 # Verwende tatsächliche Daten für Wochenberechnung
                 week_start = date_obj - timedelta(days=date_obj.weekday())
@@ -2404,189 +5074,191 @@ Max,2,1,4,3,5"""
         
         st.header("📋 Generierter Schichtplan")
         
-        schedule = load_schedule(current_team_id)
+        archived_years = list_archived_years(current_team_id)
         
-        if not schedule:
-            st.warning(f"Noch kein Schichtplan für Team '{selected_team}' generiert. Bitte gehen Sie zu 'Schichtplan generieren'.")
-            return
-        
-        # Filter-Optionen
-        col1, col2 = st.columns(2)
-        with col1:
-            month_filter = st.selectbox(
-                "Monat auswählen:",
-                ["Alle"] + [f"{i:02d} - {datetime(datetime.now().year, i, 1).strftime('%B')}" for i in range(1, 13)]
-            )
-        
-        with col2:
-            employee_filter = st.selectbox(
-                "Mitarbeiter filtern:",
-                ["Alle"] + sorted(set(schedule.values()))  # Bereits alphabetisch sortiert
+        # Plan-Archiv: alte Jahre komprimiert auslagern, die aktive Tabelle bleibt klein
+        with st.expander("🗄️ Plan-Archiv"):
+            st.caption("Archivierte Planjahre werden komprimiert gespeichert und können für Ansicht und Statistik wieder einbezogen werden.")
+            if archived_years:
+                st.dataframe(pd.DataFrame([
+                    {"Jahr": year, "Schichttage": shift_count, "Archiviert am": archived_at}
+                    for year, shift_count, archived_at in archived_years
+                ]), use_container_width=True, hide_index=True)
+            
+            current_year = datetime.now().year
+            archive_before = st.number_input(
+                "Alle Planjahre archivieren vor:",
+                min_value=2000,
+                max_value=current_year,
+                value=current_year - 1,
+                step=1,
+                key="archive_before_year"
             )
-        
-        # Daten für Kalenderwochen-Ansicht vorbereiten
-        filtered_schedule = {}
-        for date_str, employee in schedule.items():
-            date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+            if st.button("🗄️ Archivieren", key="archive_schedule"):
+                try:
+                    archived_count, new_version = archive_schedule_years(current_team_id, int(archive_before), expected_version)
+                    if archived_count:
+                        remember_team_version(current_team_id, new_version)
+                        st.success(f"✅ {archived_count} Schichttage vor {int(archive_before)} archiviert")
+                        st.rerun()
+                    else:
+                        st.info(f"Keine Schichten vor {int(archive_before)} vorhanden.")
+                except VersionConflictError as e:
+                    show_version_conflict(e)
+                    return
+        
+        @st.fragment
+        def schedule_view():
+            """Plan mit Monats- und Personenfilter, Downloads und Statistik (Fragment)"""
+            team_data = load_team_data(current_team_id)
+            schedule = team_data['schedule']
+            
+            if archived_years and st.checkbox(
+                f"🗄️ Archivierte Jahre einbeziehen ({', '.join(str(year) for year, _, _ in archived_years)})",
+                key="include_archive",
+                help="Zeigt archivierte Jahre in Plan und Statistik an (nur lesend)"
+            ):
+                schedule = CompactSchedule.merge(load_schedule_archive(current_team_id), schedule)
+            
+            if not schedule:
+                st.warning(f"Noch kein Schichtplan für Team '{selected_team}' generiert. Bitte gehen Sie zu 'Schichtplan generieren'.")
+                return
+            
+            # Filter-Optionen
+            col1, col2 = st.columns(2)
+            with col1:
+                month_filter = st.selectbox(
+                    "Monat auswählen:",
+                    ["Alle"] + [f"{i:02d} - {datetime(datetime.now().year, i, 1).strftime('%B')}" for i in range(1, 13)]
+                )
+            
+            with col2:
+                employee_filter = st.selectbox(
+                    "Mitarbeiter filtern:",
+                    ["Alle"] + sorted(set(schedule.values()))  # Bereits alphabetisch sortiert
+                )
+            
+            # Daten für Kalenderwochen-Ansicht vorbereiten (Filter direkt auf dem Plan-Array)
+            filter_mask = schedule.to_numpy() >= 0
             
             # Monatfilter anwenden
             if month_filter != "Alle":
                 selected_month = int(month_filter.split(" - ")[0])
-                if date_obj.month != selected_month:
-                    continue
+                filter_mask &= schedule.months() == selected_month
             
             # Mitarbeiterfilter anwenden
-            if employee_filter != "Alle" and employee != employee_filter:
-                continue
-                
-            filtered_schedule[date_str] = employee
-        
-        if filtered_schedule:
-            # Erstelle Kalenderwochen-Tabelle basierend auf tatsächlichen Daten
-            weekly_data = {}
+            if employee_filter != "Alle":
+                filter_mask &= schedule.to_numpy() == schedule.names.index(employee_filter)
             
-            for date_str, employee in filtered_schedule.items():
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+            filtered_schedule = schedule.select(filter_mask)
+            
+            if filtered_schedule:
+                # Erstelle Kalenderwochen-Tabelle basierend auf tatsächlichen Daten
+                weekly_data = {}
                 
-                # Berechne Kalenderwoche
-                year, week, weekday = date_obj.isocalendar()
+                for date_obj, employee in filtered_schedule.iter_days():
+                    
+                    # Berechne Kalenderwoche
+                    year, week, weekday = date_obj.isocalendar()
+                    
+                    # Verwende tatsächliche Daten für Wochenberechnung
+                    # Finde Montag dieser Woche
+                    week_start = date_obj - timedelta(days=date_obj.weekday())
+                    # Finde Freitag dieser Woche  
+                    week_end = week_start + timedelta(days=4)
+                    
+                    # Formatiere die KW mit Datumsbereich
+                    kw_display = f"KW {week:02d}"
+                    date_range = f"{week_start.strftime('%d.%m.')} - {week_end.strftime('%d.%m.')}"
+                    kw_key = f"{week:02d}-{year}"  # Eindeutiger Key mit Jahr
+                    
+                    if kw_key not in weekly_data:
+                        # Formatiere mit grauen Klammern und Datum
+                        kw_formatted = f"{kw_display} ({date_range})"
+                        weekly_data[kw_key] = {
+                            "Kalenderwoche": kw_formatted,
+                            "Montag": "",
+                            "Dienstag": "",
+                            "Mittwoch": "",
+                            "Donnerstag": "",
+                            "Freitag": "",
+                            "sort_key": f"{year}-{week:02d}",  # Für korrekte Sortierung
+                            "week_start": week_start  # Für Feiertags-Überprüfung
+                        }
+                    
+                    # Weekday: 1=Montag, 2=Dienstag, ..., 5=Freitag
+                    weekday_names = {1: "Montag", 2: "Dienstag", 3: "Mittwoch", 4: "Donnerstag", 5: "Freitag"}
+                    
+                    if weekday in weekday_names:
+                        day_name = weekday_names[weekday]
+                        # Prüfe ob es ein Feiertag ist
+                        if is_holiday_berlin(date_obj):
+                            weekly_data[kw_key][day_name] = "—"
+                        else:
+                            weekly_data[kw_key][day_name] = employee
                 
-                # Verwende tatsächliche Daten für Wochenberechnung
-                # Finde Montag dieser Woche
-                week_start = date_obj - timedelta(days=date_obj.weekday())
-                # Finde Freitag dieser Woche  
-                week_end = week_start + timedelta(days=4)
+                # Zusätzlich: Fülle alle Feiertage der Kalenderwochen mit "—" auf
+                for kw_key, week_info in weekly_data.items():
+                    week_start = week_info["week_start"]
+                    weekday_names = {1: "Montag", 2: "Dienstag", 3: "Mittwoch", 4: "Donnerstag", 5: "Freitag"}
+                    
+                    # Prüfe jeden Wochentag der Kalenderwoche auf Feiertage
+                    for weekday_num, day_name in weekday_names.items():
+                        current_date = week_start + timedelta(days=weekday_num - 1)
+                        
+                        # Wenn das Feld leer ist und es ein Feiertag ist, fülle mit "—"
+                        if week_info[day_name] == "" and is_holiday_berlin(current_date):
+                            weekly_data[kw_key][day_name] = "—"
                 
-                # Formatiere die KW mit Datumsbereich
-                kw_display = f"KW {week:02d}"
-                date_range = f"{week_start.strftime('%d.%m.')} - {week_end.strftime('%d.%m.')}"
-                kw_key = f"{week:02d}-{year}"  # Eindeutiger Key mit Jahr
+                # Sortiere nach Kalenderwoche und Jahr
+                sorted_weeks = sorted(weekly_data.keys(), key=lambda x: weekly_data[x]["sort_key"])
+                sorted_data = [weekly_data[kw] for kw in sorted_weeks]
                 
-                if kw_key not in weekly_data:
-                    # Formatiere mit grauen Klammern und Datum
-                    kw_formatted = f"{kw_display} ({date_range})"
-                    weekly_data[kw_key] = {
-                        "Kalenderwoche": kw_formatted,
-                        "Montag": "",
-                        "Dienstag": "",
-                        "Mittwoch": "",
-                        "Donnerstag": "",
-                        "Freitag": "",
-                        "sort_key": f"{year}-{week:02d}",  # Für korrekte Sortierung
-                        "week_start": week_start  # Für Feiertags-Überprüfung
-                    }
+                # Entferne sort_key und week_start aus den Daten für die Anzeige
+                for data in sorted_data:
+                    data.pop("sort_key", None)
+                    data.pop("week_start", None)
                 
-                # Weekday: 1=Montag, 2=Dienstag, ..., 5=Freitag
-                weekday_names = {1: "Montag", 2: "Dienstag", 3: "Mittwoch", 4: "Donnerstag", 5: "Freitag"}
+                # Erstelle DataFrame
+                df = pd.DataFrame(sorted_data)
                 
-                if weekday in weekday_names:
-                    day_name = weekday_names[weekday]
-                    # Prüfe ob es ein Feiertag ist
-                    if is_holiday_berlin(date_obj):
-                        weekly_data[kw_key][day_name] = "—"
-                    else:
-                        weekly_data[kw_key][day_name] = employee
-            
-            # Zusätzlich: Fülle alle Feiertage der Kalenderwochen mit "—" auf
-            for kw_key, week_info in weekly_data.items():
-                week_start = week_info["week_start"]
-                weekday_names = {1: "Montag", 2: "Dienstag", 3: "Mittwoch", 4: "Donnerstag", 5: "Freitag"}
+                st.subheader(f"📅 Schichtplan Team '{selected_team}' Kalenderwochen-Ansicht ({len(filtered_schedule)} Schichten)")
                 
-                # Prüfe jeden Wochentag der Kalenderwoche auf Feiertage
-                for weekday_num, day_name in weekday_names.items():
-                    current_date = week_start + timedelta(days=weekday_num - 1)
+                # CSS für bessere Darstellung der Kalenderwochen
+                st.markdown("""
+                    <style>
+                    /* Styling für Kalenderwochen-Tabelle */
+                    .stDataFrame [data-testid="stDataFrameCell"] {
+                        font-size: 0.9em;
+                    }
                     
-                    # Wenn das Feld leer ist und es ein Feiertag ist, fülle mit "—"
-                    if week_info[day_name] == "" and is_holiday_berlin(current_date):
-                        weekly_data[kw_key][day_name] = "—"
-            
-            # Sortiere nach Kalenderwoche und Jahr
-            sorted_weeks = sorted(weekly_data.keys(), key=lambda x: weekly_data[x]["sort_key"])
-            sorted_data = [weekly_data[kw] for kw in sorted_weeks]
-            
-            # Entferne sort_key und week_start aus den Daten für die Anzeige
-            for data in sorted_data:
-                data.pop("sort_key", None)
-                data.pop("week_start", None)
-            
-            # Erstelle DataFrame
-            df = pd.DataFrame(sorted_data)
-            
-            st.subheader(f"📅 Schichtplan Team '{selected_team}' Kalenderwochen-Ansicht ({len(filtered_schedule)} Schichten)")
-            
-            # CSS für bessere Darstellung der Kalenderwochen
-            st.markdown("""
-                <style>
-                /* Styling für Kalenderwochen-Tabelle */
-                .stDataFrame [data-testid="stDataFrameCell"] {
-                    font-size: 0.9em;
-                }
-                
-                /* Allgemeine Verbesserungen */
-                .date-range {
-                    color: #888888 !important;
-                    font-size: 0.85em !important;
-                }
-                </style>
-            """, unsafe_allow_html=True)
-            
-            # Zeige die Tabelle mit verbessertem Styling
-            st.dataframe(
-                df,
-                use_container_width=True,
-                hide_index=True,
-                column_config={
-                    "Kalenderwoche": st.column_config.TextColumn("📅 Kalenderwoche", width="medium", help="Kalenderwoche mit Zeitraum (Montag bis Freitag)"),
-                    "Montag": st.column_config.TextColumn("🔵 Montag", width="medium"),
-                    "Dienstag": st.column_config.TextColumn("🟢 Dienstag", width="medium"),
-                    "Mittwoch": st.column_config.TextColumn("🟡 Mittwoch", width="medium"),
-                    "Donnerstag": st.column_config.TextColumn("🟠 Donnerstag", width="medium"),
-                    "Freitag": st.column_config.TextColumn("🔴 Freitag", width="medium")
-                }
-            )
-            
-            # Zusätzliche Listen-Ansicht als Toggle
-            if st.toggle("📋 Zusätzliche Listen-Ansicht anzeigen"):
-                list_data = []
-                for date_str, employee in sorted(filtered_schedule.items()):
-                    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                    # Prüfe ob es ein Feiertag ist
-                    if is_holiday_berlin(date_obj):
-                        display_employee = "—"
-                    else:
-                        display_employee = employee
-                        
-                    list_data.append({
-                        "Datum": date_obj.strftime('%d.%m.%Y'),
-                        "Wochentag": ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag"][date_obj.weekday()],
-                        "Mitarbeiter": display_employee
-                    })
+                    /* Allgemeine Verbesserungen */
+                    .date-range {
+                        color: #888888 !important;
+                        font-size: 0.85em !important;
+                    }
+                    </style>
+                """, unsafe_allow_html=True)
                 
-                list_df = pd.DataFrame(list_data)
-                st.dataframe(list_df, use_container_width=True, hide_index=True)
-            
-            # Download-Optionen
-            st.subheader("💾 Download-Optionen")
-            
-            # CSV Downloads
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("**📄 CSV-Downloads:**")
-                # Kalenderwochen-CSV
-                weekly_csv = df.to_csv(index=False, encoding='utf-8-sig')
-                st.download_button(
-                    label="📊 Kalenderwochen-Plan (CSV)",
-                    data=weekly_csv,
-                    file_name=f"schichtplan_{selected_team}_kalenderwochen_{datetime.now().year}.csv",
-                    mime="text/csv"
+                # Zeige die Tabelle mit verbessertem Styling
+                st.dataframe(
+                    df,
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        "Kalenderwoche": st.column_config.TextColumn("📅 Kalenderwoche", width="medium", help="Kalenderwoche mit Zeitraum (Montag bis Freitag)"),
+                        "Montag": st.column_config.TextColumn("🔵 Montag", width="medium"),
+                        "Dienstag": st.column_config.TextColumn("🟢 Dienstag", width="medium"),
+                        "Mittwoch": st.column_config.TextColumn("🟡 Mittwoch", width="medium"),
+                        "Donnerstag": st.column_config.TextColumn("🟠 Donnerstag", width="medium"),
+                        "Freitag": st.column_config.TextColumn("🔴 Freitag", width="medium")
+                    }
                 )
                 
-                # Listen-CSV
-                if filtered_schedule:
+                # Zusätzliche Listen-Ansicht als Toggle
+                if st.toggle("📋 Zusätzliche Listen-Ansicht anzeigen"):
                     list_data = []
-                    for date_str, employee in sorted(filtered_schedule.items()):
-                        date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+                    for date_obj, employee in filtered_schedule.iter_days():
                         # Prüfe ob es ein Feiertag ist
                         if is_holiday_berlin(date_obj):
                             display_employee = "—"
@@ -2600,227 +5272,323 @@ Max,2,1,4,3,5"""
                         })
                     
                     list_df = pd.DataFrame(list_data)
-                    list_csv = list_df.to_csv(index=False, encoding='utf-8-sig')
+                    st.dataframe(list_df, use_container_width=True, hide_index=True)
+                
+                # Download-Optionen
+                st.subheader("💾 Download-Optionen")
+                
+                # CSV Downloads
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.markdown("**📄 CSV-Downloads:**")
+                    # Kalenderwochen-CSV
+                    weekly_csv = df.to_csv(index=False, encoding='utf-8-sig')
                     st.download_button(
-                        label="📋 Listen-Plan (CSV)",
-                        data=list_csv,
-                        file_name=f"schichtplan_{selected_team}_liste_{datetime.now().year}.csv",
+                        label="📊 Kalenderwochen-Plan (CSV)",
+                        data=weekly_csv,
+                        file_name=f"schichtplan_{selected_team}_kalenderwochen_{datetime.now().year}.csv",
                         mime="text/csv"
                     )
-            
-            with col2:
-                st.markdown("**📄 PDF-Downloads:**")
-                
-                # Gesamter Zeitraum PDF
-                try:
-                    # Bestimme Start- und Enddatum aus dem filtered_schedule
-                    if filtered_schedule:
-                        dates = [datetime.strptime(date_str, '%Y-%m-%d') for date_str in filtered_schedule.keys()]
-                        start_date = min(dates)
-                        end_date = max(dates)
-                        period_text = f"{start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}"
-                        filename_period = f"{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}"
-                    else:
-                        period_text = "Zeitraum"
-                        filename_period = "zeitraum"
                     
-                    full_period_pdf = generate_pdf_report(
-                        filtered_schedule, 
-                        f"Team {selected_team} - Schichtplan {period_text} ({len(sorted_data)} Kalenderwochen)",
-                        sorted_data,
-                        include_statistics=True,  # Für Zeitraum-PDF Statistiken hinzufügen
-                        team_id=current_team_id
-                    )
-                    st.download_button(
-                        label="🗓️ Gesamter Zeitraum (PDF)",
-                        data=full_period_pdf.getvalue(),
-                        file_name=f"schichtplan_{selected_team}_{filename_period}.pdf",
-                        mime="application/pdf"
-                    )
-                except Exception as e:
-                    st.error(f"PDF-Generierung fehlgeschlagen: {str(e)}")
+                    # Listen-CSV
+                    if filtered_schedule:
+                        list_data = []
+                        for date_obj, employee in filtered_schedule.iter_days():
+                            # Prüfe ob es ein Feiertag ist
+                            if is_holiday_berlin(date_obj):
+                                display_employee = "—"
+                            else:
+                                display_employee = employee
+                                
+                            list_data.append({
+                                "Datum": date_obj.strftime('%d.%m.%Y'),
+                                "Wochentag": ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag"][date_obj.weekday()],
+                                "Mitarbeiter": display_employee
+                            })
+                        
+                        list_df = pd.DataFrame(list_data)
+                        list_csv = list_df.to_csv(index=False, encoding='utf-8-sig')
+                        st.download_button(
+                            label="📋 Listen-Plan (CSV)",
+                            data=list_csv,
+                            file_name=f"schichtplan_{selected_team}_liste_{datetime.now().year}.csv",
+                            mime="text/csv"
+                        )
                 
-                # Aktuelle + nächste 3 KW PDF
-                try:
-                    current_date = datetime.now()
-                    current_week = current_date.isocalendar()[1]
-                    
-                    # Hole original schedule (nicht gefiltert) für aktuelle Wochen
-                    original_schedule = load_schedule(current_team_id)
-                    current_weeks_schedule = get_current_and_next_weeks(original_schedule, 4)
+                with col2:
+                    st.markdown("**📄 PDF-Downloads:**")
                     
-                    if current_weeks_schedule:
-                        # Baue weeks_data für aktuelle Wochen
-                        weekly_data_current = {}
+                    # PDFs (und damit ReportLab) nur auf Klick erzeugen; die Dateien gelten für genau diesen Filterstand
+                    pdf_state_key = (
+                        current_team_id, get_change_counter(current_team_id, 'schedule'), month_filter, employee_filter,
+                        st.session_state.get('include_archive', False), datetime.now().date()
+                    )
+                    if st.button("📄 PDFs erstellen", key="prepare_pdfs"):
+                        pdf_files = []     # (Beschriftung, Inhalt, Dateiname)
+                        pdf_messages = []  # (Art, Text) für Hinweise und Fehler
                         
-                        for date_str, employee in current_weeks_schedule.items():
-                            date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                            year, week, weekday = date_obj.isocalendar()
-                            
-                            # Verwende tatsächliche Daten für Wochenberechnung
-                            week_start = date_obj - timedelta(days=date_obj.weekday())
-                            week_end = week_start + timedelta(days=4)
-                            
-                            kw_display = f"KW {week:02d}"
-                            date_range = f"{week_start.strftime('%d.%m.')} - {week_end.strftime('%d.%m.')}"
-                            kw_key = f"KW {week:02d}"
-                            
-                            if kw_key not in weekly_data_current:
-                                weekly_data_current[kw_key] = {
-                                    "Kalenderwoche": f"{kw_display} ({date_range})",
-                                    "Montag": "",
-                                    "Dienstag": "",
-                                    "Mittwoch": "",
-                                    "Donnerstag": "",
-                                    "Freitag": "",
-                                    "week_start": week_start  # Für Feiertags-Überprüfung
-                                }
+                        # Gesamter Zeitraum PDF
+                        try:
+                            # Bestimme Start- und Enddatum aus dem filtered_schedule
+                            if filtered_schedule:
+                                dates = filtered_schedule.dates()
+                                start_date = dates[0]
+                                end_date = dates[-1]
+                                period_text = f"{start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}"
+                                filename_period = f"{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}"
+                            else:
+                                period_text = "Zeitraum"
+                                filename_period = "zeitraum"
                             
-                            weekday_names = {1: "Montag", 2: "Dienstag", 3: "Mittwoch", 4: "Donnerstag", 5: "Freitag"}
-                            if weekday in weekday_names:
-                                day_name = weekday_names[weekday]
-                                # Prüfe ob es ein Feiertag ist
-                                if is_holiday_berlin(date_obj):
-                                    weekly_data_current[kw_key][day_name] = "—"
-                                else:
-                                    weekly_data_current[kw_key][day_name] = employee
+                            full_period_pdf = generate_pdf_report(
+                                filtered_schedule, 
+                                f"Team {selected_team} - Schichtplan {period_text} ({len(sorted_data)} Kalenderwochen)",
+                                sorted_data,
+                                include_statistics=True,  # Für Zeitraum-PDF Statistiken hinzufügen
+                                team_id=current_team_id
+                            )
+                            pdf_files.append((
+                                "🗓️ Gesamter Zeitraum (PDF)",
+                                full_period_pdf.getvalue(),
+                                f"schichtplan_{selected_team}_{filename_period}.pdf"
+                            ))
+                        except Exception as e:
+                            pdf_messages.append(('error', f"PDF-Generierung fehlgeschlagen: {str(e)}"))
                         
-                        # Zusätzlich: Fülle alle Feiertage der Kalenderwochen mit "—" auf
-                        for kw_key, week_info in weekly_data_current.items():
-                            week_start = week_info["week_start"]
-                            weekday_names = {1: "Montag", 2: "Dienstag", 3: "Mittwoch", 4: "Donnerstag", 5: "Freitag"}
+                        # Aktuelle + nächste 3 KW PDF
+                        try:
+                            current_date = datetime.now()
+                            current_week = current_date.isocalendar()[1]
                             
-                            # Prüfe jeden Wochentag der Kalenderwoche auf Feiertage
-                            for weekday_num, day_name in weekday_names.items():
-                                current_date = week_start + timedelta(days=weekday_num - 1)
+                            # Hole original schedule (nicht gefiltert) für aktuelle Wochen
+                            original_schedule = load_schedule(current_team_id)
+                            current_weeks_schedule = get_current_and_next_weeks(original_schedule, 4)
+                            
+                            if current_weeks_schedule:
+                                # Baue weeks_data für aktuelle Wochen
+                                weekly_data_current = {}
                                 
-                                # Wenn das Feld leer ist und es ein Feiertag ist, fülle mit "—"
-                                if week_info[day_name] == "" and is_holiday_berlin(current_date):
-                                    weekly_data_current[kw_key][day_name] = "—"
-                        
-                        sorted_weeks_current = sorted(weekly_data_current.keys(), key=lambda x: int(x.split()[1]))
-                        sorted_data_current = [weekly_data_current[kw] for kw in sorted_weeks_current]
-                        
-                        # Entferne week_start aus den Daten für die PDF-Generierung
-                        for data in sorted_data_current:
-                            data.pop("week_start", None)
-                        
-                        current_weeks_pdf = generate_pdf_report(
-                            current_weeks_schedule,
-                            f"Team {selected_team} - Aktuelle und nächste 3 Kalenderwochen (KW {current_week}-{current_week+3})",
-                            sorted_data_current,
-                            team_id=current_team_id
-                        )
-                        st.download_button(
-                            label="📅 Nächste 4 Wochen (PDF)",
-                            data=current_weeks_pdf.getvalue(),
-                            file_name=f"schichtplan_{selected_team}_naechste_4kw.pdf",
-                            mime="application/pdf"
-                        )
-                    else:
-                        st.info("Keine Daten für die nächsten 4 Wochen verfügbar.")
+                                for date_obj, employee in current_weeks_schedule.iter_days():
+                                    year, week, weekday = date_obj.isocalendar()
+                                    
+                                    # Verwende tatsächliche Daten für Wochenberechnung
+                                    week_start = date_obj - timedelta(days=date_obj.weekday())
+                                    week_end = week_start + timedelta(days=4)
+                                    
+                                    kw_display = f"KW {week:02d}"
+                                    date_range = f"{week_start.strftime('%d.%m.')} - {week_end.strftime('%d.%m.')}"
+                                    kw_key = f"KW {week:02d}"
+                                    
+                                    if kw_key not in weekly_data_current:
+                                        weekly_data_current[kw_key] = {
+                                            "Kalenderwoche": f"{kw_display} ({date_range})",
+                                            "Montag": "",
+                                            "Dienstag": "",
+                                            "Mittwoch": "",
+                                            "Donnerstag": "",
+                                            "Freitag": "",
+                                            "week_start": week_start  # Für Feiertags-Überprüfung
+                                        }
+                                    
+                                    weekday_names = {1: "Montag", 2: "Dienstag", 3: "Mittwoch", 4: "Donnerstag", 5: "Freitag"}
+                                    if weekday in weekday_names:
+                                        day_name = weekday_names[weekday]
+                                        # Prüfe ob es ein Feiertag ist
+                                        if is_holiday_berlin(date_obj):
+                                            weekly_data_current[kw_key][day_name] = "—"
+                                        else:
+                                            weekly_data_current[kw_key][day_name] = employee
+                                
+                                # Zusätzlich: Fülle alle Feiertage der Kalenderwochen mit "—" auf
+                                for kw_key, week_info in weekly_data_current.items():
+                                    week_start = week_info["week_start"]
+                                    weekday_names = {1: "Montag", 2: "Dienstag", 3: "Mittwoch", 4: "Donnerstag", 5: "Freitag"}
+                                    
+                                    # Prüfe jeden Wochentag der Kalenderwoche auf Feiertage
+                                    for weekday_num, day_name in weekday_names.items():
+                                        current_date = week_start + timedelta(days=weekday_num - 1)
+                                        
+                                        # Wenn das Feld leer ist und es ein Feiertag ist, fülle mit "—"
+                                        if week_info[day_name] == "" and is_holiday_berlin(current_date):
+                                            weekly_data_current[kw_key][day_name] = "—"
+                                
+                                sorted_weeks_current = sorted(weekly_data_current.keys(), key=lambda x: int(x.split()[1]))
+                                sorted_data_current = [weekly_data_current[kw] for kw in sorted_weeks_current]
+                                
+                                # Entferne week_start aus den Daten für die PDF-Generierung
+                                for data in sorted_data_current:
+                                    data.pop("week_start", None)
+                                
+                                current_weeks_pdf = generate_pdf_report(
+                                    current_weeks_schedule,
+                                    f"Team {selected_team} - Aktuelle und nächste 3 Kalenderwochen (KW {current_week}-{current_week+3})",
+                                    sorted_data_current,
+                                    team_id=current_team_id
+                                )
+                                pdf_files.append((
+                                    "📅 Nächste 4 Wochen (PDF)",
+                                    current_weeks_pdf.getvalue(),
+                                    f"schichtplan_{selected_team}_naechste_4kw.pdf"
+                                ))
+                            else:
+                                pdf_messages.append(('info', "Keine Daten für die nächsten 4 Wochen verfügbar."))
+                                
+                        except Exception as e:
+                            pdf_messages.append(('error', f"PDF-Generierung (4 Wochen) fehlgeschlagen: {str(e)}"))
                         
-                except Exception as e:
-                    st.error(f"PDF-Generierung (4 Wochen) fehlgeschlagen: {str(e)}")
+                        st.session_state.pdf_downloads = (pdf_state_key, pdf_files, pdf_messages)
                     
-                # Alte get_week_dates Funktion entfernt - wird nicht mehr benötigt
-            
-            # Statistiken anzeigen
-            st.divider()
-            st.subheader(f"📊 Statistiken Team '{selected_team}' zum angezeigten Zeitraum")
-            
-            # Lade Präferenzen für Statistiken
-            preferences = load_preferences(current_team_id)
-            
-            if preferences:
-                # Berechne Statistiken basierend auf dem gefilterten Schedule
-                assignment_count, preference_stats = calculate_statistics_from_schedule(filtered_schedule, current_team_id)
-                
-                if assignment_count:
-                    col1, col2 = st.columns([1, 3])
+                    pdf_downloads = st.session_state.get('pdf_downloads')
+                    if pdf_downloads and pdf_downloads[0] == pdf_state_key:
+                        for label, data, file_name in pdf_downloads[1]:
+                            st.download_button(label=label, data=data, file_name=file_name, mime="application/pdf")
+                        for kind, text in pdf_downloads[2]:
+                            if kind == 'error':
+                                st.error(text)
+                            else:
+                                st.info(text)
                     
-                    with col1:
-                        st.subheader("📊 Schichtverteilung")
-                        stats_df = pd.DataFrame([
-                            {"Name": name, "Anzahl Schichten": count}
-                            for name, count in assignment_count.items()
-                        ]).sort_values("Anzahl Schichten", ascending=False)
-                        st.dataframe(stats_df, use_container_width=True)
-                        
-                        # Zeige Gesamtsumme
-                        total_shifts = sum(assignment_count.values())
-                        st.metric("Summe", f"{total_shifts} Schichten", 
-                                 help="Gesamtanzahl aller zugewiesenen Schichten")
+                    # Alte get_week_dates Funktion entfernt - wird nicht mehr benötigt
+                
+                # Statistiken anzeigen
+                st.divider()
+                st.subheader(f"📊 Statistiken Team '{selected_team}' zum angezeigten Zeitraum")
+                
+                # Lade Präferenzen für Statistiken
+                preferences = team_data['preferences']
+                
+                if preferences:
+                    # Berechne Statistiken basierend auf dem gefilterten Schedule
+                    assignment_count, preference_stats = calculate_statistics_from_schedule(filtered_schedule, current_team_id)
                     
-                    with col2:
-                        st.subheader("🎯 Detaillierte Wunscherfüllung")
-                        
-                        # Erstelle detaillierte Wunsch-Statistik
-                        detailed_stats = []
-                        for name in sorted(preferences.keys()):
-                            if name in assignment_count:  # Nur Mitarbeiter anzeigen, die im gefilterten Zeitraum Schichten haben
-                                total_assignments = assignment_count[name]
-                                first_wishes = preference_stats[name]['first']
-                                second_wishes = preference_stats[name]['second'] 
-                                third_wishes = preference_stats[name]['third']
-                                fourth_wishes = preference_stats[name]['fourth']
-                                fifth_wishes = preference_stats[name]['fifth']
-                                
-                                detailed_stats.append({
-                                    "Name": name,
-                                    "🥇 1. Wünsche": first_wishes,
-                                    "🥈 2. Wünsche": second_wishes,
-                                    "🥉 3. Wünsche": third_wishes,
-                                    "🏅 4. Wünsche": fourth_wishes,
-                                    "🏅 5. Wünsche": fifth_wishes,
-                                    "Gesamt": total_assignments
-                                })
+                    if assignment_count:
+                        col1, col2 = st.columns([1, 3])
                         
-                        pref_df = pd.DataFrame(detailed_stats)
-                        st.dataframe(pref_df, use_container_width=True)
-                        
-                        # Zeige Fairness-Metriken für Wünsche
-                        total_first = sum(preference_stats[emp]['first'] for emp in assignment_count.keys())
-                        total_second = sum(preference_stats[emp]['second'] for emp in assignment_count.keys())
-                        total_third = sum(preference_stats[emp]['third'] for emp in assignment_count.keys())
-                        total_fourth = sum(preference_stats[emp]['fourth'] for emp in assignment_count.keys())
-                        total_fifth = sum(preference_stats[emp]['fifth'] for emp in assignment_count.keys())
+                        with col1:
+                            st.subheader("📊 Schichtverteilung")
+                            stats_df = pd.DataFrame([
+                                {"Name": name, "Anzahl Schichten": count}
+                                for name, count in assignment_count.items()
+                            ]).sort_values("Anzahl Schichten", ascending=False)
+                            st.dataframe(stats_df, use_container_width=True)
+                            
+                            # Zeige Gesamtsumme
+                            total_shifts = sum(assignment_count.values())
+                            st.metric("Summe", f"{total_shifts} Schichten", 
+                                     help="Gesamtanzahl aller zugewiesenen Schichten")
                         
-                        col_a, col_b, col_c, col_d, col_e = st.columns(5)
+                        with col2:
+                            st.subheader("🎯 Detaillierte Wunscherfüllung")
+                            
+                            # Erstelle detaillierte Wunsch-Statistik
+                            detailed_stats = []
+                            for name in sorted(preferences.keys()):
+                                if name in assignment_count:  # Nur Mitarbeiter anzeigen, die im gefilterten Zeitraum Schichten haben
+                                    total_assignments = assignment_count[name]
+                                    first_wishes = preference_stats[name]['first']
+                                    second_wishes = preference_stats[name]['second'] 
+                                    third_wishes = preference_stats[name]['third']
+                                    fourth_wishes = preference_stats[name]['fourth']
+                                    fifth_wishes = preference_stats[name]['fifth']
+                                    
+                                    detailed_stats.append({
+                                        "Name": name,
+                                        "🥇 1. Wünsche": first_wishes,
+                                        "🥈 2. Wünsche": second_wishes,
+                                        "🥉 3. Wünsche": third_wishes,
+                                        "🏅 4. Wünsche": fourth_wishes,
+                                        "🏅 5. Wünsche": fifth_wishes,
+                                        "Gesamt": total_assignments
+                                    })
+                            
+                            pref_df = pd.DataFrame(detailed_stats)
+                            st.dataframe(pref_df, use_container_width=True)
+                            
+                            # Zeige Fairness-Metriken für Wünsche
+                            total_first = sum(preference_stats[emp]['first'] for emp in assignment_count.keys())
+                            total_second = sum(preference_stats[emp]['second'] for emp in assignment_count.keys())
+                            total_third = sum(preference_stats[emp]['third'] for emp in assignment_count.keys())
+                            total_fourth = sum(preference_stats[emp]['fourth'] for emp in assignment_count.keys())
+                            total_fifth = sum(preference_stats[emp]['fifth'] for emp in assignment_count.keys())
+                            
+                            col_a, col_b, col_c, col_d, col_e = st.columns(5)
+                            with col_a:
+                                st.metric("🥇 1. Wünsche", total_first)
+                            with col_b:
+                                st.metric("🥈 2. Wünsche", total_second)
+                            with col_c:
+                                st.metric("🥉 3. Wünsche", total_third)
+                            with col_d:
+                                st.metric("🏅 4. Wünsche", total_fourth)
+                            with col_e:
+                                st.metric("🏅 5. Wünsche", total_fifth)
+
+                        # Qualitätskennzahlen des angezeigten Zeitraums
+                        employees, metrics = evaluate_schedule(filtered_schedule, preferences, team_data['unavailability'])
+                        col_a, col_b, col_c, col_d = st.columns(4)
                         with col_a:
-                            st.metric("🥇 1. Wünsche", total_first)
+                            st.metric("Gini-Koeffizient", f"{metrics['gini']:.3f}",
+                                      help="0 = alle haben gleich viele Schichten, 1 = maximal ungleich")
                         with col_b:
-                            st.metric("🥈 2. Wünsche", total_second)
+                            st.metric("Max. Abweichung vom fairen Anteil", f"{np.abs(metrics['fair_share_deviation']).max():.1f} Schichten")
                         with col_c:
-                            st.metric("🥉 3. Wünsche", total_third)
+                            st.metric("Verfügbarkeitskonflikte", int(metrics['availability_violations']))
                         with col_d:
-                            st.metric("🏅 4. Wünsche", total_fourth)
-                        with col_e:
-                            st.metric("🏅 5. Wünsche", total_fifth)
+                            st.metric("Schichten an Feiertagen", int(metrics['holiday_assignments']))
+                    else:
+                        st.info("Keine Daten für Statistiken im gewählten Zeitraum verfügbar.")
                 else:
-                    st.info("Keine Daten für Statistiken im gewählten Zeitraum verfügbar.")
+                    st.warning("Keine Mitarbeiterpräferenzen gefunden. Statistiken können nicht berechnet werden.")
+                        
             else:
-                st.warning("Keine Mitarbeiterpräferenzen gefunden. Statistiken können nicht berechnet werden.")
-                    
-        else:
-            st.info("Keine Einträge für die gewählten Filter gefunden.")
+                st.info("Keine Einträge für die gewählten Filter gefunden.")
+        
+        schedule_view()
     
 
+@st.cache_resource(max_entries=32, show_spinner=False)
+def get_berlin_holidays(year):
+    """Feiertagskalender Berlin für ein Jahr (holidays wird erst beim ersten Aufruf importiert, danach je Jahr gecacht)"""
+    import holidays
+    return holidays.Germany(state='BE', years=year)
+
 def is_holiday_berlin(date_obj):
     """Prüft ob ein Datum ein gesetzlicher Feiertag in Berlin ist"""
-    berlin_holidays = holidays.Germany(state='BE', years=date_obj.year)
-    return date_obj in berlin_holidays
+    return date_obj in get_berlin_holidays(date_obj.year)
 
-def count_working_days(start_date, end_date):
-    """Zählt Werktage (Mo-Fr) ohne Feiertage in Berlin im gegebenen Zeitraum"""
-    count = 0
+def describe_unavailability_entry(entry_type, date_str, end_date_str, weekday, rule):
+    """Beschreibung eines Nichtverfügbarkeits-Eintrags für Listen"""
+    if entry_type == "urlaub":
+        if date_str:
+            return f"📅 Urlaub {format_vacation_period(date_str, end_date_str)}"
+        return "📅 Urlaub (Datum fehlt)"
+    if entry_type == "regel":
+        return f"🔁 {describe_unavailability_rule(rule)}"
+    return f"⛔ Nie verfügbar am {weekday}"
+
+def format_vacation_period(start_str, end_str=None):
+    """Formatiert einen Urlaubszeitraum ('am 01.08.2026' bzw. '01.08.2026 - 15.08.2026 (11 Arbeitstage)')"""
+    start_date = datetime.strptime(start_str, '%Y-%m-%d')
+    end_date = datetime.strptime(end_str, '%Y-%m-%d') if end_str else start_date
+    if end_date <= start_date:
+        return f"am {start_date.strftime('%d.%m.%Y')}"
+    return f"{start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')} ({count_working_days(start_date, end_date)} Arbeitstage)"
+
+def get_working_days(start_date, end_date):
+    """Liefert alle Werktage (Mo-Fr) ohne Feiertage in Berlin im gegebenen Zeitraum"""
+    working_days = []
     current_date = start_date
     while current_date <= end_date:
         if current_date.weekday() < 5:  # Montag = 0, Freitag = 4
             if not is_holiday_berlin(current_date):
-                count += 1
+                working_days.append(current_date)
         current_date += timedelta(days=1)
-    return count
+    return working_days
+
+def count_working_days(start_date, end_date):
+    """Zählt Werktage (Mo-Fr) ohne Feiertage in Berlin im gegebenen Zeitraum"""
+    return len(get_working_days(start_date, end_date))
 
 def export_preferences_to_text(team_id):
     """Exportiert die Präferenzen als Text im Format 'Name,1,2,3,4,5' wobei die Zahlen die Prioritäten für Mo-Fr darstellen"""
@@ -2847,73 +5615,533 @@ def export_preferences_to_text(team_id):
     
     return '\n'.join(lines)
 
-def import_preferences_from_text(text_content, team_id, overwrite=False):
-    """Importiert Präferenzen aus Text im Format 'Name,1,2,3,4,5'"""
-    if not text_content.strip():
-        return False, "Leere Datei oder ungültiger Inhalt"
-    
+def parse_preference_line(parts):
+    """Validiert eine Zeile 'Name,1,2,3,4,5' und liefert (Name, preferred_days-String); ValueError bei Fehlern"""
     weekdays = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag']
-    imported_count = 0
-    errors = []
     
-    # Lösche alle bestehenden Präferenzen wenn Überschreiben gewählt
-    if overwrite:
-        conn = sqlite3.connect('schichtplaner.db')
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM preferences WHERE team_id = ?', (team_id,))
-        conn.commit()
-        conn.close()
+    if len(parts) != 6:  # Name + 5 Prioritäten
+        raise ValueError("Falsche Anzahl von Werten (erwartet: Name,1,2,3,4,5)")
     
-    lines = text_content.strip().split('\n')
-    for line_num, line in enumerate(lines, 1):
-        line = line.strip()
-        if not line:
-            continue
-        
-        parts = line.split(',')
-        if len(parts) != 6:  # Name + 5 Prioritäten
-            errors.append(f"Zeile {line_num}: Falsche Anzahl von Werten (erwartet: Name,1,2,3,4,5)")
-            continue
-        
-        name = parts[0].strip()
-        if not name:
-            errors.append(f"Zeile {line_num}: Kein Name angegeben")
-            continue
-        
+    name = parts[0].strip()
+    if not name:
+        raise ValueError("Kein Name angegeben")
+    
+    try:
+        # Parse Prioritäten
+        priorities = [int(p.strip()) for p in parts[1:]]
+    except ValueError:
+        raise ValueError("Ungültige Prioritätswerte (müssen Zahlen 1-5 sein)")
+    
+    # Validiere Prioritäten
+    if not all(1 <= p <= 5 for p in priorities):
+        raise ValueError("Prioritäten müssen zwischen 1 und 5 liegen")
+    if len(set(priorities)) != 5:
+        raise ValueError("Alle Prioritäten 1-5 müssen genau einmal verwendet werden")
+    
+    # Konvertiere Prioritäten zu Wochentag-Liste
+    # priorities[i] = Priorität für weekdays[i]
+    day_priority_pairs = sorted((priorities[i], weekdays[i]) for i in range(5))
+    return name, ','.join(day for _, day in day_priority_pairs)
+
+def parse_import_date(value):
+    """Liest ein Datum im Format YYYY-MM-DD oder DD.MM.YYYY"""
+    value = value.strip()
+    for date_format in ('%Y-%m-%d', '%d.%m.%Y'):
         try:
-            # Parse Prioritäten
-            priorities = [int(p.strip()) for p in parts[1:]]
+            return datetime.strptime(value, date_format).date()
         except ValueError:
-            errors.append(f"Zeile {line_num}: Ungültige Prioritätswerte (müssen Zahlen 1-5 sein)")
             continue
-        
-        # Validiere Prioritäten
-        if not all(1 <= p <= 5 for p in priorities):
-            errors.append(f"Zeile {line_num}: Prioritäten müssen zwischen 1 und 5 liegen")
-            continue
-        
-        if len(set(priorities)) != 5:
-            errors.append(f"Zeile {line_num}: Alle Prioritäten 1-5 müssen genau einmal verwendet werden")
-            continue
-        
-        # Konvertiere Prioritäten zu Wochentag-Liste
-        # priorities[i] = Priorität für weekdays[i]
-        day_priority_pairs = [(priorities[i], weekdays[i]) for i in range(5)]
-        day_priority_pairs.sort()  # Sortiere nach Priorität
-        preferred_days = [day for _, day in day_priority_pairs]
-        
-        # Speichere Präferenz
+    raise ValueError(f"Ungültiges Datum '{value}' (erwartet: JJJJ-MM-TT oder TT.MM.JJJJ)")
+
+def parse_vacation_line(parts):
+    """Validiert eine Zeile 'Name,Von,Bis[,Grund]' und liefert (Name, Von, Bis, Grund); ValueError bei Fehlern"""
+    if len(parts) < 3:
+        raise ValueError("Falsche Anzahl von Werten (erwartet: Name,Von,Bis[,Grund])")
+    
+    name = parts[0].strip()
+    if not name:
+        raise ValueError("Kein Name angegeben")
+    
+    start_date = parse_import_date(parts[1])
+    end_date = parse_import_date(parts[2])
+    if end_date < start_date:
+        raise ValueError("Das Ende liegt vor dem Beginn")
+    
+    reason = ','.join(parts[3:]).strip()  # Grund darf Kommas enthalten
+    return name, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'), reason
+
+def iter_import_lines(stream, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Liest eine Datei blockweise und liefert (Zeilennummer, Zeile, bisher gelesene Bytes).
+    
+    Der Speicherbedarf hängt nur von der Blockgröße ab, nicht von der Dateigröße.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    line_num = 0
+    bytes_read = 0
+    
+    while True:
+        chunk = stream.read(chunk_size)
+        bytes_read += len(chunk)
+        lines = (pending + decoder.decode(chunk, final=not chunk)).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            line_num += 1
+            yield line_num, line.rstrip('\r'), bytes_read
+        if not chunk:
+            break
+    
+    if pending:
+        yield line_num + 1, pending.rstrip('\r'), bytes_read
+
+def format_import_result(imported_count, errors, error_count, unit, all_or_nothing):
+    """Baut das (success, message)-Ergebnis eines Imports (errors: erste Fehlermeldungen, error_count: alle Fehler)"""
+    error_text = "\n".join(errors)
+    if error_count > len(errors):
+        error_text += f"\n... und {error_count - len(errors)} weitere Fehler"
+    
+    if error_count and all_or_nothing:
+        return False, f"Import abgebrochen - es wurde nichts gespeichert. {error_count} Fehler:\n" + error_text
+    if error_count:
+        return imported_count > 0, f"Import abgeschlossen: {imported_count} {unit} importiert, {error_count} Zeilen übersprungen:\n" + error_text
+    return True, f"Erfolgreich {imported_count} {unit} importiert"
+
+def stream_import(stream, kind, team_id, overwrite=False, all_or_nothing=True, expected_version=None, progress=None, total_bytes=None):
+    """
+    Importiert Präferenzen ('preferences': Name,1,2,3,4,5) oder Urlaube ('vacation': Name,Von,Bis[,Grund]) als Stream.
+    
+    Die Datei wird blockweise gelesen, zeilenweise validiert und in Batches fester Größe in eine
+    temporäre Staging-Tabelle der Schreibverbindung geschrieben; doppelte Einträge erkennt SQLite
+    in der Staging-Tabelle, sodass der Speicherbedarf nicht mit der Dateigröße wächst. Erst am Ende
+    werden alle Zeilen in einer Transaktion übernommen (bei Fehlern und all_or_nothing gar nicht).
+    Die Staging-Tabelle wird auf jedem Weg - auch bei Fehlern und Abbruch - wieder gelöscht.
+    
+    Beginnt die Datei mit der Kopfzeile 'Team,Name,...', enthält die erste Spalte den Team-Namen -
+    so kann eine Datei viele Teams befüllen (fehlende Teams werden beim Präferenz-Import angelegt).
+    
+    Args:
+        stream: Binärer Datei-Stream (z.B. Streamlit-Upload)
+        kind: 'preferences' oder 'vacation'
+        team_id: Team für Dateien ohne Team-Spalte
+        expected_version: Nur für Präferenzen - wie bei save_preferences wird die Team-Version geprüft
+            und erhöht; Urlaube erhöhen wie save_unavailability nur den Änderungszähler
+        progress: Optionaler Callback progress(Anteil 0-1, verarbeitete Zeilen)
+        total_bytes: Dateigröße für die Fortschrittsanzeige
+    
+    Returns:
+        Tuple (success, message, neue Version von team_id); die Version ist None, wenn nichts
+        gespeichert wurde oder das Team nicht versioniert betroffen war (Urlaube)
+    """
+    writer = get_database_writer()
+    teams_by_name = {name: existing_id for existing_id, name in get_teams()}
+    default_team_name = next((name for name, existing_id in teams_by_name.items() if existing_id == team_id), None)
+    parse_line = parse_preference_line if kind == 'preferences' else parse_vacation_line
+    staging_columns = ['line_num', 'team_name', 'name', 'preferred_days'] if kind == 'preferences' else ['line_num', 'team_name', 'name', 'date', 'end_date', 'reason']
+    # Schlüssel für doppelte Einträge: Person je Team bzw. identischer Urlaub
+    key_columns = ', '.join(staging_columns[1:3] if kind == 'preferences' else staging_columns[1:])
+    staging = f"import_{uuid.uuid4().hex}"
+    
+    errors = []
+    error_count = 0
+    imported_count = 0
+    team_members = {}   # Team-Name -> Mitarbeiter (nur für den Urlaubs-Import)
+    batch = []
+    has_team_column = None
+    bytes_read = 0
+    
+    def report(line_num, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+            errors.append((line_num, f"Zeile {line_num}: {message}"))
+    
+    def flush():
+        nonlocal imported_count
+        if batch:
+            rows = list(batch)
+            writer.execute(lambda cursor: cursor.executemany(
+                f"INSERT INTO temp.{staging} VALUES ({', '.join('?' * len(staging_columns))})", rows
+            ))
+            imported_count += len(rows)
+            batch.clear()
+        if progress:
+            progress(min(1.0, bytes_read / total_bytes) if total_bytes else 0.0, imported_count + error_count)
+    
+    writer.execute(lambda cursor: cursor.execute(f"CREATE TEMP TABLE {staging} ({', '.join(staging_columns)})"))
+    try:
+        for line_num, line, bytes_read in iter_import_lines(stream):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            
+            # Kopfzeile bestimmt, ob die erste Spalte das Team enthält
+            if has_team_column is None:
+                has_team_column = line.lower().startswith('team,')
+                if has_team_column or line.lower().startswith('name,'):
+                    continue
+            
+            parts = line.split(',')
+            row_team_name = parts.pop(0).strip() if has_team_column else default_team_name
+            try:
+                if not row_team_name:
+                    raise ValueError("Kein Team angegeben")
+                row = parse_line(parts)
+                if kind == 'vacation':
+                    if row_team_name not in team_members:
+                        member_team_id = teams_by_name.get(row_team_name)
+                        team_members[row_team_name] = set(load_preferences(member_team_id)) if member_team_id else None
+                    if team_members[row_team_name] is None:
+                        raise ValueError(f"Unbekanntes Team '{row_team_name}'")
+                    if row[0] not in team_members[row_team_name]:
+                        raise ValueError(f"Unbekannte Person '{row[0]}'")
+            except ValueError as e:
+                report(line_num, e)
+                continue
+            
+            batch.append((line_num, row_team_name) + row)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush()
+        flush()
+        
+        # Doppelte Einträge in der Staging-Tabelle finden und entfernen (der erste Eintrag je Schlüssel zählt)
+        duplicates = f'''
+            SELECT line_num, name, first_line FROM (
+                SELECT line_num, name, MIN(line_num) OVER (PARTITION BY {key_columns}) AS first_line FROM temp.{staging}
+            ) WHERE line_num > first_line
+        '''
+        
+        def remove_duplicates(cursor):
+            cursor.execute(f"SELECT COUNT(*) FROM ({duplicates})")
+            duplicate_count = cursor.fetchone()[0]
+            cursor.execute(f"{duplicates} ORDER BY line_num LIMIT ?", (IMPORT_MAX_REPORTED_ERRORS,))
+            examples = cursor.fetchall()
+            if duplicate_count:
+                cursor.execute(f"DELETE FROM temp.{staging} WHERE line_num IN (SELECT line_num FROM ({duplicates}))")
+            return duplicate_count, examples
+        
+        duplicate_count, examples = writer.execute(remove_duplicates)
+        for line_num, name, first_line in examples:
+            report(line_num, f"Doppelter Eintrag für {name} (bereits in Zeile {first_line})")
+        error_count += duplicate_count - len(examples)
+        imported_count -= duplicate_count
+        errors = [message for _, message in sorted(errors)]
+        
+        unit = "Personen" if kind == 'preferences' else "Urlaube"
+        if error_count and all_or_nothing:
+            return (*format_import_result(0, errors, error_count, unit, all_or_nothing), None)
+        
+        # Übernahme aller Batches in einer Transaktion
+        def merge(cursor):
+            new_version = None
+            cursor.execute(f"SELECT DISTINCT team_name FROM temp.{staging}")
+            affected_teams = [name for (name,) in cursor.fetchall()]
+            if kind == 'preferences':
+                cursor.executemany('INSERT OR IGNORE INTO teams (name) VALUES (?)', [(name,) for name in affected_teams])
+            
+            for name in affected_teams:
+                cursor.execute('SELECT id FROM teams WHERE name = ?', (name,))
+                affected_id = cursor.fetchone()[0]
+                if kind == 'preferences':
+                    affected_version = bump_team_version(cursor, affected_id, expected_version if affected_id == team_id else None)
+                    if affected_id == team_id:
+                        new_version = affected_version
+                    bump_change_counter(cursor, affected_id, 'preferences')
+                    if overwrite:
+                        cursor.execute('DELETE FROM preferences WHERE team_id = ?', (affected_id,))
+                else:
+                    bump_change_counter(cursor, affected_id, 'unavailability')
+                    if overwrite:
+                        cursor.execute("DELETE FROM unavailability WHERE team_id = ? AND type = 'urlaub'", (affected_id,))
+            
+            if kind == 'preferences':
+                cursor.execute(f'''
+                    INSERT OR REPLACE INTO preferences (team_id, name, preferred_days)
+                    SELECT teams.id, staging.name, staging.preferred_days
+                    FROM temp.{staging} AS staging JOIN teams ON teams.name = staging.team_name
+                ''')
+            else:
+                cursor.execute(f'''
+                    INSERT INTO unavailability (team_id, name, type, date, end_date, reason)
+                    SELECT teams.id, staging.name, 'urlaub', staging.date, staging.end_date, staging.reason
+                    FROM temp.{staging} AS staging JOIN teams ON teams.name = staging.team_name
+                ''')
+            return new_version
+        
+        new_version = writer.execute(merge)
+        return (*format_import_result(imported_count, errors, error_count, unit, all_or_nothing), new_version)
+    finally:
+        writer.execute(lambda cursor: cursor.execute(f"DROP TABLE IF EXISTS temp.{staging}"))
+
+def encode_snapshot_schedule(schedule):
+    """Plan als Snapshot-Felder: Start-Datum, Namenstabelle und int16-Indexarray (Base64, little-endian)"""
+    return {
+        'start': date.fromordinal(schedule.start_ordinal).isoformat() if len(schedule.assignments) else None,
+        'names': schedule.names,
+        'assignments': base64.b64encode(schedule.assignments.astype('<i2').tobytes()).decode('ascii')
+    }
+
+def decode_snapshot_schedule(block):
+    """Gegenstück zu encode_snapshot_schedule (prüft die Indizes gegen die Namenstabelle)"""
+    assignments = np.frombuffer(base64.b64decode(block['assignments']), dtype='<i2').astype(np.int16)
+    names = block['names']
+    if not isinstance(names, list) or not all(isinstance(name, str) and name for name in names) or len(set(names)) != len(names):
+        raise ValueError("Ungültiger Plan-Block: Namenstabelle")
+    if len(assignments) and (assignments.max() >= len(names) or assignments.min() < CompactSchedule.NO_SHIFT):
+        raise ValueError("Ungültiger Plan-Block")
+    start_ordinal = date.fromisoformat(block['start']).toordinal() if block['start'] else 0
+    return CompactSchedule(start_ordinal, assignments, names)
+
+def validate_team_snapshot(snapshot):
+    """
+    Prüft die Zeilen eines gelesenen Snapshots, bevor sie in die Datenbank geschrieben werden.
+    
+    Geprüft werden Typen, eindeutige Namen (Präferenzen und Ledger), die Wochentage in
+    preferred_days sowie Art, Daten und Regeln der Nichtverfügbarkeiten.
+    
+    Raises:
+        ValueError: Mit Block und Zeile des ersten ungültigen Eintrags
+    """
+    def is_name(value):
+        return isinstance(value, str) and value.strip() != ""
+    
+    def is_date(value):
         try:
-            save_preferences(name, preferred_days, team_id)
-            imported_count += 1
-        except Exception as e:
-            errors.append(f"Zeile {line_num}: Fehler beim Speichern von {name}: {str(e)}")
-    
-    if errors:
-        error_msg = f"Import abgeschlossen mit {len(errors)} Fehlern:\n" + "\n".join(errors)
-        return imported_count > 0, error_msg
-    else:
-        return True, f"Erfolgreich {imported_count} Personen importiert"
+            date.fromisoformat(value)
+            return True
+        except (TypeError, ValueError):
+            return False
+    
+    def check(condition, block, row_num, message):
+        if not condition:
+            raise ValueError(f"Ungültiger Block '{block}', Zeile {row_num}: {message}")
+    
+    if not is_name(snapshot['team']):
+        raise ValueError("Snapshot enthält keinen Team-Namen")
+    
+    seen_names = set()
+    for row_num, (name, preferred_days) in enumerate(snapshot['preferences'], 1):
+        check(is_name(name), 'preferences', row_num, "Name fehlt")
+        check(name not in seen_names, 'preferences', row_num, f"Doppelter Name '{name}'")
+        seen_names.add(name)
+        days = preferred_days.split(',') if isinstance(preferred_days, str) else None
+        check(days is not None and all(day in WEEKDAY_NAMES for day in days) and len(set(days)) == len(days),
+              'preferences', row_num, f"Ungültige Wunschtage für '{name}'")
+    
+    for row_num, (name, entry_type, start, end, weekday, reason, rule) in enumerate(snapshot['unavailability'], 1):
+        check(is_name(name), 'unavailability', row_num, "Name fehlt")
+        check(reason is None or isinstance(reason, str), 'unavailability', row_num, "Ungültiger Grund")
+        if entry_type == 'urlaub':
+            check(is_date(start) and (end is None or (is_date(end) and end >= start)), 'unavailability', row_num, "Ungültiger Zeitraum")
+        elif entry_type == 'wochentag':
+            check(weekday in WEEKDAY_NAMES, 'unavailability', row_num, f"Ungültiger Wochentag '{weekday}'")
+        elif entry_type == 'regel':
+            try:
+                rule_data = json.loads(rule)
+            except (TypeError, ValueError):
+                rule_data = None
+            check(isinstance(rule_data, dict) and rule_data.get('kind') in UNAVAILABILITY_RULE_KINDS, 'unavailability', row_num, "Ungültige Regel")
+        else:
+            check(False, 'unavailability', row_num, f"Unbekannte Art '{entry_type}'")
+    
+    seen_names = set()
+    for row_num, (name, *counts) in enumerate(snapshot['fairness_ledger'], 1):
+        check(is_name(name), 'fairness_ledger', row_num, "Name fehlt")
+        check(name not in seen_names, 'fairness_ledger', row_num, f"Doppelter Name '{name}'")
+        seen_names.add(name)
+        check(all(isinstance(count, int) and not isinstance(count, bool) for count in counts), 'fairness_ledger', row_num, "Zähler müssen ganze Zahlen sein")
+    
+    for year, archived in snapshot['schedule_archive']:
+        check(all(day.year == year for day, _ in archived.iter_days()), 'schedule_archive', year, "Tage außerhalb des Archivjahres")
+
+def write_team_snapshot(team_id, stream):
+    """
+    Schreibt einen Team-Snapshot (Präferenzen, Nichtverfügbarkeiten inkl. Regeln, Plan, Plan-Archiv, Fairness-Ledger) in einen Binär-Stream.
+    
+    Format: gzip-komprimiertes JSON-Lines. Die erste Zeile ist die Kopfzeile mit Format und
+    Version, danach folgt je Datenbereich ein Block mit spaltenweise abgelegten Werten. Der Plan
+    wird wie im CompactSchedule als Start-Datum, Namenstabelle und int16-Indexarray (Base64,
+    little-endian) gespeichert. Ein abschließender 'end'-Block erkennt abgeschnittene Dateien.
+    Alle Bereiche werden in einer Lesetransaktion gelesen und passen daher zueinander.
+    """
+    conn = sqlite3.connect('schichtplaner.db')
+    cursor = conn.cursor()
+    
+    cursor.execute('BEGIN')
+    cursor.execute('SELECT name, version FROM teams WHERE id = ?', (team_id,))
+    team = cursor.fetchone()
+    if team is None:
+        conn.close()
+        raise ValueError(f"Team {team_id} existiert nicht")
+    
+    cursor.execute('SELECT name, preferred_days FROM preferences WHERE team_id = ? ORDER BY name', (team_id,))
+    preferences = cursor.fetchall()
+    cursor.execute(f"SELECT {', '.join(SNAPSHOT_UNAVAILABILITY_COLUMNS)} FROM unavailability WHERE team_id = ? ORDER BY id", (team_id,))
+    unavailability = cursor.fetchall()
+    cursor.execute('SELECT date, employee_name FROM schedules WHERE team_id = ? ORDER BY date', (team_id,))
+    schedule = CompactSchedule.from_rows(cursor.fetchall())
+    cursor.execute('SELECT year, start_ordinal, names, assignments FROM schedule_archive WHERE team_id = ? ORDER BY year', (team_id,))
+    archive = [(year, CompactSchedule.from_blob(*packed)) for year, *packed in cursor.fetchall()]
+    cursor.execute(f"SELECT {', '.join(SNAPSHOT_LEDGER_COLUMNS)} FROM fairness_ledger WHERE team_id = ? ORDER BY name", (team_id,))
+    ledger = cursor.fetchall()
+    conn.close()
+    
+    def columns(names, rows):
+        return {column: list(values) for column, values in zip(names, zip(*rows))} if rows else {column: [] for column in names}
+    
+    blocks = [
+        {'format': TEAM_SNAPSHOT_FORMAT, 'version': TEAM_SNAPSHOT_VERSION, 'team': team[0],
+         'team_version': team[1], 'exported_at': datetime.now().isoformat(timespec='seconds')},
+        {'block': 'preferences', 'columns': columns(['name', 'preferred_days'], preferences)},
+        {'block': 'unavailability', 'columns': columns(SNAPSHOT_UNAVAILABILITY_COLUMNS, unavailability)},
+        {'block': 'schedule', **encode_snapshot_schedule(schedule)},
+        {'block': 'schedule_archive', 'years': [{'year': year, **encode_snapshot_schedule(archived)} for year, archived in archive]},
+        {'block': 'fairness_ledger', 'columns': columns(SNAPSHOT_LEDGER_COLUMNS, ledger)},
+        {'block': 'end', 'rows': {'preferences': len(preferences), 'unavailability': len(unavailability),
+                                  'schedule': len(schedule), 'schedule_archive': len(archive), 'fairness_ledger': len(ledger)}}
+    ]
+    
+    with gzip.GzipFile(fileobj=stream, mode='wb', compresslevel=6, mtime=0) as output:
+        for block in blocks:
+            output.write(json.dumps(block, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+
+def export_team_snapshot(team_id):
+    """Erstellt einen Team-Snapshot als Bytes (siehe write_team_snapshot)"""
+    buffer = io.BytesIO()
+    write_team_snapshot(team_id, buffer)
+    return buffer.getvalue()
+
+def read_team_snapshot(stream):
+    """
+    Liest einen Team-Snapshot zeilenweise aus einem Binär-Stream und prüft Format, Version und Vollständigkeit.
+    
+    Returns:
+        Dict mit 'team', 'preferences', 'unavailability' und 'fairness_ledger' (Zeilen-Tupel)
+        sowie 'schedule' (CompactSchedule) und 'schedule_archive' ([(Jahr, CompactSchedule)])
+    
+    Raises:
+        ValueError: Wenn die Datei kein gültiger oder ein zu neuer Snapshot ist (siehe validate_team_snapshot)
+    """
+    snapshot = {}
+    header = None
+    
+    def rows(block, names):
+        columns = block.get('columns', {})
+        if set(columns) != set(names) or len({len(values) for values in columns.values()}) > 1:
+            raise ValueError(f"Ungültiger Block '{block.get('block')}'")
+        return list(zip(*(columns[name] for name in names)))
+    
+    try:
+        with gzip.GzipFile(fileobj=stream, mode='rb') as source:
+            for line in source:
+                if not line.strip():
+                    continue
+                block = json.loads(line)
+                if header is None:
+                    header = block
+                    if header.get('format') != TEAM_SNAPSHOT_FORMAT:
+                        raise ValueError("Keine Schichtplaner-Team-Datei")
+                    if not isinstance(header.get('version'), int) or header['version'] > TEAM_SNAPSHOT_VERSION:
+                        raise ValueError(f"Snapshot-Version {header.get('version')} wird nicht unterstützt (maximal {TEAM_SNAPSHOT_VERSION})")
+                    snapshot['team'] = header.get('team')
+                    continue
+                
+                kind = block.get('block')
+                if kind == 'preferences':
+                    snapshot['preferences'] = rows(block, ['name', 'preferred_days'])
+                elif kind == 'unavailability':
+                    snapshot['unavailability'] = rows(block, SNAPSHOT_UNAVAILABILITY_COLUMNS)
+                elif kind == 'fairness_ledger':
+                    snapshot['fairness_ledger'] = rows(block, SNAPSHOT_LEDGER_COLUMNS)
+                elif kind == 'schedule':
+                    snapshot['schedule'] = decode_snapshot_schedule(block)
+                elif kind == 'schedule_archive':
+                    snapshot['schedule_archive'] = [(int(year_block['year']), decode_snapshot_schedule(year_block)) for year_block in block['years']]
+                elif kind == 'end':
+                    snapshot['end'] = block.get('rows', {})
+                # Unbekannte Blöcke (aus neueren Nebenversionen) werden übersprungen
+    except (OSError, EOFError, json.JSONDecodeError, KeyError, TypeError, UnicodeDecodeError, base64.binascii.Error) as e:
+        raise ValueError(f"Snapshot-Datei ist beschädigt: {e}")
+    
+    if header is None:
+        raise ValueError("Leere Datei")
+    missing = [kind for kind in ('preferences', 'unavailability', 'schedule', 'fairness_ledger', 'end') if kind not in snapshot]
+    if missing:
+        raise ValueError(f"Snapshot unvollständig, es fehlen: {', '.join(missing)}")
+    snapshot.setdefault('schedule_archive', [])
+    counts = {kind: len(snapshot[kind]) for kind in ('preferences', 'unavailability', 'schedule', 'schedule_archive', 'fairness_ledger')}
+    if any(snapshot['end'].get(kind, count) != count for kind, count in counts.items()):
+        raise ValueError("Snapshot unvollständig: Zeilenanzahl stimmt nicht mit dem Abschlussblock überein")
+    validate_team_snapshot(snapshot)
+    return snapshot
+
+def restore_team_snapshot(snapshot, team_id=None, expected_version=None, team_name=None):
+    """
+    Stellt ein Team aus einem gelesenen Snapshot in einer Transaktion wieder her.
+    
+    Mit team_id werden alle Daten dieses Teams ersetzt (mit expected_version nur, wenn es seitdem
+    nicht geändert wurde), ohne team_id wird ein neues Team angelegt (team_name oder Name aus dem Snapshot).
+    
+    Returns:
+        Tuple (team_id, neue Team-Version)
+    
+    Raises:
+        ValueError: Wenn das Team bereits existiert oder die Zeilen gegen eine Datenbank-Bedingung verstoßen
+    """
+    schedule_rows = snapshot['schedule'].items()
+    new_team_name = team_name or snapshot['team']
+    
+    def job(cursor):
+        target_id = team_id
+        if target_id is None:
+            try:
+                cursor.execute('INSERT INTO teams (name) VALUES (?)', (new_team_name,))
+            except sqlite3.IntegrityError:
+                raise ValueError(f"Team '{new_team_name}' existiert bereits")
+            target_id = cursor.lastrowid
+        
+        new_version = bump_team_version(cursor, target_id, expected_version)
+        for scope in ('preferences', 'schedule', 'unavailability'):
+            bump_change_counter(cursor, target_id, scope)
+        for table in ('preferences', 'unavailability', 'schedules', 'schedule_archive', 'schedule_versions', 'fairness_ledger'):
+            cursor.execute(f'DELETE FROM {table} WHERE team_id = ?', (target_id,))
+        cursor.execute('UPDATE teams SET schedule_position = 0 WHERE id = ?', (target_id,))
+        
+        cursor.executemany('INSERT INTO preferences (team_id, name, preferred_days) VALUES (?, ?, ?)',
+                           [(target_id, *row) for row in snapshot['preferences']])
+        cursor.executemany(f"INSERT INTO unavailability (team_id, {', '.join(SNAPSHOT_UNAVAILABILITY_COLUMNS)}) VALUES (?{', ?' * len(SNAPSHOT_UNAVAILABILITY_COLUMNS)})",
+                           [(target_id, *row) for row in snapshot['unavailability']])
+        cursor.executemany('INSERT INTO schedules (team_id, date, employee_name) VALUES (?, ?, ?)',
+                           [(target_id, *row) for row in schedule_rows])
+        cursor.executemany('INSERT INTO schedule_archive (team_id, year, start_ordinal, names, assignments, shift_count) VALUES (?, ?, ?, ?, ?, ?)',
+                           [(target_id, year, *archived.to_blob(), len(archived)) for year, archived in snapshot['schedule_archive']])
+        cursor.executemany(f"INSERT INTO fairness_ledger (team_id, {', '.join(SNAPSHOT_LEDGER_COLUMNS)}) VALUES (?{', ?' * len(SNAPSHOT_LEDGER_COLUMNS)})",
+                           [(target_id, *row) for row in snapshot['fairness_ledger']])
+        return target_id, new_version
+    
+    try:
+        return get_database_writer().execute(job)
+    except sqlite3.IntegrityError as e:
+        raise ValueError(f"Snapshot passt nicht zur Datenbank: {e}")
+
+def import_team_snapshot(stream, team_id=None, expected_version=None, team_name=None):
+    """Liest einen Team-Snapshot aus einem Stream und stellt ihn wieder her (siehe restore_team_snapshot).
+    
+    Returns:
+        Tuple (success, message, team_id, neue Team-Version)
+    """
+    try:
+        snapshot = read_team_snapshot(stream)
+        target_id, new_version = restore_team_snapshot(snapshot, team_id, expected_version, team_name)
+    except ValueError as e:
+        return False, str(e), None, None
+    
+    return True, (f"Team '{team_name or snapshot['team']}' wiederhergestellt: {len(snapshot['preferences'])} Personen, "
+                  f"{len(snapshot['unavailability'])} Nichtverfügbarkeiten, {len(snapshot['schedule'])} Schichttage"), target_id, new_version
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    try:
+        main()
+    finally:
+        # Auch bei frühem Rücksprung oder st.rerun() messen
+        record_first_render(initialize_app()) 
\ No newline at end of file
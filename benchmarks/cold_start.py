@@ -0,0 +1,91 @@
+"""
+Benchmark für den Kaltstart des Schichtplaners (Zeit bis zur ersten Anzeige).
+
+Jeder Lauf startet einen frischen Python-Prozess in einem leeren Arbeitsverzeichnis (neue
+Datenbank, leere Caches) und führt app.py einmal über streamlit.testing aus. Gemessen werden:
+
+- Prozess: Interpreter-Start bis zum Ende des ersten Skriptlaufs, inklusive Import von Streamlit
+- Erste Anzeige: erster Skriptlauf inklusive Imports von pandas, numpy usw. (Log der App)
+- Initialisierung: Migrationen und Session-Cleanup (initialize_app, Log der App)
+
+Aufruf:
+    python benchmarks/cold_start.py --runs 5 --output benchmarks/cold_start.jsonl
+
+Mit --output wird je Aufruf eine JSON-Zeile mit den Medianwerten angehängt, sodass sich der
+Kaltstart über mehrere Versionen verfolgen lässt.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+STARTUP_LOG = re.compile(r"Kaltstart: Initialisierung (\d+) ms, erste Anzeige (\d+) ms")
+
+
+def run_child(app_path):
+    """Führt die App einmal aus (im Kindprozess) und gibt die Prozessdauer als JSON aus"""
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    app_test = AppTest.from_file(app_path, default_timeout=120)
+    app_test.run()
+    if app_test.exception:
+        raise SystemExit(f"Fehler im ersten Skriptlauf: {app_test.exception[0].message}")
+    print(json.dumps({'process_ms': (time.perf_counter() - started) * 1000}))
+
+
+def measure_cold_start(app_path):
+    """Misst einen Kaltstart in einem frischen Prozess und Arbeitsverzeichnis"""
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', app_path],
+            cwd=workdir, capture_output=True, text=True, check=False
+        )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or result.stdout.strip())
+
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    startup = STARTUP_LOG.search(result.stderr + result.stdout)
+    if startup is None:
+        raise RuntimeError("Kaltstart-Messwerte fehlen im Log der App")
+    timings['init_ms'] = float(startup.group(1))
+    timings['first_render_ms'] = float(startup.group(2))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Misst die Zeit bis zur ersten Anzeige von app.py")
+    parser.add_argument('--runs', type=int, default=5, help="Anzahl Kaltstarts (Standard: 5)")
+    parser.add_argument('--app', default=APP_PATH, help="Pfad zu app.py")
+    parser.add_argument('--output', help="JSON-Lines-Datei, an die das Ergebnis angehängt wird")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    runs = [measure_cold_start(os.path.abspath(args.app)) for _ in range(args.runs)]
+    summary = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'runs': args.runs,
+    }
+    for key, label in [('process_ms', "Prozess"), ('first_render_ms', "Erste Anzeige"), ('init_ms', "Initialisierung")]:
+        values = [run[key] for run in runs]
+        summary[key] = round(statistics.median(values), 1)
+        print(f"{label:<16} Median {statistics.median(values):8.0f} ms   Min {min(values):8.0f} ms   Max {max(values):8.0f} ms")
+
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(summary) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+Gemeinsame Fixtures: app.py als Modul und eine frische SQLite-Datenbank je Test.
+
+app.py öffnet die Datenbank immer als 'schichtplaner.db' im Arbeitsverzeichnis, daher wechselt
+die Fixture `db` in ein temporäres Verzeichnis und leert die Streamlit-Caches (Loader und Writer).
+"""
+import importlib
+import os
+import sys
+
+import pytest
+import streamlit as st
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app():
+    """app.py als Modul (ohne main() auszuführen; importierbar, damit st.cache_data Pläne pickeln kann)"""
+    return importlib.import_module('app')
+
+
+@pytest.fixture
+def db(app, tmp_path, monkeypatch):
+    """Leere, initialisierte Datenbank im temporären Verzeichnis; liefert die ID des Standard-Teams"""
+    monkeypatch.chdir(tmp_path)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    app.init_database()
+    # Der Writer öffnet seine Verbindung relativ zum Arbeitsverzeichnis: erst nach einem Job ist sie sicher offen
+    app.get_database_writer().execute(lambda cursor: None)
+    yield app.get_team_id_by_name('MSH')
+    st.cache_data.clear()
+    st.cache_resource.clear()
@@ -0,0 +1,104 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+PLAN = {
+    '2026-10-19': 'Anna',
+    '2026-10-20': 'Ben',
+    '2026-10-22': 'Anna',
+    '2026-11-02': 'Cem',
+}
+
+
+def test_dict_round_trip(app):
+    schedule = app.CompactSchedule.from_dict(PLAN)
+
+    assert schedule.to_dict() == PLAN
+    assert schedule == PLAN
+    assert len(schedule) == 4
+    assert schedule.keys() == sorted(PLAN)
+    assert schedule.start_ordinal == date(2026, 10, 19).toordinal()
+    # Tage ohne Schicht sind im Array als NO_SHIFT markiert
+    assert schedule.to_numpy()[2] == app.CompactSchedule.NO_SHIFT
+
+
+def test_blob_round_trip(app):
+    schedule = app.CompactSchedule.from_dict(PLAN)
+
+    restored = app.CompactSchedule.from_blob(*schedule.to_blob())
+
+    assert restored == schedule
+    assert restored.names == schedule.names
+    assert restored.start_ordinal == schedule.start_ordinal
+
+
+def test_empty_round_trip(app):
+    schedule = app.CompactSchedule.from_dict({})
+
+    assert len(schedule) == 0
+    assert schedule.to_dict() == {}
+    assert app.CompactSchedule.from_blob(*schedule.to_blob()) == {}
+
+
+def test_dict_access(app):
+    schedule = app.CompactSchedule.from_dict(PLAN)
+
+    assert schedule['2026-10-19'] == 'Anna'
+    assert schedule[date(2026, 11, 2)] == 'Cem'
+    assert '2026-10-21' not in schedule
+    assert schedule.get('kein Datum') is None
+    with pytest.raises(KeyError):
+        schedule['2026-10-21']
+
+    schedule['2026-10-10'] = 'Dora'
+    schedule['2026-11-05'] = 'Anna'
+    del schedule['2026-10-20']
+
+    assert schedule.to_dict() == {
+        '2026-10-10': 'Dora', '2026-10-19': 'Anna', '2026-10-22': 'Anna', '2026-11-02': 'Cem', '2026-11-05': 'Anna'
+    }
+    with pytest.raises(KeyError):
+        del schedule['2026-10-20']
+
+
+def test_select_and_between(app):
+    schedule = app.CompactSchedule.from_dict(PLAN)
+
+    october = schedule.between(date(2026, 10, 1), date(2026, 10, 31))
+    mondays = schedule.select(schedule.weekdays() == 0)
+
+    assert october.to_dict() == {'2026-10-19': 'Anna', '2026-10-20': 'Ben', '2026-10-22': 'Anna'}
+    assert mondays.to_dict() == {'2026-10-19': 'Anna', '2026-11-02': 'Cem'}
+    # Der Ausgangsplan bleibt unverändert
+    assert schedule == PLAN
+
+
+def test_merge_prefers_later_plan(app):
+    first = app.CompactSchedule.from_dict({'2026-10-19': 'Anna', '2026-10-20': 'Ben'})
+    second = {'2026-10-20': 'Cem', '2026-10-21': 'Dora'}
+
+    merged = app.CompactSchedule.merge(first, second, {})
+
+    assert merged.to_dict() == {'2026-10-19': 'Anna', '2026-10-20': 'Cem', '2026-10-21': 'Dora'}
+    assert app.CompactSchedule.merge() == {}
+
+
+def test_window_and_dataframe(app):
+    schedule = app.CompactSchedule.from_dict(PLAN)
+    start = date(2026, 10, 18).toordinal()
+
+    assert schedule.window(start, start + 4).tolist() == [None, 'Anna', 'Ben', None]
+
+    frame = schedule.to_dataframe()
+    assert frame['employee'].tolist() == ['Anna', 'Ben', 'Anna', 'Cem']
+    assert frame['date'].dt.strftime('%Y-%m-%d').tolist() == sorted(PLAN)
+
+
+def test_from_rows_matches_from_dict(app):
+    rows = sorted(PLAN.items(), reverse=True)
+
+    schedule = app.CompactSchedule.from_rows(rows)
+
+    assert schedule == PLAN
+    assert np.array_equal(schedule.ordinals(), [date.fromisoformat(day).toordinal() for day in sorted(PLAN)])
@@ -0,0 +1,62 @@
+from datetime import date
+
+PREFERENCES = {'Anna': ['Freitag', 'Montag'], 'Ben': ['Montag', 'Freitag'], 'Cem': ['Mittwoch']}
+PLAN = {'2099-03-09': 'Anna', '2099-03-11': 'Cem', '2099-03-13': 'Ben', '2099-03-16': 'Anna'}
+
+
+def test_candidates_rank_available_people_first(app):
+    entries = [('Ben', 'wochentag', None, None, 'Mittwoch', '', None)]
+    index = app.CoverageIndex.build(PREFERENCES, PLAN, entries)
+
+    candidates = index.candidates(date(2099, 3, 11))
+
+    assert candidates == [
+        ('Cem', 0, 1, None),
+        ('Anna', app.RANK_NONE, 2, None),
+        ('Ben', app.RANK_NONE, 1, "Wochentag-Sperre"),
+    ]
+    assert index.candidates(date(2099, 4, 1)) == []
+
+
+def test_vacation_takes_precedence_as_reason(app):
+    entries = [
+        ('Anna', 'urlaub', '2099-03-16', '2099-03-20', None, '', None),
+        ('Anna', 'wochentag', None, None, 'Montag', '', None),
+    ]
+    index = app.CoverageIndex.build(PREFERENCES, PLAN, entries)
+
+    reasons = {name: reason for name, _, _, reason in index.candidates(date(2099, 3, 16))}
+
+    assert reasons == {'Anna': "Urlaub", 'Ben': None, 'Cem': None}
+
+
+def test_swap_partners_improve_both_ranks(app):
+    index = app.CoverageIndex.build(PREFERENCES, PLAN)
+
+    partners = index.swap_partners(date(2099, 3, 9))
+
+    # Anna tauscht ihren Montag (2. Wahl) gegen Bens Freitag (für beide die 1. Wahl)
+    assert partners == [(date(2099, 3, 13), 'Ben', (1, 0), (1, 0))]
+    assert index.swap_partners(date(2099, 3, 10)) == []
+
+
+def test_swap_partners_respect_unavailability_and_min_day(app):
+    plan = {**PLAN, '2099-03-20': 'Ben'}
+    entries = [('Anna', 'urlaub', '2099-03-13', '2099-03-13', None, '', None)]
+    index = app.CoverageIndex.build(PREFERENCES, plan, entries)
+
+    assert [day for day, *_ in index.swap_partners(date(2099, 3, 9))] == [date(2099, 3, 20)]
+    assert index.swap_partners(date(2099, 3, 9), min_day=date(2099, 3, 21)) == []
+
+
+def test_swap_partners_sorted_by_gain_then_distance(app):
+    plan = {'2099-03-09': 'Anna', '2099-03-11': 'Cem', '2099-03-13': 'Ben', '2099-03-27': 'Ben', '2099-03-30': 'Dora'}
+    preferences = {**PREFERENCES, 'Dora': ['Montag']}
+    index = app.CoverageIndex.build(preferences, plan)
+
+    partners = index.swap_partners(date(2099, 3, 9), k=5)
+
+    assert [(day, name) for day, name, *_ in partners] == [
+        (date(2099, 3, 13), 'Ben'), (date(2099, 3, 27), 'Ben'), (date(2099, 3, 30), 'Dora')
+    ]
+    assert len(index.swap_partners(date(2099, 3, 9), k=1)) == 1
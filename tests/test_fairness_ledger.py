@@ -0,0 +1,49 @@
+from datetime import date
+
+PREFERENCES = {'Anna': ['Montag', 'Dienstag'], 'Ben': ['Dienstag']}
+
+
+def save_preferences(app, team_id):
+    for name, days in PREFERENCES.items():
+        app.save_preferences(name, days, team_id)
+
+
+def test_ledger_books_saved_shifts(app, db):
+    save_preferences(app, db)
+
+    app.save_schedule({'2099-03-09': 'Anna', '2099-03-10': 'Ben', '2099-03-11': 'Anna'}, db)
+    ledger = app.load_fairness_ledger(db)
+
+    assert ledger['Anna']['shifts'] == 2
+    assert ledger['Anna']['first'] == 1
+    assert ledger['Anna']['none'] == 1
+    assert ledger['Ben']['shifts'] == 1
+    assert ledger['Ben']['first'] == 1
+
+
+def test_ledger_replaces_future_and_keeps_past_shifts(app, db):
+    save_preferences(app, db)
+    app.save_schedule({'2020-03-09': 'Anna', '2099-03-09': 'Anna', '2099-03-10': 'Anna'}, db)
+
+    # Vergangener Tag fehlt im neuen Plan, ein künftiger wechselt die Person, einer entfällt
+    app.save_schedule({'2099-03-10': 'Ben'}, db)
+    ledger = app.load_fairness_ledger(db)
+
+    assert ledger['Anna']['shifts'] == 1
+    assert ledger['Ben']['shifts'] == 1
+
+
+def test_ledger_deltas_skip_holidays(app):
+    rows = app.fairness_ledger_deltas({}, {'2099-12-25': 'Anna', '2099-03-09': 'Anna'}, PREFERENCES)
+
+    assert rows == [('Anna', 1, 1, 0, 0, 0, 0, 0)]
+
+
+def test_carry_over_does_not_count_stored_future_plan_twice(app):
+    ledger = {'Anna': {'shifts': 5}, 'Ben': {'shifts': 3}}
+    stored = {'2020-03-09': 'Anna', '2099-03-09': 'Anna', '2099-03-10': 'Ben', '2099-12-25': 'Ben'}
+
+    carry_over = app.ledger_carry_over(ledger, stored, date(2099, 3, 1))
+
+    # Künftige Tage des gespeicherten Plans werden neu geplant; Feiertage stehen ohnehin nicht im Ledger
+    assert carry_over == {'Anna': 4, 'Ben': 2}
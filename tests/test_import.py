@@ -0,0 +1,85 @@
+import io
+
+import pytest
+
+
+def run_import(app, text, kind, team_id, **options):
+    return app.stream_import(io.BytesIO(text.encode('utf-8')), kind, team_id, **options)
+
+
+def staging_tables(app):
+    return app.get_database_writer().execute(
+        lambda cursor: cursor.execute("SELECT name FROM sqlite_temp_master WHERE type = 'table'").fetchall()
+    )
+
+
+def test_preferences_import_returns_new_version(app, db):
+    version = app.get_team_version(db)
+
+    success, message, new_version = run_import(app, "Anna,1,2,3,4,5\nBen,5,4,3,2,1\n", 'preferences', db, expected_version=version)
+
+    assert success, message
+    assert new_version == version + 1 == app.get_team_version(db)
+    assert app.load_preferences(db)['Ben'][0] == 'Freitag'
+
+
+def test_duplicates_are_found_in_staging(app, db):
+    text = "Name,1,2,3,4,5\nAnna,1,2,3,4,5\nBen,1,2,3,4,5\nAnna,5,4,3,2,1\n\nAnna,2,1,3,4,5\n"
+
+    success, message, new_version = run_import(app, text, 'preferences', db, all_or_nothing=False)
+
+    assert success
+    assert "Zeile 4: Doppelter Eintrag für Anna (bereits in Zeile 2)" in message
+    assert "Zeile 6: Doppelter Eintrag für Anna (bereits in Zeile 2)" in message
+    assert "2 Personen importiert, 2 Zeilen übersprungen" in message
+    assert app.load_preferences(db)['Anna'][0] == 'Montag'
+    assert new_version == app.get_team_version(db)
+    assert staging_tables(app) == []
+
+
+def test_all_or_nothing_writes_nothing(app, db):
+    version = app.get_team_version(db)
+
+    success, message, new_version = run_import(app, "Anna,1,2,3,4,5\nBen,1,1,3,4,5\n", 'preferences', db, expected_version=version)
+
+    assert not success
+    assert "Zeile 2" in message
+    assert new_version is None
+    assert app.load_preferences(db) == {}
+    assert app.get_team_version(db) == version
+    assert staging_tables(app) == []
+
+
+def test_team_column_fills_several_teams(app, db):
+    text = "Team,Name,1,2,3,4,5\nMSH,Anna,1,2,3,4,5\nNeu,Anna,5,4,3,2,1\n"
+
+    success, message, _ = run_import(app, text, 'preferences', db)
+
+    assert success, message
+    new_team = app.get_team_id_by_name('Neu')
+    assert app.load_preferences(db)['Anna'][0] == 'Montag'
+    assert app.load_preferences(new_team)['Anna'][0] == 'Freitag'
+
+
+def test_vacation_import_checks_people_and_dedups(app, db):
+    app.save_preferences('Anna', ['Montag'], db)
+    text = "Anna,2026-12-21,08.01.2027,Winter\nAnna,2026-12-21,2027-01-08,Winter\nBen,2026-12-21,2026-12-22\n"
+
+    success, message, new_version = run_import(app, text, 'vacation', db, all_or_nothing=False)
+
+    assert success
+    assert new_version is None
+    assert "Zeile 2: Doppelter Eintrag für Anna" in message
+    assert "Zeile 3: Unbekannte Person 'Ben'" in message
+    assert app.load_unavailability(db) == [('Anna', 'urlaub', '2026-12-21', '2027-01-08', None, 'Winter', None)]
+
+
+def test_staging_is_dropped_when_the_merge_fails(app, db):
+    version = app.get_team_version(db)
+    app.save_preferences('Anna', ['Montag'], db)
+
+    with pytest.raises(app.VersionConflictError):
+        run_import(app, "Ben,1,2,3,4,5\n", 'preferences', db, expected_version=version)
+
+    assert staging_tables(app) == []
+    assert 'Ben' not in app.load_preferences(db)
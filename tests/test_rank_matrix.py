@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+WEEK = [date(2026, 10, 19) + timedelta(days=offset) for offset in range(5)]  # Montag bis Freitag
+
+
+def test_preference_ranks_follow_wish_order(app):
+    ranks = app.build_preference_ranks({
+        'Anna': ['Mittwoch', 'Montag', 'Freitag'],
+        'Ben': ['Montag', 'Montag', 'Dienstag'],
+    })
+
+    assert ranks.dtype == np.int8
+    assert ranks.shape == (2, 7)
+    assert ranks[0].tolist() == [1, app.RANK_NONE, 0, app.RANK_NONE, 2, app.RANK_NONE, app.RANK_NONE]
+    # Doppelte Tage zählen nur beim ersten Vorkommen
+    assert ranks[1, :2].tolist() == [0, 2]
+
+
+def test_rank_matrix_masks_unavailable_days(app):
+    preferences = {'Anna': ['Montag', 'Dienstag'], 'Ben': ['Freitag']}
+    entries = [
+        ('Anna', 'urlaub', '2026-10-20', '2026-10-21', None, '', None),
+        ('Ben', 'wochentag', None, None, 'Montag', '', None),
+    ]
+
+    matrix = app.build_rank_matrix(preferences, WEEK, entries)
+
+    unavailable, none = app.RANK_UNAVAILABLE, app.RANK_NONE
+    assert matrix.tolist() == [
+        [0, unavailable, unavailable, none, none],
+        [unavailable, none, none, none, 0],
+    ]
+
+
+def test_rank_matrix_without_unavailability(app):
+    matrix = app.build_rank_matrix({'Anna': ['Freitag']}, WEEK)
+
+    assert matrix.tolist() == [[app.RANK_NONE] * 4 + [0]]
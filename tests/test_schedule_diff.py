@@ -0,0 +1,43 @@
+from datetime import date
+
+OLD = {'2099-03-09': 'Anna', '2099-03-10': 'Ben', '2099-03-11': 'Anna', '2099-03-12': 'Cem'}
+NEW = {'2099-03-09': 'Ben', '2099-03-10': 'Ben', '2099-03-11': 'Anna', '2099-03-13': 'Anna'}
+PREFERENCES = {'Anna': ['Freitag', 'Montag'], 'Ben': ['Montag']}
+
+
+def test_changes_as_triples(app):
+    assert app.schedule_changes(OLD, NEW) == [
+        ('2099-03-09', 'Anna', 'Ben'),
+        ('2099-03-12', 'Cem', None),
+        ('2099-03-13', None, 'Anna'),
+    ]
+    assert app.schedule_changes(OLD, app.CompactSchedule.from_dict(OLD)) == []
+    assert app.schedule_changes({}, {}) == []
+
+
+def test_diff_groups_days_per_person(app):
+    diff = app.diff_schedules(OLD, NEW, PREFERENCES)
+
+    assert list(diff) == ['Anna', 'Ben', 'Cem']
+    assert diff['Anna']['added'] == [date(2099, 3, 13)]
+    assert diff['Anna']['removed'] == [date(2099, 3, 9)]
+    assert diff['Anna']['net'] == 0
+    assert diff['Ben'] == {
+        'added': [date(2099, 3, 9)], 'removed': [], 'net': 1,
+        'wishes': {'first': 1, 'second': 0, 'third': 0, 'fourth': 0, 'fifth': 0, 'none': 0},
+    }
+    assert diff['Cem']['net'] == -1
+
+
+def test_diff_wish_deltas(app):
+    diff = app.diff_schedules(OLD, NEW, PREFERENCES)
+
+    # Anna gibt einen Montag (2. Wahl) ab und übernimmt einen Freitag (1. Wahl)
+    assert diff['Anna']['wishes'] == {'first': 1, 'second': -1, 'third': 0, 'fourth': 0, 'fifth': 0, 'none': 0}
+    # Ohne Präferenzen zählt alles als 'kein Wunsch'
+    assert diff['Cem']['wishes']['none'] == -1
+    assert app.diff_schedules(OLD, NEW)['Anna']['wishes']['none'] == 0
+
+
+def test_diff_of_identical_plans_is_empty(app):
+    assert app.diff_schedules(OLD, dict(OLD), PREFERENCES) == {}
@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+
+import pytest
+
+START = date(2099, 3, 2)
+
+
+def save_versions(app, team_id, count):
+    """Speichert count Versionen (jede ändert einen Tag) und liefert die erwarteten Pläne je Version"""
+    plans = [{}]
+    plan = {}
+    for version_no in range(1, count + 1):
+        plan = dict(plan)
+        day = (START + timedelta(days=version_no % 10)).isoformat()
+        plan[day] = f"P{version_no}"
+        if version_no % 7 == 0:
+            plan.pop((START + timedelta(days=(version_no + 3) % 10)).isoformat(), None)
+        app.save_schedule(plan, team_id, label=f"Stand {version_no}")
+        plans.append(plan)
+    return plans
+
+
+def test_versions_are_deltas_with_checkpoints(app, db):
+    save_versions(app, db, 30)
+
+    position, versions = app.load_schedule_history(db)
+
+    assert position == 30
+    assert [version_no for version_no, *_ in versions] == list(range(30, 0, -1))
+    checkpoints = sorted(version_no for version_no, _, _, _, checkpoint in versions if checkpoint)
+    assert checkpoints == [1, app.SCHEDULE_CHECKPOINT_INTERVAL]
+    assert all(change_count <= 2 for _, _, _, change_count, _ in versions)
+
+
+def test_every_version_is_reconstructed(app, db):
+    plans = save_versions(app, db, 2 * app.SCHEDULE_CHECKPOINT_INTERVAL + 3)
+
+    for version_no, plan in enumerate(plans):
+        assert app.load_schedule_version(db, version_no) == plan, version_no
+
+    with pytest.raises(ValueError):
+        app.load_schedule_version(db, len(plans))
+
+
+def test_undo_redo_and_restore(app, db):
+    plans = save_versions(app, db, 27)
+
+    app.move_schedule_history(db, 24)
+    assert app.load_schedule(db) == plans[24]
+    assert app.load_schedule_history(db)[0] == 24
+
+    app.move_schedule_history(db, 26)
+    assert app.load_schedule(db) == plans[26]
+
+    app.restore_schedule_version(db, 3)
+    position, versions = app.load_schedule_history(db)
+    assert app.load_schedule(db) == plans[3]
+    assert position == 28
+    assert versions[0][2] == "Version 3 wiederhergestellt"
+
+
+def test_saving_after_undo_discards_redo_versions(app, db):
+    plans = save_versions(app, db, 5)
+    app.move_schedule_history(db, 2)
+
+    app.save_schedule({'2099-04-06': 'Neu'}, db)
+    position, versions = app.load_schedule_history(db)
+
+    assert position == 3
+    assert [version_no for version_no, *_ in versions] == [3, 2, 1]
+    assert app.load_schedule_version(db, 2) == plans[2]
+    assert app.load_schedule_version(db, 3) == {'2099-04-06': 'Neu'}
+
+
+def test_archived_years_are_left_out(app, db):
+    app.save_schedule({'2020-03-09': 'Anna', '2099-03-09': 'Ben'}, db)
+    app.save_schedule({'2020-03-09': 'Anna', '2099-03-09': 'Cem'}, db)
+
+    archived_count, new_version = app.archive_schedule_years(db, 2021)
+
+    assert (archived_count, new_version) == (1, app.get_team_version(db))
+    assert app.archive_schedule_years(db, 2021) == (0, None)
+    assert app.load_schedule(db) == {'2099-03-09': 'Cem'}
+    assert app.load_schedule_archive(db) == {'2020-03-09': 'Anna'}
+    assert app.load_schedule_version(db, 1) == {'2099-03-09': 'Ben'}
@@ -0,0 +1,147 @@
+import gzip
+import io
+import json
+import sqlite3
+
+import pytest
+
+
+def fill_team(app, team_id):
+    app.save_preferences('Anna', ['Montag', 'Dienstag'], team_id)
+    app.save_preferences('Ben', ['Freitag'], team_id)
+    app.save_unavailability('Anna', 'urlaub', team_id, date='2099-03-16', end_date='2099-03-20', reason="Urlaub")
+    app.save_unavailability('Ben', 'wochentag', team_id, weekday='Montag')
+    app.save_unavailability('Ben', 'regel', team_id, rule={'kind': 'nth_weekday_of_month', 'weekday': 'Dienstag', 'nth': 1})
+    app.save_schedule({'2020-03-09': 'Anna', '2020-03-13': 'Ben', '2099-03-09': 'Anna', '2099-03-13': 'Ben'}, team_id)
+    app.archive_schedule_years(team_id, 2021)
+
+
+def table_rows(team_id):
+    conn = sqlite3.connect('schichtplaner.db')
+    rows = {
+        'preferences': conn.execute('SELECT name, preferred_days FROM preferences WHERE team_id = ? ORDER BY name', (team_id,)).fetchall(),
+        'unavailability': conn.execute('SELECT name, type, date, end_date, weekday, reason, rule FROM unavailability WHERE team_id = ? ORDER BY id', (team_id,)).fetchall(),
+        'schedules': conn.execute('SELECT date, employee_name FROM schedules WHERE team_id = ? ORDER BY date', (team_id,)).fetchall(),
+        'schedule_archive': conn.execute('SELECT year, start_ordinal, names, assignments, shift_count FROM schedule_archive WHERE team_id = ? ORDER BY year', (team_id,)).fetchall(),
+        'fairness_ledger': conn.execute('SELECT name, shifts, wish_first, wish_none FROM fairness_ledger WHERE team_id = ? ORDER BY name', (team_id,)).fetchall(),
+    }
+    conn.close()
+    return rows
+
+
+def read_blocks(data):
+    return [json.loads(line) for line in gzip.decompress(data).splitlines()]
+
+
+def write_blocks(blocks):
+    return gzip.compress(b''.join(json.dumps(block).encode('utf-8') + b'\n' for block in blocks))
+
+
+def changed_snapshot(data, block_name, change):
+    blocks = read_blocks(data)
+    change(next(block for block in blocks if block.get('block') == block_name))
+    return write_blocks(blocks)
+
+
+def test_round_trip_into_new_team(app, db):
+    fill_team(app, db)
+    data = app.export_team_snapshot(db)
+
+    success, message, new_team, new_version = app.import_team_snapshot(io.BytesIO(data), team_name='Kopie')
+
+    assert success, message
+    assert new_version == app.get_team_version(new_team)
+    assert app.get_team_id_by_name('Kopie') == new_team
+    assert table_rows(new_team) == table_rows(db)
+    assert table_rows(db)['schedule_archive'][0][0] == 2020
+    assert app.load_schedule_archive(new_team) == {'2020-03-09': 'Anna', '2020-03-13': 'Ben'}
+
+
+def test_format_is_versioned_json_lines(app, db):
+    fill_team(app, db)
+
+    blocks = read_blocks(app.export_team_snapshot(db))
+
+    assert blocks[0]['format'] == app.TEAM_SNAPSHOT_FORMAT
+    assert blocks[0]['version'] == app.TEAM_SNAPSHOT_VERSION
+    assert [block.get('block') for block in blocks[1:]] == [
+        'preferences', 'unavailability', 'schedule', 'schedule_archive', 'fairness_ledger', 'end'
+    ]
+    schedule = blocks[3]
+    assert schedule['start'] == '2099-03-09'
+    assert sorted(schedule['names']) == ['Anna', 'Ben']
+    assert blocks[-1]['rows']['schedule'] == 2
+
+
+def test_restore_replaces_current_team(app, db):
+    fill_team(app, db)
+    data = app.export_team_snapshot(db)
+    expected_rows = table_rows(db)
+    app.save_preferences('Cem', ['Mittwoch'], db)
+    app.save_schedule({'2099-04-06': 'Cem'}, db)
+    version = app.get_team_version(db)
+
+    success, message, team_id, new_version = app.import_team_snapshot(io.BytesIO(data), db, version)
+
+    assert success, message
+    assert (team_id, new_version) == (db, version + 1)
+    assert table_rows(db) == expected_rows
+    assert app.load_schedule_history(db) == (0, [])
+
+
+def test_restore_checks_team_version(app, db):
+    fill_team(app, db)
+    data = app.export_team_snapshot(db)
+    version = app.get_team_version(db)
+    app.save_preferences('Cem', ['Mittwoch'], db)
+
+    with pytest.raises(app.VersionConflictError):
+        app.import_team_snapshot(io.BytesIO(data), db, version)
+    assert 'Cem' in app.load_preferences(db)
+
+
+def test_existing_team_name_is_rejected(app, db):
+    data = app.export_team_snapshot(db)
+
+    success, message, team_id, new_version = app.import_team_snapshot(io.BytesIO(data))
+
+    assert not success
+    assert "existiert bereits" in message
+    assert (team_id, new_version) == (None, None)
+
+
+@pytest.mark.parametrize('block_name, change, expected', [
+    ('preferences', lambda block: block['columns']['name'].__setitem__(1, 'Anna'), "Doppelter Name 'Anna'"),
+    ('preferences', lambda block: block['columns']['preferred_days'].__setitem__(0, 'Montag,Sonntag'), "Ungültige Wunschtage"),
+    ('unavailability', lambda block: block['columns']['type'].__setitem__(0, 'krank'), "Unbekannte Art 'krank'"),
+    ('unavailability', lambda block: block['columns']['end_date'].__setitem__(0, '2099-03-01'), "Ungültiger Zeitraum"),
+    ('unavailability', lambda block: block['columns']['weekday'].__setitem__(1, 'Sonntag'), "Ungültiger Wochentag"),
+    ('unavailability', lambda block: block['columns']['rule'].__setitem__(2, '{"kind": "jeden_tag"}'), "Ungültige Regel"),
+    ('fairness_ledger', lambda block: block['columns']['shifts'].__setitem__(0, '3'), "ganze Zahlen"),
+    ('schedule', lambda block: block.__setitem__('names', ['Anna', 'Anna']), "Namenstabelle"),
+])
+def test_invalid_rows_are_rejected(app, db, block_name, change, expected):
+    fill_team(app, db)
+    data = changed_snapshot(app.export_team_snapshot(db), block_name, change)
+
+    success, message, _, _ = app.import_team_snapshot(io.BytesIO(data), team_name='Kopie')
+
+    assert not success
+    assert expected in message
+    assert app.get_team_id_by_name('Kopie') is None
+
+
+def test_truncated_and_foreign_files_are_rejected(app, db):
+    fill_team(app, db)
+    blocks = read_blocks(app.export_team_snapshot(db))
+    newer = [{**blocks[0], 'version': app.TEAM_SNAPSHOT_VERSION + 1}] + blocks[1:]
+
+    for data, expected in [
+        (write_blocks(blocks[:-1]), "unvollständig"),
+        (app.export_team_snapshot(db)[:-20], "beschädigt"),
+        (write_blocks(newer), "wird nicht unterstützt"),
+        (write_blocks([{'format': 'anderes'}]), "Keine Schichtplaner-Team-Datei"),
+        (b"Name,1,2,3,4,5\n", "beschädigt"),
+    ]:
+        with pytest.raises(ValueError, match=expected):
+            app.read_team_snapshot(io.BytesIO(data))
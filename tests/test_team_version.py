@@ -0,0 +1,37 @@
+import pytest
+
+
+def test_writes_return_the_new_version(app, db):
+    version = app.get_team_version(db)
+
+    new_version = app.save_preferences('Anna', ['Montag'], db, expected_version=version)
+
+    assert new_version == version + 1
+    assert app.get_team_version(db) == new_version
+
+
+def test_stale_version_raises_and_writes_nothing(app, db):
+    version = app.get_team_version(db)
+    app.save_preferences('Anna', ['Montag'], db, expected_version=version)
+
+    with pytest.raises(app.VersionConflictError) as conflict:
+        app.save_preferences('Anna', ['Freitag'], db, expected_version=version)
+    with pytest.raises(app.VersionConflictError):
+        app.save_schedule({'2099-03-09': 'Anna'}, db, expected_version=version)
+
+    assert conflict.value.expected_version == version
+    assert conflict.value.current_version == version + 1
+    assert app.load_preferences(db) == {'Anna': ['Montag']}
+    assert app.load_schedule(db) == {}
+
+
+def test_failed_job_does_not_affect_other_writes(app, db):
+    version = app.get_team_version(db)
+    writer = app.get_database_writer()
+
+    stale = writer.submit(lambda cursor: app.bump_team_version(cursor, db, version - 1))
+    fresh = writer.submit(lambda cursor: app.bump_team_version(cursor, db, version))
+
+    with pytest.raises(app.VersionConflictError):
+        stale.result()
+    assert fresh.result() == version + 1
@@ -0,0 +1,57 @@
+def fill(app, team_id):
+    for name in ('Cem', 'Anna', 'Ben'):
+        app.save_unavailability(name, 'wochentag', team_id, weekday='Freitag')
+        for day in ('2026-11-02', '2026-10-19', '2026-10-19'):
+            app.save_unavailability(name, 'urlaub', team_id, date=day)
+
+
+def read_pages(app, team_id, limit):
+    pages = []
+    after = None
+    while True:
+        page = app.list_unavailability(team_id, after, limit)
+        if not page:
+            return pages
+        pages.append(page)
+        entry_id, name, _, date_str, *_ = page[-1]
+        after = (name, date_str, entry_id)
+
+
+def test_pages_cover_all_entries_in_order(app, db):
+    fill(app, db)
+    other_team = app.create_team('Andere')
+    app.save_unavailability('Anna', 'urlaub', other_team, date='2026-10-20')
+
+    pages = read_pages(app, db, limit=5)
+    entries = [entry for page in pages for entry in page]
+
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert len(entries) == app.count_unavailability(db) == 12
+    assert len({entry[0] for entry in entries}) == 12
+    # Sortiert nach Name, Datum (Wochentag-Sperren ohne Datum zuerst) und ID
+    keys = [(name, date_str or '', entry_id) for entry_id, name, _, date_str, *_ in entries]
+    assert keys == sorted(keys)
+    assert [entry[1] for entry in entries[:4]] == ['Anna'] * 4
+    assert entries[0][2] == 'wochentag'
+
+
+def test_next_page_is_stable_after_deletes(app, db):
+    fill(app, db)
+    first_page = app.list_unavailability(db, None, 4)
+    last_id, name, _, date_str, *_ = first_page[-1]
+
+    # Einträge der aktuellen Seite löschen verschiebt die Folgeseite nicht
+    assert app.delete_unavailability_entries([entry[0] for entry in first_page], db) == 4
+    next_page = app.list_unavailability(db, (name, date_str, last_id), 4)
+
+    assert next_page == app.list_unavailability(db, None, 4)
+    assert [entry[1] for entry in next_page] == ['Ben'] * 4
+
+
+def test_delete_ignores_other_teams(app, db):
+    other_team = app.create_team('Andere')
+    app.save_unavailability('Anna', 'urlaub', other_team, date='2026-10-20')
+    entry_id = app.list_unavailability(other_team)[0][0]
+
+    assert app.delete_unavailability_entries([entry_id], db) == 0
+    assert app.count_unavailability(other_team) == 1
@@ -0,0 +1,52 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+
+def blocked_days(app, rule, start, end):
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    blocked = app.evaluate_unavailability_rule(rule, [day.toordinal() for day in days])
+    return [day for day, is_blocked in zip(days, blocked) if is_blocked]
+
+
+def test_every_nth_week_starts_at_anchor(app):
+    rule = {'kind': 'every_nth_week', 'weekday': 'Montag', 'interval': 2, 'anchor': '2026-10-14'}
+
+    days = blocked_days(app, rule, date(2026, 10, 1), date(2026, 11, 30))
+
+    # Erster Montag ab dem Startdatum ist der 19.10., danach jede zweite Woche
+    assert days == [date(2026, 10, 19), date(2026, 11, 2), date(2026, 11, 16), date(2026, 11, 30)]
+
+
+def test_nth_weekday_of_month(app):
+    second_tuesday = {'kind': 'nth_weekday_of_month', 'weekday': 'Dienstag', 'nth': 2}
+    last_friday = {'kind': 'nth_weekday_of_month', 'weekday': 'Freitag', 'nth': -1}
+
+    assert blocked_days(app, second_tuesday, date(2026, 10, 1), date(2026, 11, 30)) == [date(2026, 10, 13), date(2026, 11, 10)]
+    assert blocked_days(app, last_friday, date(2026, 10, 1), date(2026, 11, 30)) == [date(2026, 10, 30), date(2026, 11, 27)]
+
+
+def test_weekdays_in_range(app):
+    rule = {'kind': 'weekdays_in_range', 'weekdays': ['Montag', 'Freitag'], 'start': '2026-10-20', 'end': '2026-10-30'}
+
+    days = blocked_days(app, rule, date(2026, 10, 1), date(2026, 11, 30))
+
+    assert days == [date(2026, 10, 23), date(2026, 10, 26), date(2026, 10, 30)]
+
+
+def test_invalid_rules_block_nothing(app):
+    days = np.arange(date(2026, 10, 19).toordinal(), date(2026, 10, 26).toordinal())
+
+    for rule in ({'kind': 'unbekannt'}, {'kind': 'every_nth_week', 'weekday': 'Montag'},
+                 {'kind': 'nth_weekday_of_month', 'weekday': 'Sonntag', 'nth': 1}, {}):
+        assert not app.evaluate_unavailability_rule(rule, days).any()
+
+
+def test_saved_rule_masks_rank_matrix(app, db):
+    app.save_preferences('Anna', ['Montag', 'Dienstag'], db)
+    app.save_unavailability('Anna', 'regel', db, rule={'kind': 'nth_weekday_of_month', 'weekday': 'Montag', 'nth': 3})
+    days = [date(2026, 10, 12), date(2026, 10, 19), date(2026, 10, 20)]
+
+    matrix = app.build_rank_matrix(app.load_preferences(db), days, app.load_unavailability(db))
+
+    assert matrix.tolist() == [[0, app.RANK_UNAVAILABLE, 1]]
@@ -0,0 +1,65 @@
+from datetime import date
+
+import numpy as np
+
+
+def ordinal(day):
+    return date.fromisoformat(day).toordinal()
+
+
+def vacation(name, start, end=None):
+    return (name, 'urlaub', start, end, None, '', None)
+
+
+def test_intervals_are_merged(app):
+    index = app.VacationIndex.from_entries([
+        vacation('Anna', '2026-10-19', '2026-10-21'),
+        vacation('Anna', '2026-10-22', '2026-10-23'),   # schließt direkt an
+        vacation('Anna', '2026-10-20', '2026-10-20'),   # liegt innerhalb
+        vacation('Anna', '2026-11-02'),                 # einzelner Tag ohne Ende
+        ('Anna', 'wochentag', None, None, 'Montag', '', None),
+    ])
+
+    assert index.intervals('Anna') == [
+        (date(2026, 10, 19), date(2026, 10, 23)),
+        (date(2026, 11, 2), date(2026, 11, 2)),
+    ]
+    assert index.intervals('Ben') == []
+
+
+def test_overlap_queries(app):
+    index = app.VacationIndex.from_entries([
+        vacation('Anna', '2026-10-19', '2026-10-23'),
+        vacation('Ben', '2026-10-26', '2026-10-30'),
+        vacation('Cem', '2026-10-23'),
+    ])
+
+    assert index.overlaps('Anna', ordinal('2026-10-23'), ordinal('2026-10-26'))
+    assert not index.overlaps('Anna', ordinal('2026-10-24'), ordinal('2026-10-25'))
+    assert not index.overlaps('Dora', ordinal('2026-10-19'), ordinal('2026-10-30'))
+    assert index.absent_between(date(2026, 10, 23), date(2026, 10, 26)) == ['Anna', 'Ben', 'Cem']
+    assert index.absent_between(date(2026, 10, 24), date(2026, 10, 25)) == []
+    assert index.absent_between(date(2026, 10, 31), date(2026, 10, 31)) == []
+
+
+def test_mask_accepts_unsorted_days(app):
+    index = app.VacationIndex.from_entries([vacation('Anna', '2026-10-20', '2026-10-21')])
+    days = [ordinal(day) for day in ('2026-10-22', '2026-10-19', '2026-10-21', '2026-10-20')]
+
+    mask = index.mask(['Ben', 'Anna'], days)
+
+    assert mask.tolist() == [[False] * 4, [False, False, True, True]]
+    assert np.array_equal(mask, index.mask(['Ben', 'Anna'], np.array(days)))
+
+
+def test_saved_ranges_build_the_index(app, db):
+    app.save_unavailability('Anna', 'urlaub', db, date='2026-12-21', end_date='2027-01-08', reason="Winter")
+    app.save_unavailability('Ben', 'urlaub', db, date='2026-12-24')
+
+    index = app.load_vacation_index(db)
+
+    # Ein Zeitraum ist eine Zeile; ohne Ende wird der Einzeltag gespeichert
+    assert len(app.load_unavailability(db)) == 2
+    assert index.intervals('Anna') == [(date(2026, 12, 21), date(2027, 1, 8))]
+    assert index.absent_between(date(2027, 1, 1), date(2027, 1, 1)) == ['Anna']
+    assert index.absent_between(date(2026, 12, 24), date(2026, 12, 24)) == ['Anna', 'Ben']